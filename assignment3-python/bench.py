@@ -0,0 +1,240 @@
+from __future__ import annotations
+
+import argparse
+import json
+import platform
+import random
+import sys
+import time
+from dataclasses import dataclass
+from random import SystemRandom
+from typing import Dict, List, Tuple
+
+import numpy as np
+
+from bgw import (BGW, AddWire, Client, ConstMultWire, InnerProductWire, InputWire, MatMultWire, MultWire, TTP,
+                 TripleProducer, Wire)
+from cli import parse_mod
+
+
+@dataclass
+class BenchConfig:
+    """The settings of one benchmark run."""
+
+    width: int
+    """The number of wires per layer."""
+
+    depth: int
+    """The multiplicative depth of the circuit, i.e. the number of rounds."""
+
+    mult_ratio: float
+    """The fraction of the wires of each layer that are [MultWire]s, the rest are split evenly between [AddWire]s and
+    [ConstMultWire]s."""
+
+    client_count: int
+    """The number of clients."""
+
+    mod: int
+    """The modulo that the circuit is computed under."""
+
+    seed: int = 0
+    """The seed of the circuit generator, so that every version benchmarks the same circuit."""
+
+    def name(self) -> str:
+        """Returns a short name that identifies this configuration across versions."""
+
+        return f"w{self.width}-d{self.depth}-m{self.mult_ratio:g}-c{self.client_count}-p{self.mod}-s{self.seed}"
+
+
+def layered_circuit(width: int, depth: int, mult_ratio: float, client_count: int, seed: int = 0) \
+        -> Tuple[List[Wire], List[Dict[int, int]]]:
+    """Generates a random layered arithmetic circuit and inputs for it. The circuit starts with [width] inputs, owned by
+    the [client_count] clients in turn, followed by [depth] layers of [width] wires whose operands come from the
+    previous layer. The first wire of every layer is a [MultWire] on the first wire of the previous layer, so the
+    multiplicative depth is exactly [depth]; every other wire is a [MultWire] with probability [mult_ratio] and an
+    [AddWire] or [ConstMultWire] otherwise. The last layer is the output. Returns the circuit and the inputs of every
+    client."""
+
+    rng = random.Random(seed)
+    circuit = [InputWire(is_output=False, owner_id=i % client_count) for i in range(width)]
+    inputs = [{} for _ in range(client_count)]
+
+    for wire_index in range(width):
+        inputs[wire_index % client_count][wire_index] = rng.randrange(1 << 16)
+
+    previous = list(range(width))
+
+    for layer_index in range(depth):
+        is_output = layer_index == depth - 1
+        layer = []
+
+        for position in range(width):
+            a = previous[0] if position == 0 else rng.choice(previous)
+            b = rng.choice(previous)
+
+            if position == 0 or rng.random() < mult_ratio:
+                circuit.append(MultWire(is_output=is_output, wire_a_id=a, wire_b_id=b))
+            elif rng.random() < 0.5:
+                circuit.append(AddWire(is_output=is_output, wire_a_id=a, wire_b_id=b))
+            else:
+                circuit.append(ConstMultWire(is_output=is_output, c=rng.randrange(-8, 9), wire_a_id=a))
+
+            layer.append(len(circuit) - 1)
+
+        previous = layer
+
+    return circuit, inputs
+
+
+def evaluate_plain(circuit: List[Wire], inputs: List[Dict[int, int]], mod: int) -> Dict[int, int]:
+    """Evaluates the [circuit] on the [inputs] of all clients in the clear, to check the outputs of a run."""
+
+    values = {}
+    for client_inputs in inputs:
+        values.update({wire_id: value % mod for wire_id, value in client_inputs.items()})
+
+    for wire_index, wire in enumerate(circuit):
+        if type(wire) == AddWire:
+            values[wire_index] = (values[wire.wire_a_id] + values[wire.wire_b_id]) % mod
+        elif type(wire) == ConstMultWire:
+            values[wire_index] = wire.c * values[wire.wire_a_id] % mod
+        elif type(wire) == MultWire:
+            values[wire_index] = values[wire.wire_a_id] * values[wire.wire_b_id] % mod
+        elif type(wire) == InnerProductWire:
+            values[wire_index] = sum(values[a] * values[b] for a, b in zip(wire.wire_a_ids, wire.wire_b_ids)) % mod
+        elif type(wire) == MatMultWire:
+            columns = len(wire.wire_b_ids) // wire.inner
+            values[wire_index] = sum(values[wire.wire_a_ids[wire.row * wire.inner + j]] *
+                                     values[wire.wire_b_ids[j * columns + wire.column]] for j in range(wire.inner)) % mod
+
+    return {wire_index: values[wire_index] for wire_index, wire in enumerate(circuit) if wire.is_output}
+
+
+def run_benchmark(config: BenchConfig, repeat: int = 1, check: bool = False, free_shares: bool = False,
+                  producer_depth: int | None = None, king_party: bool = False) -> dict:
+    """Runs [BGW.run_circuit] on the circuit of [config] [repeat] times and returns the results of the fastest run,
+    with the end-to-end time, the time per phase, the message statistics and the number of shares that a client
+    stores. [free_shares] and [king_party] are passed on to the [Client]s. If [producer_depth] is given, the triples
+    are generated by a [TripleProducer] with that queue depth during the run, and the results include how long the
+    clients waited."""
+
+    circuit, inputs = layered_circuit(config.width, config.depth, config.mult_ratio, config.client_count, config.seed)
+    compiled = BGW.compile_circuit(circuit)
+    best = None
+
+    for _ in range(repeat):
+        rng = SystemRandom()
+        ttp = TTP(config.client_count, config.mod, rng)
+        if producer_depth is not None:
+            ttp = TripleProducer(ttp, producer_depth)
+        clients = [Client(client_id, ttp, compiled, inputs[client_id], config.mod, rng,
+                          free_shares=free_shares, king_party=king_party)
+                   for client_id in range(config.client_count)]
+
+        start = time.perf_counter()
+        outputs, metrics = BGW.run_circuit(clients, return_metrics=True)
+        seconds = time.perf_counter() - start
+
+        if check and outputs != evaluate_plain(circuit, inputs, config.mod):
+            raise AssertionError(f"{config.name()} computed wrong outputs.")
+
+        if best is None or seconds < best["seconds"]:
+            best = {"seconds": seconds, "share_slots": clients[0].slot_count, **metrics.as_dict()}
+
+    stats = BGW.circuit_stats(circuit)
+
+    return {
+        "name": config.name(),
+        "config": {"width": config.width, "depth": config.depth, "mult_ratio": config.mult_ratio,
+                   "client_count": config.client_count, "mod": str(config.mod), "seed": config.seed},
+        "circuit": {"wires": stats.wires, "mults": stats.mults, "depth": stats.depth},
+        **best,
+    }
+
+
+def compare(results: List[dict], baseline: List[dict], tolerance: float) -> List[str]:
+    """Returns a description of every result that is more than [tolerance] (e.g. `0.2` for 20%) slower than the result
+    with the same name in [baseline]."""
+
+    baseline_seconds = {result["name"]: result["seconds"] for result in baseline}
+    regressions = []
+
+    for result in results:
+        before = baseline_seconds.get(result["name"])
+        if before is not None and result["seconds"] > before * (1 + tolerance):
+            regressions.append(f"{result['name']}: {before:.4f}s -> {result['seconds']:.4f}s "
+                               f"({result['seconds'] / before - 1:+.0%})")
+
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmarks BGW.run_circuit on random layered circuits. Every "
+                                                 "combination of the given settings is run once.")
+    parser.add_argument("--width", type=int, nargs="+", default=[256], help="wires per layer")
+    parser.add_argument("--depth", type=int, nargs="+", default=[16], help="multiplicative depth")
+    parser.add_argument("--mult-ratio", type=float, nargs="+", default=[0.5], help="fraction of MultWires per layer")
+    parser.add_argument("--clients", type=int, nargs="+", default=[3], help="number of clients (3 to 64)")
+    parser.add_argument("--mod", type=parse_mod, nargs="+", default=[parse_mod("2^61-1"), 1 << 64, 1009],
+                        help="moduli, as integers or as 2^k, 2^k-c or 2^k+c")
+    parser.add_argument("--seed", type=int, default=0, help="seed of the circuit generator")
+    parser.add_argument("--repeat", type=int, default=3, help="runs per configuration, the fastest one is reported")
+    parser.add_argument("--check", action="store_true", help="check the outputs against a plaintext evaluation")
+    parser.add_argument("--free-shares", action="store_true", help="reuse the storage of shares that are no longer "
+                                                                     "needed")
+    parser.add_argument("--producer-depth", type=int, help="generate the triples in the background, at most this many "
+                                                            "chunks ahead of the clients")
+    parser.add_argument("--king-party", action="store_true", help="open masked shares through a rotating king party "
+                                                                  "instead of having every client open them")
+    parser.add_argument("--output", help="write the results as JSON to this file")
+    parser.add_argument("--baseline", help="JSON file of an earlier run to compare against")
+    parser.add_argument("--tolerance", type=float, default=0.2, help="slowdown relative to --baseline to report")
+    args = parser.parse_args()
+
+    for client_count in args.clients:
+        if not 3 <= client_count <= 64:
+            parser.error(f"--clients must be between 3 and 64, not {client_count}")
+
+    results = []
+
+    for width in args.width:
+        for depth in args.depth:
+            for mult_ratio in args.mult_ratio:
+                for client_count in args.clients:
+                    for mod in args.mod:
+                        config = BenchConfig(width, depth, mult_ratio, client_count, mod, args.seed)
+                        result = run_benchmark(config, args.repeat, args.check, args.free_shares,
+                                               args.producer_depth, args.king_party)
+                        results.append(result)
+
+                        phases = " ".join(f"{phase}={seconds:.4f}s" for phase, seconds in result["phases"].items())
+                        stalls = "".join(f", {resource} stall={seconds:.4f}s"
+                                         for resource, seconds in result["stalls"].items())
+                        print(f"{result['name']}: {result['seconds']:.4f}s ({phases}, "
+                              f"{result['share_slots']} share slots{stalls})")
+
+    report = {
+        "created": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "python": platform.python_version(),
+        "numpy": np.__version__,
+        "machine": platform.machine(),
+        "results": results,
+    }
+
+    if args.output:
+        with open(args.output, "w") as file:
+            json.dump(report, file, indent=2)
+
+    if args.baseline:
+        with open(args.baseline) as file:
+            regressions = compare(results, json.load(file)["results"], args.tolerance)
+
+        for regression in regressions:
+            print("regression:", regression)
+
+        if regressions:
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,16 +1,23 @@
 from __future__ import annotations
 
+import heapq
+import mmap
+import os
+import queue
+import struct
+import sys
+import threading
+import time
 from abc import ABC # abstract base classes
-from dataclasses import dataclass
-from random import SystemRandom
-from typing import Dict, List
+from array import array
+from dataclasses import dataclass, field
+from random import Random, SystemRandom
+from typing import Dict, List, Tuple
 
-from cryptography.fernet import Fernet
-key = Fernet.generate_key()
-f = Fernet(key)
-token = f.encrypt(b"my deep dark secret")
-# print(token) # b'...'
-# print(f.decrypt(token)) # b'my deep dark secret'
+import numpy as np
+
+from bristol import GATE_AND, GATE_EQ, GATE_EQW, GATE_INV, GATE_OR, GATE_XOR, BristolCircuit, encode_inputs
+from metrics import RunMetrics
 
 # assignments values
 COUNT_TTP_get_beaver_triple = 0
@@ -19,8 +26,28 @@ COUNT_BGW_recover_secret = 0
 COUNT_BGW_add = 0
 COUNT_BGW_const_mult = 0
 COUNT_BGW_mult = 0
+COUNT_BGW_rounds = 0
 MESSAGES_SENT_BGW = 0
 
+# opcodes of a [CompiledCircuit]
+OP_INPUT = 0
+OP_ADD = 1
+OP_CONST_MULT = 2
+OP_MULT = 3
+OP_INNER_PRODUCT = 4
+OP_MATRIX_MULT = 5
+
+# layout of the files written by [TTP.save_triples]: magic, dtype the shares are stored in (`uint64` for shares that are
+# Python ints), client ID, client count, modulo (0 for 2^64), triple count, batch size (0 if not in batch mode)
+TRIPLE_FILE_MAGIC = b"BGWT"
+TRIPLE_FILE_HEADER = struct.Struct("<4scxxxIIQQQ")
+
+# layout of the files written by [BGW.save_circuit]: magic, bytes per constant, wire count, constant count, inner
+# product pair count, matrix product count, matrix wire count. The header is followed by the opcodes, the A operands,
+# the B operands, the output bitmap, the A and B wires of the inner product pairs, the matrix products and their wires
+# and the constants, each padded to 8 bytes
+CIRCUIT_FILE_MAGIC = b"BGWC"
+CIRCUIT_FILE_HEADER = struct.Struct("<4sIQQQQQ")
 
 
 @dataclass
@@ -77,189 +104,1919 @@ class MultWire(Wire):
     this wire is part of."""
 
 
+@dataclass
+class InnerProductWire(Wire):
+    """The output wire of an inner-product gate that computes `A_1 * B_1 + ... + A_n * B_n`. It costs a single
+    inner-product triple (random `X_1, ..., X_n`, `Y_1, ..., Y_n` and `Z = X_1 * Y_1 + ... + X_n * Y_n`) instead of `n`
+    Beaver triples, and no intermediate wires for the products and their sum."""
+
+    wire_a_ids: List[int]
+    """The wires corresponding to inputs `A_1, ..., A_n`, as identified by their indices in the list of wires (i.e.
+    circuit) that this wire is part of."""
+
+    wire_b_ids: List[int]
+    """The wires corresponding to inputs `B_1, ..., B_n`, as identified by their indices in the list of wires (i.e.
+    circuit) that this wire is part of."""
+
+
+@dataclass
+class MatMultWire(Wire):
+    """One entry of the product `A * B` of an `n x k` matrix `A` and a `k x m` matrix `B` of wires. The entries of a
+    product are consecutive [MatMultWire]s with the same [wire_a_ids], [wire_b_ids] and [inner] (see
+    [BGW.matrix_mult]), and the whole product is computed at once with a single matrix triple (random `X` and `Y` and
+    `Z = X * Y`): opening `A - X` and `B - Y` costs `n * k + k * m` masked shares, instead of `n * k * m` Beaver
+    triples and twice as many masked shares for [MultWire]s."""
+
+    wire_a_ids: List[int]
+    """The wires of matrix `A`, row by row, as identified by their indices in the list of wires (i.e. circuit) that this
+    wire is part of."""
+
+    wire_b_ids: List[int]
+    """The wires of matrix `B`, row by row."""
+
+    inner: int
+    """The number of columns of `A`, which is the number of rows of `B`."""
+
+    row: int
+    """The row of this entry in the product."""
+
+    column: int
+    """The column of this entry in the product."""
+
+
+@dataclass
+class CompiledCircuit:
+    """A circuit compiled into flat arrays, with one entry per wire, so that it can be evaluated without dispatching on
+    the types of [Wire] objects. The entries of [a_ids] and [b_ids] depend on the opcode of the wire:
+
+    - `OP_INPUT`: `a_ids` holds the owner ID, `b_ids` is unused;
+    - `OP_ADD` and `OP_MULT`: `a_ids` and `b_ids` hold the IDs of wires `A` and `B`;
+    - `OP_CONST_MULT`: `a_ids` holds the ID of wire `A`, `b_ids` holds the index of `c` in [consts];
+    - `OP_INNER_PRODUCT`: `a_ids` holds the index of the first pair `A_1, B_1` in [inner_a_ids] and [inner_b_ids],
+      `b_ids` holds the number of pairs;
+    - `OP_MATRIX_MULT`: `a_ids` holds the index of the product in [matrices], `b_ids` holds the index of the entry in
+      the product, row by row."""
+
+    ops: array
+    """The opcode of each wire."""
+
+    a_ids: array
+    """The first operand of each wire."""
+
+    b_ids: array
+    """The second operand of each wire."""
+
+    consts: List[int]
+    """The distinct constants used by the [ConstMultWire]s of the circuit."""
+
+    outputs: bytearray
+    """A bitmap that has bit `i` set if and only if wire `i` is an output wire."""
+
+    inner_a_ids: array = field(default_factory=lambda: array("q"))
+    """The `A` wires of the pairs of all [InnerProductWire]s."""
+
+    inner_b_ids: array = field(default_factory=lambda: array("q"))
+    """The `B` wires of the pairs of all [InnerProductWire]s."""
+
+    matrices: array = field(default_factory=lambda: array("q"))
+    """Four entries per matrix product of [MatMultWire]s: the index of its first wire in [matrix_wires] and its
+    dimensions `n`, `k` and `m`, see [BGW.matrix_product]."""
+
+    matrix_wires: array = field(default_factory=lambda: array("q"))
+    """For every matrix product, the `n * k` wires of `A`, the `k * m` wires of `B` and the `n * m` wires of its
+    entries (`-1` for entries that no wire holds), all row by row."""
+
+    path: str | None = None
+    """The file this circuit was memory-mapped from by [BGW.load_circuit], if any. The arrays above are then views of
+    that file instead of copies."""
+
+    def __len__(self) -> int:
+        return len(self.ops)
+
+    def __reduce_ex__(self, protocol):
+        # a mapped circuit is sent to other processes as its path, and mapped again there
+        if self.path is not None:
+            return BGW.load_circuit, (self.path,)
+
+        return super().__reduce_ex__(protocol)
+
+    def is_output(self, wire_id: int) -> bool:
+        """Returns `True` if and only if the value of wire [wire_id] should be made public."""
+
+        return bool(self.outputs[wire_id >> 3] >> (wire_id & 7) & 1)
+
+    def output_ids(self) -> List[int]:
+        """Returns the IDs of all output wires, in increasing order."""
+
+        bits = np.unpackbits(np.frombuffer(self.outputs, dtype=np.uint8), bitorder="little")[:len(self.ops)]
+        return np.flatnonzero(bits).tolist()
+
+
+@dataclass
+class Layer:
+    """One multiplicative-depth layer of a circuit, i.e. the part of the circuit that is computed with a single round of
+    interaction."""
+
+    linear_waves: List[np.ndarray]
+    """The [AddWire]s and [ConstMultWire]s at this multiplicative depth, which can all be computed locally before this
+    layer's round of interaction. They are grouped into waves of wires that do not depend on each other, so that each
+    wave can be computed with a few vectorized operations; wave `k` only depends on waves `0` to `k - 1`."""
+
+    mult_ids: np.ndarray
+    """The [MultWire]s and [InnerProductWire]s whose inputs are available once [linear_waves] have been computed. The
+    masked shares of all of these are opened together in one round of interaction."""
+
+    matrix_ids: np.ndarray = field(default_factory=lambda: np.zeros(0, dtype=np.intp))
+    """The matrix products of [MatMultWire]s (indices in [CompiledCircuit.matrices]) whose inputs are available once
+    [linear_waves] have been computed, opened in the same round as [mult_ids]."""
+
+    @property
+    def interactive(self) -> bool:
+        """`True` if and only if this layer needs a round of interaction."""
+
+        return len(self.mult_ids) > 0 or len(self.matrix_ids) > 0
+
+
+@dataclass
+class CircuitStats:
+    """The size and cost of a circuit, see [BGW.circuit_stats]."""
+
+    wires: int
+    """The total number of wires."""
+
+    inputs: int
+    """The number of [InputWire]s."""
+
+    adds: int
+    """The number of [AddWire]s."""
+
+    const_mults: int
+    """The number of [ConstMultWire]s."""
+
+    mults: int
+    """The number of [MultWire]s, each of which uses up one Beaver triple (one per record in batch mode)."""
+
+    depth: int
+    """The multiplicative depth, i.e. the number of rounds of interaction needed to compute the circuit."""
+
+    inner_products: int = 0
+    """The number of [InnerProductWire]s, each of which uses up one inner-product triple."""
+
+    matrix_products: int = 0
+    """The number of matrix products of [MatMultWire]s, each of which uses up one matrix triple."""
+
+
+@dataclass
+class CircuitPlan:
+    """The cost of running a circuit with [BGW.run_circuit], as predicted by [BGW.plan_circuit] without running it. The
+    messages and bytes are counted like the [RunMetrics] of a run count them."""
+
+    client_count: int
+    """The number of clients that the plan is for."""
+
+    rounds: int
+    """The number of rounds of interaction, i.e. the multiplicative depth."""
+
+    triples: int
+    """The number of rows of Beaver triples that the TTP generates: one per [MultWire] and one per pair of every
+    [InnerProductWire], for every record in batch mode."""
+
+    input_shares: int
+    """The number of shares of input values that are created, over all clients."""
+
+    messages_sent: Dict[int | str, int]
+    """party -> the number of messages that party sends (`"ttp"` for the triples that the TTP hands out)"""
+
+    bytes_sent: Dict[int | str, int]
+    """party -> the number of payload bytes that party sends"""
+
+    peak_live_shares: int
+    """The largest number of shares that a client needs to keep at any one time, see [BGW.allocate_slots]."""
+
+    stored_shares: int
+    """The number of shares that a client allocates storage for: [peak_live_shares] with `free_shares`, a share per
+    wire otherwise."""
+
+    matrix_triples: int = 0
+    """The number of matrix triples that the TTP generates, one per matrix product of [MatMultWire]s and record."""
+
+    @property
+    def total_messages(self) -> int:
+        """The number of messages sent by all parties."""
+
+        return sum(self.messages_sent.values())
+
+    @property
+    def total_bytes(self) -> int:
+        """The number of payload bytes sent by all parties."""
+
+        return sum(self.bytes_sent.values())
+
+
+@dataclass
+class OptimizedCircuit:
+    """The result of [BGW.optimize_circuit]. The wires of the optimized [circuit] are numbered differently from the
+    original one, so inputs and outputs have to be translated with [map_inputs] and [map_outputs]."""
+
+    circuit: List[Wire]
+    """The optimized circuit."""
+
+    wire_map: Dict[int, int]
+    """original wire ID -> ID of the wire in [circuit] with the same value, for every input that is still used and for
+    every output of the original circuit"""
+
+    output_ids: List[int]
+    """The IDs of the output wires of the original circuit."""
+
+    before: CircuitStats
+    """The stats of the original circuit."""
+
+    after: CircuitStats
+    """The stats of the optimized circuit."""
+
+    def map_inputs(self, inputs: Dict[int, int]) -> Dict[int, int]:
+        """Translates a client's [inputs] for the original circuit into inputs for the optimized circuit. Inputs that
+        the optimized circuit no longer uses are dropped."""
+
+        return {self.wire_map[wire_id]: value for wire_id, value in inputs.items() if wire_id in self.wire_map}
+
+    def map_outputs(self, outputs: Dict[int, int]) -> Dict[int, int]:
+        """Translates the [outputs] of the optimized circuit back to the output wires of the original circuit."""
+
+        return {wire_id: outputs[self.wire_map[wire_id]] for wire_id in self.output_ids}
+
+    def report(self) -> str:
+        """Returns a table that compares the stats of the circuit before and after optimizing."""
+
+        lines = [f"{'':12} {'before':>8} {'after':>8}"]
+        for name, label in [("wires", "wires"), ("inputs", "inputs"), ("adds", "adds"), ("const_mults", "const mults"),
+                            ("mults", "triples"), ("inner_products", "inner prods"),
+                            ("matrix_products", "matrix prods"), ("depth", "rounds")]:
+            lines.append(f"{label:12} {getattr(self.before, name):>8} {getattr(self.after, name):>8}")
+
+        return "\n".join(lines)
+
+
 class BGW:
     """Behavior of the BGW protocol."""
 
     @staticmethod
-    def create_shares(rng: SystemRandom, secret: int, share_count: int, mod: int) -> List[int]:
-        """Divides the [secret] into [share_count] additive secret shares under modulo [mod] using [rng] as a source of
-        randomness."""
-        
-        # commented because I let also TTP user this function
-        # but only when clients call this, is counted
-        # see @Client.local_setup()
-        # update: not commented anymore
+    def is_ring(mod: int) -> bool:
+        """Returns `True` if and only if [mod] is `2^k` with `1 <= k <= 64`, i.e. if shares under modulo [mod] can be
+        computed with native `uint64` arithmetic, which wraps around modulo `2^64`, followed by a bit mask."""
+
+        return 2 <= mod <= 1 << 64 and mod & (mod - 1) == 0
+
+    @staticmethod
+    def dtype(mod: int) -> np.dtype:
+        """Returns the NumPy dtype that shares under modulo [mod] are stored in. Power-of-two moduli up to `2^64` use
+        `uint64` (see [is_ring]). Otherwise, products of two shares must fit in 64 bits for the native `int64`
+        arithmetic to be exact, so for larger moduli the shares are kept as Python ints in an `object` array, which is
+        still vectorized but much slower."""
+
+        if BGW.is_ring(mod):
+            return np.dtype(np.uint64)
+        elif mod <= 1 << 31:
+            return np.dtype(np.int64)
+        else:
+            return np.dtype(object)
+
+    @staticmethod
+    def share_width(mod: int) -> int:
+        """Returns the number of bytes that a single share under modulo [mod] takes up in a message."""
+
+        if BGW.dtype(mod) != object:
+            return BGW.dtype(mod).itemsize
+
+        return max(1, ((mod - 1).bit_length() + 7) // 8)
+
+    @staticmethod
+    def reduce(values: np.ndarray, mod: int) -> np.ndarray:
+        """Reduces the result [values] of some arithmetic on shares modulo [mod]. In a power-of-two ring, the arithmetic
+        has already wrapped around modulo `2^64`, so only the low bits have to be kept."""
+
+        if BGW.is_ring(mod):
+            return values & np.uint64(mod - 1)
+
+        return values % mod
+
+    @staticmethod
+    def to_array(values, mod: int) -> np.ndarray:
+        """Converts the integers [values] into an array of shares reduced modulo [mod]."""
+
+        if isinstance(values, np.ndarray) and values.dtype == BGW.dtype(mod):
+            return BGW.reduce(values, mod)
+
+        return np.array([int(value) % mod for value in np.asarray(values, dtype=object).ravel()],
+                        dtype=BGW.dtype(mod)).reshape(np.shape(values))
+
+    @staticmethod
+    def random_batch(rng: SystemRandom, shape, mod: int) -> np.ndarray:
+        """Returns an array of the given [shape] with values drawn uniformly from `[0, mod)`, using [rng] to seed a fast
+        generator so that the whole batch costs a single call to [rng]."""
+
+        dtype = BGW.dtype(mod)
+
+        if dtype != object:
+            return np.random.default_rng(rng.getrandbits(128)).integers(0, mod - 1, size=shape, dtype=dtype,
+                                                                        endpoint=True)
+        else:
+            values = np.empty(shape, dtype=object)
+            values.flat = [rng.randrange(mod) for _ in range(values.size)]
+            return values
+
+    @staticmethod
+    def expand_seed(seed: int, shape, mod: int) -> np.ndarray:
+        """Deterministically expands [seed] into an array of the given [shape] with pseudo-random values in `[0, mod)`.
+        Two parties that know the same [seed] get the same array without talking to each other."""
+
+        dtype = BGW.dtype(mod)
+
+        if dtype != object:
+            return np.random.default_rng(seed).integers(0, mod - 1, size=shape, dtype=dtype, endpoint=True)
+        else:
+            prg = Random(seed)
+            values = np.empty(shape, dtype=object)
+            values.flat = [prg.randrange(mod) for _ in range(values.size)]
+            return values
+
+    @staticmethod
+    def create_shares_batch(rng: SystemRandom, secrets: np.ndarray, share_count: int, mod: int) -> np.ndarray:
+        """Divides each of the [secrets] into [share_count] additive secret shares under modulo [mod] using [rng] as a
+        source of randomness. Returns an array with one row of shares per client, i.e. `result[i]` holds the shares of
+        all [secrets] for client `i`."""
+
+        secrets = BGW.to_array(secrets, mod)
+
         global COUNT_BGW_create_shares
-        COUNT_BGW_create_shares += 1
+        COUNT_BGW_create_shares += secrets.size
+        shares = np.empty((share_count,) + secrets.shape, dtype=secrets.dtype)
 
-        shares = []
-        # shares = List[int]
-        
-        # divite the secret into [share_count] - 1 shares
-        for _ in range(share_count - 1):
-            val = rng.randint(1, 10)
-            secret = (secret - val) % mod
-            shares.append(val)
+        # the first [share_count] - 1 shares are random, the last one makes them add up to the secret
+        shares[:-1] = BGW.random_batch(rng, (share_count - 1,) + secrets.shape, mod)
+        shares[-1] = BGW.reduce(secrets - shares[:-1].sum(axis=0), mod)
 
-        # append the last share
-        shares.append(secret)
+        return shares
+
+    @staticmethod
+    def create_seeded_shares_batch(seeds: List[int | None], secrets: np.ndarray, mod: int) -> np.ndarray:
+        """Divides each of the [secrets] into `len(seeds)` additive secret shares under modulo [mod], like
+        [create_shares_batch], but the shares of client `i` are expanded from `seeds[i]` with [expand_seed], so client `i`
+        can compute them itself from its seed. Exactly one of the [seeds] must be `None`: that client gets the
+        correction shares that make the shares add up to the [secrets]."""
+
+        secrets = BGW.to_array(secrets, mod)
+
+        global COUNT_BGW_create_shares
+        COUNT_BGW_create_shares += secrets.size
+        shares = np.empty((len(seeds),) + secrets.shape, dtype=secrets.dtype)
+
+        correction_id = seeds.index(None)
+        for i, seed in enumerate(seeds):
+            if i != correction_id:
+                shares[i] = BGW.expand_seed(seed, secrets.shape, mod)
+
+        shares[correction_id] = 0
+        shares[correction_id] = BGW.reduce(secrets - shares.sum(axis=0), mod)
 
         return shares
 
     @staticmethod
-    def recover_secret(shares: List[int], mod: int) -> int:
-        """Reconstructs the secret that the additive secret [shares] make up under modulo [mod]."""
-        
+    def recover_secret_batch(shares: np.ndarray, mod: int) -> np.ndarray:
+        """Reconstructs the secrets that the additive secret [shares] make up under modulo [mod], where `shares[i]`
+        holds the shares of client `i`."""
+
         global COUNT_BGW_recover_secret
-        COUNT_BGW_recover_secret += 1
+        COUNT_BGW_recover_secret += np.size(shares[0])
+
+        return BGW.reduce(shares.sum(axis=0), mod)
+
+    @staticmethod
+    def sub_batch(a_shares: np.ndarray, b_shares: np.ndarray, mod: int) -> np.ndarray:
+        """Subtracts the shares [b_shares] from [a_shares] element-wise under modulo [mod]."""
+
+        with np.errstate(over="ignore"):
+            return BGW.reduce(a_shares - b_shares, mod)
+
+    @staticmethod
+    def add_batch(a_shares: np.ndarray, b_shares: np.ndarray, mod: int) -> np.ndarray:
+        """Adds the shares [a_shares] and [b_shares] together element-wise under modulo [mod]."""
+
+        global COUNT_BGW_add
+        COUNT_BGW_add += np.size(a_shares)
+
+        # wrapping around modulo 2^64 is intended in power-of-two rings
+        with np.errstate(over="ignore"):
+            return BGW.reduce(a_shares + b_shares, mod)
 
-        secret = 0
+    @staticmethod
+    def const_mult_batch(c: np.ndarray, a_shares: np.ndarray, mod: int) -> np.ndarray:
+        """Multiplies the shares [a_shares] element-wise with the constants [c], which must already be reduced modulo
+        [mod], under modulo [mod]."""
+
+        global COUNT_BGW_const_mult
+        COUNT_BGW_const_mult += np.size(a_shares)
+
+        with np.errstate(over="ignore"):
+            return BGW.reduce(c * a_shares, mod)
+
+    @staticmethod
+    def mult_batch(is_alice: bool, x_shares: np.ndarray, y_shares: np.ndarray, z_shares: np.ndarray,
+                   a_primes: np.ndarray, b_primes: np.ndarray, mod: int) -> np.ndarray:
+        """Performs the masked multiplications corresponding to `A * B` element-wise, see [mult]. Every product is
+        reduced before it is added so that the intermediate values stay below `3 * mod`."""
+
+        global COUNT_BGW_mult
+        COUNT_BGW_mult += np.size(x_shares)
 
-        for s in shares:
-            secret += s
-            # secret = (secret + s) % mod
+        if BGW.is_ring(mod):
+            # no intermediate reductions needed, the sum wraps around modulo 2^64 just like the products
+            with np.errstate(over="ignore"):
+                result = a_primes * y_shares + b_primes * x_shares + z_shares
+                if is_alice:
+                    result += a_primes * b_primes
+                return BGW.reduce(result, mod)
 
-        return secret % mod
-        # return secret 
+        result = (a_primes * y_shares % mod + b_primes * x_shares % mod + z_shares) % mod
+
+        if is_alice:
+            result = (result + a_primes * b_primes % mod) % mod
+
+        return result
+
+    @staticmethod
+    def sum_groups_batch(shares: np.ndarray, sizes: np.ndarray, mod: int) -> np.ndarray:
+        """Adds up consecutive groups of [sizes] rows of [shares] under modulo [mod], e.g. the shares of the products
+        of every [InnerProductWire]."""
+
+        if (sizes == 1).all():
+            return shares
+
+        global COUNT_BGW_add
+        COUNT_BGW_add += np.size(shares)
+
+        # every share is below the modulo, so for the int64 dtype the sums stay far below 2^63
+        with np.errstate(over="ignore"):
+            return BGW.reduce(np.add.reduceat(shares, np.cumsum(sizes) - sizes, axis=0), mod)
+
+    @staticmethod
+    def matmul_batch(a: np.ndarray, b: np.ndarray, mod: int) -> np.ndarray:
+        """Multiplies the `n x k` matrix [a] with the `k x m` matrix [b] under modulo [mod]. In batch mode both have the
+        record as their last axis, and every record is multiplied separately."""
+
+        # the matrix axes go last for matmul
+        if a.ndim > 2:
+            a, b = np.moveaxis(a, (0, 1), (-2, -1)), np.moveaxis(b, (0, 1), (-2, -1))
+
+        with np.errstate(over="ignore"):
+            if BGW.dtype(mod) == np.int64:
+                # products of two values below 2^31 only leave room for a single term of the sum in 63 bits, so B is
+                # split into 16-bit halves, which leaves room for 2^16 terms
+                high = a @ (b >> 16) % mod
+                product = (high * (1 << 16) % mod + a @ (b & 0xFFFF) % mod) % mod
+            else:
+                product = BGW.reduce(a @ b, mod)
+
+        if product.ndim > 2:
+            product = np.moveaxis(product, (-2, -1), (0, 1))
+
+        return product
+
+    @staticmethod
+    def matrix_mult_batch(is_alice: bool, x_shares: np.ndarray, y_shares: np.ndarray, z_shares: np.ndarray,
+                          a_prime: np.ndarray, b_prime: np.ndarray, mod: int) -> np.ndarray:
+        """Computes a share of the matrix product `A * B` from the shares of a matrix triple `X`, `Y` and `Z = X * Y`,
+        and the opened `A' = A - X` and `B' = B - Y`: `A * B = A' * Y + X * B' + Z + A' * B'`, where only Alice adds
+        the public `A' * B'`."""
+
+        global COUNT_BGW_mult
+        COUNT_BGW_mult += a_prime.shape[0] * b_prime.shape[1] * int(np.prod(a_prime.shape[2:]))
+
+        result = BGW.matmul_batch(a_prime, y_shares, mod)
+        with np.errstate(over="ignore"):
+            result = BGW.reduce(result + BGW.matmul_batch(x_shares, b_prime, mod), mod)
+            result = BGW.reduce(result + z_shares, mod)
+
+            if is_alice:
+                result = BGW.reduce(result + BGW.matmul_batch(a_prime, b_prime, mod), mod)
+
+        return result
+
+    @staticmethod
+    def create_shares(rng: SystemRandom, secret: int, share_count: int, mod: int) -> List[int]:
+        """Divides the [secret] into [share_count] additive secret shares under modulo [mod] using [rng] as a source of
+        randomness."""
+
+        return [int(share) for share in BGW.create_shares_batch(rng, np.array([secret], dtype=object), share_count, mod)[:, 0]]
+
+    @staticmethod
+    def recover_secret(shares: List[int], mod: int) -> int:
+        """Reconstructs the secret that the additive secret [shares] make up under modulo [mod]."""
+
+        return int(BGW.recover_secret_batch(BGW.to_array(shares, mod), mod))
 
     @staticmethod
     def add(a_share: int, b_share: int, mod: int) -> int:
         """Adds the shares [a_share] and [b_share] together under modulo [mod]."""
-        
-        global COUNT_BGW_add
-        COUNT_BGW_add += 1
-            
-        # Should we encrypt the shares first?
-        # a_enc = f.encrypt(a_share)
-        # b_enc = f.encrypt(b_share)
 
-        return (a_share + b_share) % mod
-        
+        return int(BGW.add_batch(BGW.to_array([a_share], mod), BGW.to_array([b_share], mod), mod)[0])
 
     @staticmethod
     def const_mult(c: int, a_share: int, mod: int) -> int:
         """Multiplies the share [a_share] with the constant [c] under modulo [mod]."""
-        
-        global COUNT_BGW_const_mult
-        COUNT_BGW_const_mult += 1
 
-        return (c * a_share) % mod
+        return int(BGW.const_mult_batch(BGW.to_array([c], mod), BGW.to_array([a_share], mod), mod)[0])
 
     @staticmethod
     def mult(is_alice: bool, x_share: int, y_share: int, z_share: int, a_prime: int, b_prime: int, mod: int) -> int:
         """Performs the masked multiplication corresponding to `A * B` using the formula from the slides, under modulo
         [mod]. The constant term is added only if [is_alice] is `True`."""
 
-        global COUNT_BGW_mult
-        COUNT_BGW_mult += 1
+        x, y, z, a, b = BGW.to_array([[x_share], [y_share], [z_share], [a_prime], [b_prime]], mod)
 
-        if is_alice:
-            return (a_prime * b_prime + a_prime * y_share + b_prime * x_share + z_share) % mod
+        return int(BGW.mult_batch(is_alice, x, y, z, a, b, mod)[0])
+
+    @staticmethod
+    def compile_circuit(circuit: List[Wire]) -> CompiledCircuit:
+        """Compiles the list of [Wire]s [circuit] into a [CompiledCircuit]. This is the only place where the types of
+        the wires are inspected."""
+
+        ops = array("B")
+        a_ids = array("q")
+        b_ids = array("q")
+        consts = []
+        const_index = {}
+        outputs = bytearray((len(circuit) + 7) // 8)
+        inner_a_ids = array("q")
+        inner_b_ids = array("q")
+        matrices = array("q")
+        matrix_wires = array("q")
+        product = None
+        """The [MatMultWire] that started the current matrix product, and the offset of its entries in [matrix_wires]"""
+
+        for wire_index, wire in enumerate(circuit):
+            if type(wire) == InputWire:
+                ops.append(OP_INPUT)
+                a_ids.append(wire.owner_id)
+                b_ids.append(0)
+            elif type(wire) == AddWire:
+                ops.append(OP_ADD)
+                a_ids.append(wire.wire_a_id)
+                b_ids.append(wire.wire_b_id)
+            elif type(wire) == ConstMultWire:
+                if wire.c not in const_index:
+                    const_index[wire.c] = len(consts)
+                    consts.append(wire.c)
+
+                ops.append(OP_CONST_MULT)
+                a_ids.append(wire.wire_a_id)
+                b_ids.append(const_index[wire.c])
+            elif type(wire) == MultWire:
+                ops.append(OP_MULT)
+                a_ids.append(wire.wire_a_id)
+                b_ids.append(wire.wire_b_id)
+            elif type(wire) == InnerProductWire:
+                if len(wire.wire_a_ids) != len(wire.wire_b_ids) or not wire.wire_a_ids:
+                    raise ValueError(f"Wire {wire_index} must have as many A wires as B wires, and at least one.")
+
+                ops.append(OP_INNER_PRODUCT)
+                a_ids.append(len(inner_a_ids))
+                b_ids.append(len(wire.wire_a_ids))
+                inner_a_ids.extend(wire.wire_a_ids)
+                inner_b_ids.extend(wire.wire_b_ids)
+            elif type(wire) == MatMultWire:
+                k = wire.inner
+                n, m = len(wire.wire_a_ids) // max(k, 1), len(wire.wire_b_ids) // max(k, 1)
+                if k < 1 or n < 1 or m < 1 or n * k != len(wire.wire_a_ids) or k * m != len(wire.wire_b_ids):
+                    raise ValueError(f"Wire {wire_index} must have an n x {k} and a {k} x m matrix of wires.")
+                if not (0 <= wire.row < n and 0 <= wire.column < m):
+                    raise ValueError(f"Wire {wire_index} is entry ({wire.row}, {wire.column}) of a {n} x {m} product.")
+
+                # an entry continues the product of the wire before it if it has the same operands and is not taken yet
+                entry = wire.row * m + wire.column
+                first = product and product[0]
+                if not (ops and ops[-1] == OP_MATRIX_MULT and first.inner == k and
+                        (first.wire_a_ids is wire.wire_a_ids or first.wire_a_ids == wire.wire_a_ids) and
+                        (first.wire_b_ids is wire.wire_b_ids or first.wire_b_ids == wire.wire_b_ids) and
+                        matrix_wires[product[1] + entry] == -1):
+                    matrices.extend([len(matrix_wires), n, k, m])
+                    matrix_wires.extend(wire.wire_a_ids)
+                    matrix_wires.extend(wire.wire_b_ids)
+                    product = (wire, len(matrix_wires))
+                    matrix_wires.extend([-1] * (n * m))
+
+                matrix_wires[product[1] + entry] = wire_index
+                ops.append(OP_MATRIX_MULT)
+                a_ids.append(len(matrices) // 4 - 1)
+                b_ids.append(entry)
+            else:
+                raise ValueError(f"Wire {wire_index} has unsupported type {type(wire).__name__}.")
+
+            if wire.is_output:
+                outputs[wire_index >> 3] |= 1 << (wire_index & 7)
+
+        return CompiledCircuit(ops, a_ids, b_ids, consts, outputs, inner_a_ids, inner_b_ids, matrices, matrix_wires)
+
+    @staticmethod
+    def save_circuit(circuit: List[Wire] | CompiledCircuit, path: str):
+        """Writes the [circuit] to the binary circuit file [path], which [load_circuit] can map back into memory. The
+        file holds the arrays of the [CompiledCircuit] as they are, so it takes 17 bytes per wire."""
+
+        if type(circuit) != CompiledCircuit:
+            circuit = BGW.compile_circuit(circuit)
+
+        wire_count = len(circuit)
+        const_width = max([(c.bit_length() + 8) // 8 for c in circuit.consts], default=1)
+
+        with open(path, "wb") as file:
+            file.write(CIRCUIT_FILE_HEADER.pack(CIRCUIT_FILE_MAGIC, const_width, wire_count, len(circuit.consts),
+                                                len(circuit.inner_a_ids), len(circuit.matrices) // 4,
+                                                len(circuit.matrix_wires)))
+
+            for section in [np.frombuffer(circuit.ops, dtype=np.uint8), np.frombuffer(circuit.a_ids, dtype=np.int64),
+                            np.frombuffer(circuit.b_ids, dtype=np.int64), np.frombuffer(circuit.outputs, dtype=np.uint8),
+                            np.frombuffer(circuit.inner_a_ids, dtype=np.int64),
+                            np.frombuffer(circuit.inner_b_ids, dtype=np.int64),
+                            np.frombuffer(circuit.matrices, dtype=np.int64),
+                            np.frombuffer(circuit.matrix_wires, dtype=np.int64)]:
+                file.write(section.tobytes())
+                file.write(bytes(-section.nbytes % 8))
+
+            for c in circuit.consts:
+                file.write(int(c).to_bytes(const_width, "little", signed=True))
+
+    @staticmethod
+    def load_circuit(path: str) -> CompiledCircuit:
+        """Memory-maps the circuit file [path] written by [save_circuit]. No [Wire] objects are created: the arrays of
+        the returned [CompiledCircuit] are views of the file, so wires are read from the page cache as the circuit is
+        evaluated, and all clients (and processes) that use the circuit share a single copy of it."""
+
+        with open(path, "rb") as file:
+            magic, const_width, wire_count, const_count, pair_count, matrix_count, matrix_wire_count = \
+                CIRCUIT_FILE_HEADER.unpack(file.read(CIRCUIT_FILE_HEADER.size))
+
+            if magic != CIRCUIT_FILE_MAGIC:
+                raise ValueError(f"{path} is not a circuit file.")
+
+            # mmap cannot map an empty file, which is what the arrays of an empty circuit would be
+            data = memoryview(mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ) if wire_count else
+                              bytes(CIRCUIT_FILE_HEADER.size))
+
+        layout = [(wire_count, "B"), (8 * wire_count, "q"), (8 * wire_count, "q"), ((wire_count + 7) // 8, "B"),
+                  (8 * pair_count, "q"), (8 * pair_count, "q"), (32 * matrix_count, "q"), (8 * matrix_wire_count, "q")]
+        if CIRCUIT_FILE_HEADER.size + sum(size + -size % 8 for size, _ in layout) + const_count * const_width > len(data):
+            raise ValueError(f"{path} is truncated.")
+
+        sections = []
+        offset = CIRCUIT_FILE_HEADER.size
+        for size, fmt in layout:
+            sections.append(data[offset:offset + size].cast(fmt))
+            offset += size + -size % 8
+
+        consts = [int.from_bytes(data[offset + i * const_width:offset + (i + 1) * const_width], "little", signed=True)
+                  for i in range(const_count)]
+
+        ops, a_ids, b_ids, outputs, inner_a_ids, inner_b_ids, matrices, matrix_wires = sections
+        return CompiledCircuit(ops, a_ids, b_ids, consts, outputs, inner_a_ids, inner_b_ids, matrices, matrix_wires, path)
+
+    @staticmethod
+    def from_bristol(circuit: BristolCircuit, mod: int, owners: List[int] | None = None) \
+            -> Tuple[CompiledCircuit, List[int]]:
+        """Converts the boolean [BristolCircuit] [circuit] (see [bristol.load_bristol]) into an arithmetic
+        [CompiledCircuit] over the bits `0` and `1` under modulo [mod], where input value `i` is owned by client
+        `owners[i]` (client `i` by default). The input wires keep their IDs.
+
+        Under modulo 2, `XOR` is an [AddWire] and `AND` a [MultWire]. Under any other modulo, `XOR` becomes
+        `A + B - 2 * A * B` and `OR` becomes `A + B - A * B`, each costing one multiplication. `INV` and `EQ` need the
+        constant `1`, which is then an extra input wire owned by client 0, right after the inputs of the circuit;
+        [bristol_inputs] supplies it. Returns the circuit and the IDs of the wires that hold the output bits, in order,
+        for [bristol.decode_outputs]."""
+
+        input_count = circuit.input_count
+        kinds = np.frombuffer(circuit.kinds, dtype=np.uint8)
+        gate_a_ids = np.frombuffer(circuit.a_ids, dtype=np.int64)
+        gate_b_ids = np.frombuffer(circuit.b_ids, dtype=np.int64)
+        one_id = input_count
+        is_eq = kinds == GATE_EQ
+
+        # the wires that each kind of gate becomes: (opcode, A, B), where an operand is an input of the gate ("a", "b"
+        # or "one") or the index of an earlier wire of the same gate, and B of an OP_CONST_MULT is the constant
+        if mod == 2:
+            templates = [
+                (kinds == GATE_XOR, [(OP_ADD, "a", "b")]),
+                (kinds == GATE_OR, [(OP_MULT, "a", "b"), (OP_ADD, "a", "b"), (OP_ADD, 1, 0)]),
+                (kinds == GATE_INV, [(OP_ADD, "one", "a")]),
+            ]
         else:
-            return (a_prime * y_share + b_prime * x_share + z_share) % mod
+            templates = [
+                (kinds == GATE_XOR, [(OP_MULT, "a", "b"), (OP_CONST_MULT, 0, -2), (OP_ADD, "a", "b"), (OP_ADD, 2, 1)]),
+                (kinds == GATE_OR, [(OP_MULT, "a", "b"), (OP_CONST_MULT, 0, -1), (OP_ADD, "a", "b"), (OP_ADD, 2, 1)]),
+                (kinds == GATE_INV, [(OP_CONST_MULT, "a", -1), (OP_ADD, "one", 0)]),
+            ]
+
+        templates += [
+            (kinds == GATE_AND, [(OP_MULT, "a", "b")]),
+            (kinds == GATE_EQW, [(OP_CONST_MULT, "a", 1)]),
+            (is_eq & (gate_a_ids == 0), [(OP_CONST_MULT, "one", 0)]),
+            (is_eq & (gate_a_ids == 1), [(OP_CONST_MULT, "one", 1)]),
+        ]
+
+        sizes = np.zeros(len(kinds), dtype=np.int64)
+        for gates, steps in templates:
+            sizes[gates] = len(steps)
+
+        if (sizes == 0).any():
+            raise ValueError("The circuit has EQ gates with constants other than 0 and 1.")
+
+        # gate `g` becomes the wires `starts[g]` to `starts[g] + sizes[g] - 1`, the last of which is its output
+        first_gate_wire = input_count + circuit.has_constants
+        starts = first_gate_wire + np.cumsum(sizes) - sizes
+        wire_count = first_gate_wire + int(sizes.sum())
+
+        wire_map = np.zeros(circuit.wire_count, dtype=np.int64)
+        wire_map[:input_count] = np.arange(input_count)
+        wire_map[np.frombuffer(circuit.out_ids, dtype=np.int64)] = starts + sizes - 1
+
+        ops = np.full(wire_count, OP_INPUT, dtype=np.uint8)
+        a_ids = np.zeros(wire_count, dtype=np.int64)
+        b_ids = np.zeros(wire_count, dtype=np.int64)
+        consts = []
+
+        for value_index in range(len(circuit.input_sizes)):
+            wires = circuit.input_wires(value_index)
+            a_ids[wires.start:wires.stop] = value_index if owners is None else owners[value_index]
+
+        for gates, steps in templates:
+            gates = np.flatnonzero(gates)
+            if not len(gates):
+                continue
+
+            operands = {"a": wire_map[gate_a_ids[gates]], "b": wire_map[gate_b_ids[gates]], "one": one_id}
+
+            for step, (op, a, b) in enumerate(steps):
+                wires = starts[gates] + step
+                ops[wires] = op
+                a_ids[wires] = operands[a] if type(a) == str else starts[gates] + a
+
+                if op == OP_CONST_MULT:
+                    if b not in consts:
+                        consts.append(b)
+                    b_ids[wires] = consts.index(b)
+                else:
+                    b_ids[wires] = operands[b] if type(b) == str else starts[gates] + b
+
+        output_ids = wire_map[circuit.output_wires()]
+        outputs = np.zeros(wire_count, dtype=np.uint8)
+        outputs[output_ids] = 1
+
+        compiled = CompiledCircuit(array("B", ops.tobytes()), array("q", a_ids.tobytes()), array("q", b_ids.tobytes()),
+                                   consts, bytearray(np.packbits(outputs, bitorder="little").tobytes()))
+
+        return compiled, output_ids.tolist()
+
+    @staticmethod
+    def bristol_inputs(circuit: BristolCircuit, values: List[int | List[int]], client_count: int,
+                       owners: List[int] | None = None, batch_size: int | None = None) -> List[Dict[int, int]]:
+        """Returns the inputs of each of the [client_count] clients for the circuit that [from_bristol] made from the
+        [BristolCircuit] [circuit] with the same [owners], given the integer input [values] of the circuit. Client 0
+        also gets the constant `1` if the circuit needs it. In batch mode, i.e. if [batch_size] is given, every value is
+        a list of [batch_size] integers, one per record."""
+
+        if owners is None:
+            owners = list(range(len(values)))
+
+        inputs = [encode_inputs(circuit, {value_index: value for value_index, value in enumerate(values)
+                                          if owners[value_index] == client_id}) for client_id in range(client_count)]
+
+        if circuit.has_constants:
+            inputs[0][circuit.input_count] = 1 if batch_size is None else [1] * batch_size
+
+        return inputs
+
+    @staticmethod
+    def plan_circuit(circuit: List[Wire] | CompiledCircuit, client_count: int, mod: int, batch_size: int | None = None,
+                     seeded_inputs: bool = False, free_shares: bool = False, king_party: bool = False) -> CircuitPlan:
+        """Predicts what running the [circuit] with [BGW.run_circuit] costs for [client_count] clients under modulo
+        [mod], with the given [batch_size], [seeded_inputs], [free_shares] and [king_party] settings of the [Client]s,
+        without generating any shares. Only the circuit is compiled and scheduled, so this is cheap enough to decide
+        whether a job should be run at all."""
+
+        if type(circuit) != CompiledCircuit:
+            circuit = BGW.compile_circuit(circuit)
+
+        ops = np.frombuffer(circuit.ops, dtype=np.uint8)
+        owner_ids = np.frombuffer(circuit.a_ids, dtype=np.int64)[ops == OP_INPUT]
+        layers = BGW.schedule(circuit)
+        _, peak_live_shares = BGW.allocate_slots(circuit, layers)
+        interactive = [layer for layer in layers if layer.interactive]
+        round_ids = [layer_id for layer_id, layer in enumerate(layers) if layer.interactive]
+        products = [len(BGW.mult_pairs(circuit, layer.mult_ids)[0]) for layer in interactive]
+        shapes = [BGW.matrix_shapes(circuit, layer.matrix_ids) for layer in interactive]
+        # the shares of a matrix triple, and the rows of masked shares of a matrix product in the layer's message
+        matrix_sizes = [sum(n * k + k * m + n * m for n, k, m in layer) for layer in shapes]
+        matrix_rows = [sum(max(n * k, k * m) for n, k, m in layer) for layer in shapes]
+
+        records = 1 if batch_size is None else batch_size
+        width = BGW.share_width(mod)
+        messages_sent = {}
+        bytes_sent = {}
+
+        def send(sender, size: int, count: int = 1):
+            messages_sent[sender] = messages_sent.get(sender, 0) + count
+            bytes_sent[sender] = bytes_sent.get(sender, 0) + size * count
+
+        # inputs: every owner sends each other client a share of every input, or a 16-byte seed for all of them
+        for owner_id, input_count in zip(*np.unique(owner_ids, return_counts=True)):
+            if seeded_inputs:
+                send(int(owner_id), 16, client_count - 1)
+            else:
+                send(int(owner_id), width * records, int(input_count) * (client_count - 1))
+
+        # triples: one message from the TTP per client, or one per client and layer with free_shares, and the same for
+        # matrix triples
+        for fetches in [products, matrix_sizes]:
+            for fetch in (fetches if free_shares else [sum(fetches)]):
+                if fetch:
+                    send("ttp", (3 if fetches is products else 1) * fetch * records * width, client_count)
+
+        # rounds: every client broadcasts the masked shares of all products of the layer, or sends them to the king of
+        # the round, which sends the opened values back
+        for round_id, layer_rows in zip(round_ids, np.add(products, matrix_rows).tolist()):
+            for client_id in range(client_count):
+                broadcasts = not king_party or client_id == round_id % client_count
+                send(client_id, 2 * layer_rows * records * width, client_count - 1 if broadcasts else 1)
+
+        # outputs: every client sends its share of every output to client 0, which sends the opened outputs back with
+        # king_party
+        output_count = len(circuit.output_ids())
+        for client_id in range(1, client_count):
+            send(client_id, records * width, output_count)
+        if king_party and output_count:
+            send(0, records * width, output_count * (client_count - 1))
+
+        return CircuitPlan(client_count, len(interactive), sum(products) * records,
+                           len(owner_ids) * client_count * records, messages_sent, bytes_sent,
+                           peak_live_shares * records, (peak_live_shares if free_shares else len(circuit)) * records,
+                           len(circuit.matrices) // 4 * records)
+
+    @staticmethod
+    def circuit_stats(circuit: List[Wire]) -> CircuitStats:
+        """Counts the wires of each type in the list of [Wire]s [circuit] and computes its multiplicative depth."""
+
+        counts = {InputWire: 0, AddWire: 0, ConstMultWire: 0, MultWire: 0, InnerProductWire: 0, MatMultWire: 0}
+        depth = []
+        last = None
+
+        for wire in circuit:
+            counts[type(wire)] += 1
+
+            if type(wire) == InputWire:
+                depth.append(0)
+            elif type(wire) == ConstMultWire:
+                depth.append(depth[wire.wire_a_id])
+            elif type(wire) == InnerProductWire:
+                depth.append(max(depth[wire_id] for wire_id in wire.wire_a_ids + wire.wire_b_ids) + 1)
+            elif type(wire) == MatMultWire:
+                # the entries of a product that share their operands also share their depth
+                if last is None or last.wire_a_ids is not wire.wire_a_ids or last.wire_b_ids is not wire.wire_b_ids:
+                    last = wire
+                    last_depth = max(depth[wire_id] for wire_id in wire.wire_a_ids + wire.wire_b_ids) + 1
+                depth.append(last_depth)
+            else:
+                depth.append(max(depth[wire.wire_a_id], depth[wire.wire_b_id]) + (type(wire) == MultWire))
+
+        return CircuitStats(len(circuit), counts[InputWire], counts[AddWire], counts[ConstMultWire], counts[MultWire],
+                            max(depth, default=0), counts[InnerProductWire],
+                            len(BGW.compile_circuit(circuit).matrices) // 4 if counts[MatMultWire] else 0)
+
+    @staticmethod
+    def optimize_circuit(circuit: List[Wire]) -> OptimizedCircuit:
+        """Rewrites the list of [Wire]s [circuit] into an equivalent circuit that needs fewer Beaver triples and fewer
+        rounds. The rewrites hold over the integers, so the result is equivalent under every modulo:
+
+        - constant folding: `1 * A` becomes `A`, `c * (d * A)` becomes `(c * d) * A`, `A + A` and `c * A + d * A`
+          become `(c + d) * A`, and constants are pulled out of products, i.e. `(c * A) * B` becomes `c * (A * B)`;
+        - common subexpression elimination: wires that compute the same operation on the same operands (in either
+          order, for the commutative gates) are merged;
+        - dead-wire elimination: wires that no output depends on are dropped, including unused inputs;
+        - product rebalancing: a chain of [MultWire]s whose intermediate products are not used anywhere else, like
+          `((A * B) * C) * D`, is rebuilt as a tree that always multiplies the two shallowest factors first, which
+          lowers the multiplicative depth without adding multiplications.
+
+        [InnerProductWire]s are kept as they are, with their pairs in a canonical order so that equal inner products are
+        merged as well, and so are the matrix products of [MatMultWire]s."""
+
+        def build(kinds: list, args: list, depths: list, keys: dict, kind: str, a: int, b: int = 0) -> int:
+            """Adds the node `kind(a, b)` to the node table [kinds], [args], [depths] after folding constants, unless
+            the table already has it ([keys] maps every node to its ID). Returns the ID of the resulting node. For
+            `"cmul"` nodes [a] is the constant, for `"input"` nodes [b] is the original wire ID, and for `"dot"` nodes [a]
+            and [b] are tuples of the `A` and `B` nodes of the pairs. A `"matrix"` node is a whole matrix product, with
+            the tuples of the nodes of `A` and `B` in [a] and the inner dimension in [b]; an `"entry"` node is entry [b]
+            of matrix node [a]."""
+
+            if kind == "cmul":
+                if a == 1:
+                    return b
+                if kinds[b] == "cmul":
+                    return build(kinds, args, depths, keys, "cmul", a * args[b][0], args[b][1])
+            elif kind == "add":
+                # c * A + d * A = (c + d) * A
+                (c, x), (d, y) = [args[n] if kinds[n] == "cmul" else (1, n) for n in (a, b)]
+                if x == y:
+                    return build(kinds, args, depths, keys, "cmul", c + d, x)
+                a, b = min(a, b), max(a, b)
+            elif kind == "mul":
+                # (c * A) * B = c * (A * B)
+                (c, x), (d, y) = [args[n] if kinds[n] == "cmul" else (1, n) for n in (a, b)]
+                if c != 1 or d != 1:
+                    return build(kinds, args, depths, keys, "cmul", c * d, build(kinds, args, depths, keys, "mul", x, y))
+                a, b = min(a, b), max(a, b)
+            elif kind == "dot":
+                a, b = map(tuple, zip(*sorted((min(x, y), max(x, y)) for x, y in zip(a, b))))
+
+            key = (kind, a, b)
+            if key not in keys:
+                keys[key] = len(kinds)
+                kinds.append(kind)
+                args.append((a, b))
+
+                if kind == "input":
+                    depths.append(0)
+                elif kind == "cmul":
+                    depths.append(depths[b])
+                elif kind == "dot":
+                    depths.append(max(depths[node] for node in a + b) + 1)
+                elif kind == "matrix":
+                    depths.append(max(depths[node] for node in a[0] + a[1]) + 1)
+                elif kind == "entry":
+                    depths.append(depths[a])
+                else:
+                    depths.append(max(depths[a], depths[b]) + (kind == "mul"))
+
+            return keys[key]
+
+        def operands(kinds: list, args: list, node: int) -> List[int]:
+            """Returns the nodes that [node] depends on."""
+
+            if kinds[node] == "input":
+                return []
+            elif kinds[node] == "cmul":
+                return [args[node][1]]
+            elif kinds[node] == "dot":
+                return list(args[node][0] + args[node][1])
+            elif kinds[node] == "matrix":
+                return list(args[node][0][0] + args[node][0][1])
+            elif kinds[node] == "entry":
+                return [args[node][0]]
+            else:
+                return list(args[node])
+
+        # 1. fold constants and merge common subexpressions
+        kinds, args, depths, keys = [], [], [], {}
+        nodes = []
+        """original wire ID -> node"""
+        matrix_wire = None
+        """The first [MatMultWire] of the matrix product whose entries are being read"""
+
+        for wire_index, wire in enumerate(circuit):
+            if type(wire) == InputWire:
+                nodes.append(build(kinds, args, depths, keys, "input", wire.owner_id, wire_index))
+            elif type(wire) == AddWire:
+                nodes.append(build(kinds, args, depths, keys, "add", nodes[wire.wire_a_id], nodes[wire.wire_b_id]))
+            elif type(wire) == ConstMultWire:
+                nodes.append(build(kinds, args, depths, keys, "cmul", wire.c, nodes[wire.wire_a_id]))
+            elif type(wire) == MultWire:
+                nodes.append(build(kinds, args, depths, keys, "mul", nodes[wire.wire_a_id], nodes[wire.wire_b_id]))
+            elif type(wire) == InnerProductWire:
+                nodes.append(build(kinds, args, depths, keys, "dot", tuple(nodes[i] for i in wire.wire_a_ids),
+                                   tuple(nodes[i] for i in wire.wire_b_ids)))
+            elif type(wire) == MatMultWire:
+                if matrix_wire is None or matrix_wire.wire_a_ids is not wire.wire_a_ids or \
+                        matrix_wire.wire_b_ids is not wire.wire_b_ids or matrix_wire.inner != wire.inner:
+                    matrix_wire = wire
+                    matrix = build(kinds, args, depths, keys, "matrix", (tuple(nodes[i] for i in wire.wire_a_ids),
+                                                                         tuple(nodes[i] for i in wire.wire_b_ids)),
+                                   wire.inner)
+                columns = len(wire.wire_b_ids) // wire.inner
+                nodes.append(build(kinds, args, depths, keys, "entry", matrix, wire.row * columns + wire.column))
+            else:
+                raise ValueError(f"Wire {wire_index} has unsupported type {type(wire).__name__}.")
+
+        output_ids = [wire_index for wire_index, wire in enumerate(circuit) if wire.is_output]
+
+        # 2. find the live nodes, and the products that only feed into a single other product
+        uses = [0] * len(kinds)
+        is_root = [False] * len(kinds)
+        live = [False] * len(kinds)
+
+        for wire_index in output_ids:
+            live[nodes[wire_index]] = True
+            is_root[nodes[wire_index]] = True
+
+        for node in reversed(range(len(kinds))):
+            if live[node]:
+                for operand in operands(kinds, args, node):
+                    live[operand] = True
+                    uses[operand] += 1
+                    if kinds[node] != "mul":
+                        is_root[operand] = True
+
+        is_root = [is_root[node] or uses[node] > 1 or kinds[node] != "mul" for node in range(len(kinds))]
+
+        # 3. rebuild the live nodes, with balanced product trees
+        new_kinds, new_args, new_depths, new_keys = [], [], [], {}
+        new_nodes = {}
+        """node -> node in the rebuilt table"""
+
+        for node in range(len(kinds)):
+            if not live[node] or not is_root[node]:
+                continue
+
+            kind, (a, b) = kinds[node], args[node]
+
+            if kind == "input":
+                new_nodes[node] = build(new_kinds, new_args, new_depths, new_keys, "input", a, b)
+            elif kind == "cmul":
+                new_nodes[node] = build(new_kinds, new_args, new_depths, new_keys, "cmul", a, new_nodes[b])
+            elif kind == "add":
+                new_nodes[node] = build(new_kinds, new_args, new_depths, new_keys, "add", new_nodes[a], new_nodes[b])
+            elif kind == "dot":
+                new_nodes[node] = build(new_kinds, new_args, new_depths, new_keys, "dot",
+                                        tuple(new_nodes[x] for x in a), tuple(new_nodes[y] for y in b))
+            elif kind == "matrix":
+                new_nodes[node] = build(new_kinds, new_args, new_depths, new_keys, "matrix",
+                                        (tuple(new_nodes[x] for x in a[0]), tuple(new_nodes[y] for y in a[1])), b)
+            elif kind == "entry":
+                new_nodes[node] = build(new_kinds, new_args, new_depths, new_keys, "entry", new_nodes[a], b)
+            else:
+                factors = []
+                stack = [a, b]
+                while stack:
+                    factor = stack.pop()
+                    if is_root[factor]:
+                        factor = new_nodes[factor]
+                        factors.append((new_depths[factor], factor))
+                    else:
+                        stack.extend(args[factor])
+
+                heapq.heapify(factors)
+                while len(factors) > 1:
+                    (_, x), (_, y) = heapq.heappop(factors), heapq.heappop(factors)
+                    product = build(new_kinds, new_args, new_depths, new_keys, "mul", x, y)
+                    heapq.heappush(factors, (new_depths[product], product))
+
+                new_nodes[node] = factors[0][1]
+
+        # 4. emit the wires of the rebuilt nodes that are still needed, in topological order
+        outputs = {new_nodes[nodes[wire_index]] for wire_index in output_ids}
+        needed = [False] * len(new_kinds)
+        for node in outputs:
+            needed[node] = True
+        for node in reversed(range(len(new_kinds))):
+            if needed[node]:
+                for operand in operands(new_kinds, new_args, node):
+                    needed[operand] = True
+
+        optimized = []
+        wire_ids = {}
+        """node in the rebuilt table -> wire ID in [optimized]"""
+        matrix_wire_ids = {}
+        """matrix node -> the wire IDs of its `A` and `B`, shared by the [MatMultWire]s of its entries"""
+
+        for node in range(len(new_kinds)):
+            # matrix products are not wires themselves, only their entries are
+            if not needed[node] or new_kinds[node] == "matrix":
+                continue
+
+            kind, (a, b) = new_kinds[node], new_args[node]
+            is_output = node in outputs
+            wire_ids[node] = len(optimized)
+
+            if kind == "input":
+                optimized.append(InputWire(is_output=is_output, owner_id=a))
+            elif kind == "add":
+                optimized.append(AddWire(is_output=is_output, wire_a_id=wire_ids[a], wire_b_id=wire_ids[b]))
+            elif kind == "cmul":
+                optimized.append(ConstMultWire(is_output=is_output, c=a, wire_a_id=wire_ids[b]))
+            elif kind == "dot":
+                optimized.append(InnerProductWire(is_output=is_output, wire_a_ids=[wire_ids[x] for x in a],
+                                                  wire_b_ids=[wire_ids[y] for y in b]))
+            elif kind == "entry":
+                (matrix_a, matrix_b), inner = new_args[a]
+                if a not in matrix_wire_ids:
+                    matrix_wire_ids[a] = ([wire_ids[x] for x in matrix_a], [wire_ids[y] for y in matrix_b])
+                row, column = divmod(b, len(matrix_b) // inner)
+                optimized.append(MatMultWire(is_output=is_output, wire_a_ids=matrix_wire_ids[a][0],
+                                             wire_b_ids=matrix_wire_ids[a][1], inner=inner, row=row, column=column))
+            else:
+                optimized.append(MultWire(is_output=is_output, wire_a_id=wire_ids[a], wire_b_id=wire_ids[b]))
+
+        wire_map = {}
+        for wire_index, wire in enumerate(circuit):
+            node = new_nodes.get(nodes[wire_index])
+            if (wire.is_output or type(wire) == InputWire) and node is not None and needed[node]:
+                wire_map[wire_index] = wire_ids[node]
+
+        return OptimizedCircuit(optimized, wire_map, output_ids, BGW.circuit_stats(circuit),
+                                BGW.circuit_stats(optimized))
+
+    @staticmethod
+    def matrix_mult(circuit: List[Wire], a_ids: List[int], b_ids: List[int], inner: int, is_output: bool = False) \
+            -> List[int]:
+        """Appends the [MatMultWire]s of the product of the `n x inner` matrix of wires [a_ids] and the `inner x m`
+        matrix of wires [b_ids] (both row by row) to the list of [Wire]s [circuit]. Returns the IDs of the `n * m`
+        entries of the product, row by row."""
+
+        a_ids, b_ids = list(a_ids), list(b_ids)
+        n, m = len(a_ids) // inner, len(b_ids) // inner
+        start = len(circuit)
+
+        for row in range(n):
+            for column in range(m):
+                circuit.append(MatMultWire(is_output=is_output, wire_a_ids=a_ids, wire_b_ids=b_ids, inner=inner,
+                                           row=row, column=column))
+
+        return list(range(start, len(circuit)))
+
+    @staticmethod
+    def matrix_product(circuit: CompiledCircuit, product: int) \
+            -> Tuple[int, int, int, np.ndarray, np.ndarray, np.ndarray]:
+        """Returns the dimensions `n`, `k` and `m` of matrix product [product] of the [circuit], and the wires of its
+        `A`, its `B` and its entries (`-1` where no wire holds an entry), each row by row."""
+
+        offset, n, k, m = circuit.matrices[4 * product:4 * product + 4]
+        wires = np.frombuffer(circuit.matrix_wires, dtype=np.int64)[offset:offset + n * k + k * m + n * m]
 
+        return n, k, m, wires[:n * k], wires[n * k:n * k + k * m], wires[n * k + k * m:]
+
+    @staticmethod
+    def matrix_shapes(circuit: CompiledCircuit, products: np.ndarray) -> List[Tuple[int, int, int]]:
+        """Returns the dimensions `(n, k, m)` of the matrix [products] of the [circuit]."""
+
+        return [tuple(circuit.matrices[4 * product + 1:4 * product + 4]) for product in np.asarray(products).tolist()]
+
+    @staticmethod
+    def mult_pairs(circuit: CompiledCircuit, wire_ids: np.ndarray) \
+            -> Tuple[np.ndarray, np.ndarray, np.ndarray, np.ndarray]:
+        """Lists the products `A * B` that the [MultWire]s and [InnerProductWire]s [wire_ids] of the [circuit] are made
+        of: one per [MultWire] and one per pair of an [InnerProductWire], in the order of [wire_ids]. Every product needs
+        its own row of triple shares and of masked shares, identified by a key: the wire ID for a [MultWire], and
+        `len(circuit)` plus the index of the pair in [CompiledCircuit.inner_a_ids] for a pair of an
+        [InnerProductWire]. Returns the keys, the `A` wires and the `B` wires of the products, and the number of
+        products of every wire of [wire_ids]."""
+
+        wire_ids = np.asarray(wire_ids, dtype=np.intp)
+        ops = np.frombuffer(circuit.ops, dtype=np.uint8)[wire_ids]
+        a_ids = np.frombuffer(circuit.a_ids, dtype=np.int64)[wire_ids]
+        b_ids = np.frombuffer(circuit.b_ids, dtype=np.int64)[wire_ids]
+        is_inner = ops == OP_INNER_PRODUCT
+
+        if not is_inner.any():
+            return wire_ids, a_ids, b_ids, np.ones(len(wire_ids), dtype=np.int64)
+
+        # pair `j` of an inner product that starts at pair `start` is pair `start + j` of the circuit
+        sizes = np.where(is_inner, b_ids, 1)
+        owners = np.repeat(np.arange(len(wire_ids)), sizes)
+        positions = np.arange(len(owners)) - np.repeat(np.cumsum(sizes) - sizes, sizes)
+        is_pair = is_inner[owners]
+        pairs = np.where(is_pair, a_ids[owners] + positions, 0)
+
+        keys = np.where(is_pair, len(circuit) + pairs, wire_ids[owners])
+        a_wires = np.where(is_pair, np.frombuffer(circuit.inner_a_ids, dtype=np.int64)[pairs], a_ids[owners])
+        b_wires = np.where(is_pair, np.frombuffer(circuit.inner_b_ids, dtype=np.int64)[pairs], b_ids[owners])
+
+        return keys, a_wires, b_wires, sizes
+
+    @staticmethod
+    def schedule(circuit: CompiledCircuit) -> List[Layer]:
+        """Groups the wires of the [circuit] into [Layer]s by multiplicative depth, so that all [MultWire]s that do not
+        depend on each other are opened in the same round. Layer `d` contains the linear wires at depth `d` and the
+        [MultWire]s and [InnerProductWire]s at depth `d + 1`, so the number of rounds equals the multiplicative depth of
+        the circuit."""
+
+        ops, a_ids, b_ids = circuit.ops, circuit.a_ids, circuit.b_ids
+        inner_a_ids, inner_b_ids = circuit.inner_a_ids, circuit.inner_b_ids
+        matrix_ids = [[]]
+        matrix_depths = {}
+        """matrix product -> the depth of its entries"""
+        depth = array("l", bytes(len(ops) * array("l").itemsize))
+        # 1 + the wave of a linear wire within its layer, 0 for inputs and multiplications
+        wave = array("l", bytes(len(ops) * array("l").itemsize))
+        linear_waves = [[]]
+        mult_ids = [[]]
+
+        for wire_index in range(len(ops)):
+            op = ops[wire_index]
+
+            if op == OP_INPUT:
+                continue
+            elif op == OP_ADD:
+                a, b = a_ids[wire_index], b_ids[wire_index]
+                d = max(depth[a], depth[b])
+                w = max(wave[a] if depth[a] == d else 0, wave[b] if depth[b] == d else 0)
+            elif op == OP_CONST_MULT:
+                d = depth[a_ids[wire_index]]
+                w = wave[a_ids[wire_index]]
+            elif op == OP_INNER_PRODUCT:
+                start, end = a_ids[wire_index], a_ids[wire_index] + b_ids[wire_index]
+                d = max(max(depth[wire_id] for wire_id in inner_a_ids[start:end]),
+                        max(depth[wire_id] for wire_id in inner_b_ids[start:end])) + 1
+                w = -1
+            elif op == OP_MATRIX_MULT:
+                product = a_ids[wire_index]
+                if product not in matrix_depths:
+                    _, _, _, a_wires, b_wires, _ = BGW.matrix_product(circuit, product)
+                    matrix_depths[product] = max(depth[wire_id] for wire_id in np.concatenate([a_wires, b_wires])) + 1
+                d = matrix_depths[product]
+                w = -1
+            else:
+                d = max(depth[a_ids[wire_index]], depth[b_ids[wire_index]]) + 1
+                w = -1
+
+            depth[wire_index] = d
+            wave[wire_index] = w + 1
+            while len(linear_waves) <= d:
+                linear_waves.append([])
+                mult_ids.append([])
+                matrix_ids.append([])
+
+            if op == OP_MULT or op == OP_INNER_PRODUCT:
+                mult_ids[d - 1].append(wire_index)
+            elif op == OP_MATRIX_MULT:
+                # the entries of a product are consecutive, so it only has to be compared with the last one
+                if not matrix_ids[d - 1] or matrix_ids[d - 1][-1] != a_ids[wire_index]:
+                    matrix_ids[d - 1].append(a_ids[wire_index])
+            else:
+                while len(linear_waves[d]) <= w:
+                    linear_waves[d].append([])
+                linear_waves[d][w].append(wire_index)
+
+        return [Layer([np.array(ids, dtype=np.intp) for ids in waves], np.array(mults, dtype=np.intp),
+                      np.array(products, dtype=np.intp))
+                for waves, mults, products in zip(linear_waves, mult_ids, matrix_ids)]
+
+    @staticmethod
+    def allocate_slots(circuit: CompiledCircuit, layers: List[Layer]) -> Tuple[np.ndarray, int]:
+        """Assigns every wire of the [circuit] a slot in the share storage of a client, such that wires that are alive
+        at the same time get different slots. A wire is alive from the [Layer] of [layers] that computes it until the
+        last layer that reads it; output wires stay alive until the end. Slots are only handed out again in a later
+        layer, so the order in which a layer is evaluated does not matter. The number of slots is at most the number of
+        wires that are alive during any single layer, which follows the width of the circuit rather than its size.
+        Returns the slot of every wire and the number of slots."""
+
+        ops = np.frombuffer(circuit.ops, dtype=np.uint8)
+        a_ids = np.frombuffer(circuit.a_ids, dtype=np.int64)
+        b_ids = np.frombuffer(circuit.b_ids, dtype=np.int64)
+        wire_count = len(ops)
+
+        # the layer that computes each wire, -1 for inputs (they are shared during setup)
+        defined_in = np.full(wire_count, -1, dtype=np.intp)
+        matrix_operands = []
+        """(layer, operand wires) of every matrix product"""
+
+        for layer_index, layer in enumerate(layers):
+            for wave in layer.linear_waves:
+                defined_in[wave] = layer_index
+            defined_in[layer.mult_ids] = layer_index
+
+            for product in layer.matrix_ids.tolist():
+                _, _, _, a_wires, b_wires, entries = BGW.matrix_product(circuit, product)
+                defined_in[entries[entries >= 0]] = layer_index
+                matrix_operands.append((layer_index, np.concatenate([a_wires, b_wires])))
+
+        # the last layer that reads each wire
+        last_used_in = defined_in.copy()
+        is_binary = (ops == OP_ADD) | (ops == OP_MULT)
+        is_unary = is_binary | (ops == OP_CONST_MULT)
+        inner_ids = np.flatnonzero(ops == OP_INNER_PRODUCT)
+        # every pair of an inner product is read by its wire
+        pair_readers = np.repeat(inner_ids, b_ids[inner_ids])
+        for operands, readers in [(a_ids[is_unary], np.flatnonzero(is_unary)),
+                                  (b_ids[is_binary], np.flatnonzero(is_binary)),
+                                  (np.frombuffer(circuit.inner_a_ids, dtype=np.int64), pair_readers),
+                                  (np.frombuffer(circuit.inner_b_ids, dtype=np.int64), pair_readers)]:
+            np.maximum.at(last_used_in, operands, defined_in[readers])
+        for layer_index, operands in matrix_operands:
+            np.maximum.at(last_used_in, operands, layer_index)
+
+        outputs = np.unpackbits(np.frombuffer(circuit.outputs, dtype=np.uint8), bitorder="little")[:wire_count]
+        last_used_in[outputs.astype(bool)] = len(layers)
+
+        # the wires computed in (and last read in) layer `i - 1` are `by_definition[definitions[i]:definitions[i + 1]]`
+        # (and `by_last_use[releases[i]:releases[i + 1]]`)
+        by_definition = np.argsort(defined_in, kind="stable")
+        by_last_use = np.argsort(last_used_in, kind="stable")
+        definitions = np.searchsorted(defined_in[by_definition], np.arange(-1, len(layers) + 1))
+        releases = np.searchsorted(last_used_in[by_last_use], np.arange(-1, len(layers) + 1))
+
+        slots = np.empty(wire_count, dtype=np.intp)
+        free = []
+        slot_count = 0
+
+        for i in range(len(layers) + 1):
+            for wire_index in by_definition[definitions[i]:definitions[i + 1]].tolist():
+                if free:
+                    slots[wire_index] = free.pop()
+                else:
+                    slots[wire_index] = slot_count
+                    slot_count += 1
+
+            free.extend(slots[by_last_use[releases[i]:releases[i + 1]]].tolist())
+
+        return slots, slot_count
 
     # ######################## LAST ########################
     @staticmethod
-    def run_circuit(clients: List[Client]) -> Dict[int, int]:
+    def run_circuit(clients: List[Client], return_metrics: bool = False) \
+            -> Dict[int, int] | Tuple[Dict[int, int], RunMetrics]:
         """Makes the [clients] interactively compute their circuit by synchronously invoking their methods, and returns
-        all outputs of the circuit."""
+        all outputs of the circuit. The circuit is evaluated one [Layer] at a time, so the number of rounds (recorded in
+        `COUNT_BGW_rounds`) follows the multiplicative depth of the circuit rather than the number of [MultWire]s.
 
-        client_pos = {}
-        
+        If [return_metrics] is `True`, the [RunMetrics] of this run are returned along with the outputs."""
 
+        metrics = RunMetrics()
         for client in clients:
-            client.set_clients(clients)
-            client.local_setup() #  already in the client.run_circuit_until_mult
+            client.metrics = metrics
 
-        for client in clients:
-            client.interactive_setup() # already in the client.run_circuit_until_mult
-            
-            client_pos[client.client_id] = 0
+        with metrics.phase("preprocessing"):
+            # every distinct circuit is compiled only once and shared by the clients that run it
+            compiled = {}
+            for client in clients:
+                if type(client.circuit) != CompiledCircuit:
+                    if id(client.circuit) not in compiled:
+                        compiled[id(client.circuit)] = BGW.compile_circuit(client.circuit)
+                    client.circuit = compiled[id(client.circuit)]
+
+            # offline phase: all Beaver triples are generated before any input is shared
+            circuit = clients[0].circuit
+            ops = np.frombuffer(circuit.ops, dtype=np.uint8)
+            keys, _, _, sizes = BGW.mult_pairs(circuit, np.flatnonzero((ops == OP_MULT) | (ops == OP_INNER_PRODUCT)))
+            if type(clients[0].ttp) == TripleProducer:
+                clients[0].ttp.metrics = metrics
+            clients[0].ttp.preprocess(keys, sizes)
+            if len(circuit.matrices):
+                products = np.arange(len(circuit.matrices) // 4)
+                clients[0].ttp.preprocess_matrices(products, BGW.matrix_shapes(circuit, products))
+
+        with metrics.phase("setup"):
+            board = KingBoard(len(clients)) if clients[0].king_party else BroadcastBoard(len(clients))
 
+            for client in clients:
+                client.set_clients(clients, board)
+                client.local_setup()
 
-        while 1:
             for client in clients:
-                # if client_pos[client.client_id] != None:
-                client_pos[client.client_id] = client.run_circuit_until_mult(client_pos[client.client_id]) 
+                client.interactive_setup()
 
-            # # if all clients done
-            if all(client_pos[client.client_id] == None for client in clients):
-                break
+        with metrics.phase("online"):
+            for layer_index, layer in enumerate(clients[0].layers):
+                start = time.perf_counter()
 
-            
+                for client in clients:
+                    client.run_layer_until_mult(layer_index)
+
+                # all masked shares of this layer are opened in a single round
+                if layer.interactive:
+                    global COUNT_BGW_rounds
+                    COUNT_BGW_rounds += 1
+
+                    for client in clients:
+                        client.open_layer(layer_index)
 
-        return clients[0].get_outputs()
+                    metrics.record_round(time.perf_counter() - start)
 
-            # for client in clients:
+        with metrics.phase("output"):
+            outputs = clients[0].get_outputs()
 
-            #     # do the final computation
-            #     to_be_continued = client.run_circuit_until_mult(to_be_continued) 
+        if return_metrics:
+            return outputs, metrics
+
+        return outputs
 
 
 
 class TTP:
-    """A trusted third party that can be trusted to generate Beaver triples."""
+    """A trusted third party that can be trusted to generate Beaver triples. The triples are generated in bulk during an
+    offline phase (see [preprocess]), before any inputs are known, and handed out from a pool during the online phase."""
 
-    def __init__(self, client_count: int, mod: int, rng: SystemRandom):
+    def __init__(self, client_count: int, mod: int, rng: SystemRandom, batch_size: int | None = None):
         """Initializes this [TTP], given the number of clients [client_count] participating in the protocol, the modulo
-        [mod] to perform secret sharing under, and a source of randomness [rng]."""
+        [mod] to perform secret sharing under, and a source of randomness [rng]. If [batch_size] is given, the clients
+        evaluate their circuit on that many records at once, and every multiplication gate gets one triple per
+        record."""
         
 
         self.mod = mod
         self.rng = rng
         self.client_count = client_count
+        self.batch_size = batch_size
+        self.batch_shape = () if batch_size is None else (batch_size,)
+
+        self.beaver_triples = np.zeros((client_count, 0, 3) + self.batch_shape, dtype=BGW.dtype(mod))
+        """The pool of pre-generated triple shares, where `beaver_triples[client_id][i]` holds the shares of `X`, `Y` and
+        `Z` of the `i`-th triple (or batch of triples) for [client_id]"""
+
+        self.triple_index = {}
+        """wire_id -> the index of the triple in [beaver_triples] that belongs to that multiplication gate"""
+
+        self.matrix_triples = {}
+        """matrix product -> the shares of its matrix triple `X`, `Y` and `Z = X * Y`, where `matrix_triples[p][0]` has
+        the shares of `X` of all clients, with shape `(client_count, n, k) + batch_shape`"""
+
+    def preprocess(self, wire_ids: np.ndarray, sizes: np.ndarray | None = None):
+        """Performs the offline phase for the multiplication gates [wire_ids]: generates all of their Beaver triples and
+        the shares thereof at once with a few vectorized operations. Gates that already have a triple are skipped.
+
+        If [sizes] is given, the [wire_ids] are the keys of the products of inner products (see [BGW.mult_pairs]), and
+        every group of [sizes] consecutive keys gets an inner-product triple instead: random `X_j` and `Y_j` for every
+        key, and shares of `Z = X_1 * Y_1 + ... + X_n * Y_n` in the row of the first key, while the `Z` of the others
+        is `0`."""
+
+        if sizes is None:
+            sizes = np.ones(len(wire_ids), dtype=np.int64)
+
+        starts = np.cumsum(sizes) - sizes
+        is_new = np.array([int(wire_id) not in self.triple_index for wire_id in np.asarray(wire_ids)[starts]],
+                          dtype=bool)
+        wire_ids = np.asarray(wire_ids)[np.repeat(is_new, sizes)].tolist()
+        if not wire_ids:
+            return
+
+        shares = self.generate_triples(np.asarray(sizes)[is_new])
+
+        for i, wire_id in enumerate(wire_ids):
+            self.triple_index[wire_id] = self.beaver_triples.shape[1] + i
+
+        self.beaver_triples = np.concatenate([self.beaver_triples, shares], axis=1)
 
-        self.beaver_triples = {}
+    def preprocess_matrices(self, products: np.ndarray, shapes: List[Tuple[int, int, int]]):
+        """Generates the matrix triples of the matrix [products], whose dimensions `(n, k, m)` are given by [shapes]: a
+        random `n x k` matrix `X`, a random `k x m` matrix `Y` and `Z = X * Y`, and the shares thereof. Products that
+        already have a triple are skipped."""
+
+        for product, (n, k, m) in zip(np.asarray(products).tolist(), shapes):
+            if product in self.matrix_triples:
+                continue
+
+            X = BGW.random_batch(self.rng, (n, k) + self.batch_shape, self.mod)
+            Y = BGW.random_batch(self.rng, (k, m) + self.batch_shape, self.mod)
+            Z = BGW.matmul_batch(X, Y, self.mod)
+
+            self.matrix_triples[product] = tuple(BGW.create_shares_batch(self.rng, matrix, self.client_count, self.mod)
+                                                 for matrix in [X, Y, Z])
+
+    def get_matrix_triples(self, products: np.ndarray, shapes: List[Tuple[int, int, int]], client_id: int) \
+            -> List[Tuple[np.ndarray, np.ndarray, np.ndarray]]:
+        """Returns the shares of `X`, `Y` and `Z` of the matrix triples of the matrix [products] for [client_id].
+        Triples that were not generated in the offline phase are generated now, with the dimensions [shapes]."""
+
+        self.preprocess_matrices(products, shapes)
+
+        return [tuple(matrix[client_id] for matrix in self.matrix_triples[product])
+                for product in np.asarray(products).tolist()]
+
+    def generate_triples(self, sizes: np.ndarray) -> np.ndarray:
+        """Generates fresh triples without adding them to the pool: an inner-product triple for every group of [sizes]
+        rows (a Beaver triple if the size is `1`), like [preprocess] does. Returns the shares of all clients, with shape
+        `(client_count, sum(sizes), 3) + batch_shape`."""
+
+        count = int(np.sum(sizes))
+        X = BGW.random_batch(self.rng, (count,) + self.batch_shape, self.mod)
+        Y = BGW.random_batch(self.rng, (count,) + self.batch_shape, self.mod)
+        Z = BGW.reduce(X * Y, self.mod)
+
+        if len(sizes) != count:
+            starts = np.cumsum(sizes) - sizes
+            with np.errstate(over="ignore"):
+                sums = BGW.reduce(np.add.reduceat(Z, starts, axis=0), self.mod)
+            Z = np.zeros_like(Z)
+            Z[starts] = sums
+
+        # shape: (client_count, count, 3) + batch_shape
+        shares = BGW.create_shares_batch(self.rng, np.stack([X, Y, Z], axis=1), self.client_count, self.mod)
+
+        if len(sizes) != count:
+            # the Z of the other products of an inner product is a public 0, so everyone's share of it is 0 as well
+            is_rest = np.ones(count, dtype=bool)
+            is_rest[starts] = False
+            shares[:, is_rest, 2] = 0
+
+        return shares
+
+    def get_beaver_triples(self, wire_ids: np.ndarray, client_id: int) -> np.ndarray:
+        """Returns shares of the Beaver triples for the multiplication gates [wire_ids] for [client_id], with one row
+        `[X, Y, Z]` per gate (where each of `X`, `Y` and `Z` is a vector in batch mode). Triples that were not generated
+        in the offline phase are generated now."""
+
+        global COUNT_TTP_get_beaver_triple
+        COUNT_TTP_get_beaver_triple += len(wire_ids)
+
+        self.preprocess(wire_ids)
+
+        return self.beaver_triples[client_id, [self.triple_index[int(wire_id)] for wire_id in wire_ids]]
 
     # def get_beaver_triple(self, wire_id: int, client_id: int) -> [int, int, int]:
     def get_beaver_triple(self, wire_id: int, client_id: int) -> List[int]:
         """Returns shares of the Beaver triple for multiplication gate [wire_id] for [client_id]. Make sure that clients
         requesting shares for the same [wire_id] actually get shares of the same Beaver triple."""
-        
+
+        # hypotize that client_ids are in order (ie alice = 0, bob = 1)
+        return self.get_beaver_triples([wire_id], client_id)[0].tolist()
+
+    def save_triples(self, directory: str) -> List[str]:
+        """Writes the triple shares in the pool to one binary file per client in [directory], so that the online phase
+        can run elsewhere with a [TripleStore] per client instead of this [TTP]. Returns the paths of the files, ordered
+        by client ID. Shares that are Python ints (see [BGW.dtype]) are stored as `uint64`, which holds any share under
+        a modulo up to `2^64`; the header records the dtype that the shares are stored in."""
+
+        dtype = self.beaver_triples.dtype
+        if dtype == object:
+            if self.mod > 1 << 64:
+                raise ValueError(f"Triples under modulo {self.mod} do not fit in 64 bits and cannot be stored.")
+            dtype = np.dtype(np.uint64)
+
+        wire_ids = np.array(sorted(self.triple_index), dtype=np.int64)
+        rows = np.array([self.triple_index[wire_id] for wire_id in wire_ids.tolist()], dtype=np.intp)
+
+        os.makedirs(directory, exist_ok=True)
+        paths = []
+
+        for client_id in range(self.client_count):
+            path = os.path.join(directory, f"triples_{client_id}.bin")
+
+            with open(path, "wb") as file:
+                file.write(TRIPLE_FILE_HEADER.pack(TRIPLE_FILE_MAGIC, dtype.char.encode(), client_id, self.client_count,
+                                                   self.mod % (1 << 64), len(wire_ids), self.batch_size or 0))
+                file.write(wire_ids.tobytes())
+                file.write(np.ascontiguousarray(self.beaver_triples[client_id, rows], dtype=dtype).tobytes())
+
+            paths.append(path)
+
+        return paths
+
+
+class TripleStore:
+    """The Beaver triple shares of a single client, as written by [TTP.save_triples]. The file is memory-mapped, so
+    shares are read straight from the page cache by index without loading or parsing the whole file. A [TripleStore]
+    can be given to a [Client] in place of the [TTP]."""
+
+    def __init__(self, path: str):
+        """Opens the triple file at [path]."""
+
+        with open(path, "rb") as file:
+            magic, dtype, self.client_id, self.client_count, self.mod, count, batch_size = TRIPLE_FILE_HEADER.unpack(
+                file.read(TRIPLE_FILE_HEADER.size))
+        self.mod = self.mod or 1 << 64
+
+        if magic != TRIPLE_FILE_MAGIC:
+            raise ValueError(f"{path} is not a triple file.")
+
+        dtype = np.dtype(dtype.decode())
+        self.batch_size = batch_size or None
+        self.batch_shape = () if self.batch_size is None else (self.batch_size,)
+
+        self.wire_ids = np.memmap(path, dtype=np.int64, mode="r", offset=TRIPLE_FILE_HEADER.size, shape=(count,))
+        """The IDs of the multiplication gates that this file has triples for, in increasing order"""
+
+        self.triples = np.memmap(path, dtype=dtype, mode="r", offset=TRIPLE_FILE_HEADER.size + 8 * count,
+                                 shape=(count, 3) + self.batch_shape)
+        """`triples[i]` holds the shares of `X`, `Y` and `Z` for multiplication gate `wire_ids[i]`"""
+
+        self.dtype = BGW.dtype(self.mod)
+        """The dtype that the clients keep shares in, which differs from that of [triples] if they are Python ints"""
+
+    def preprocess(self, wire_ids: np.ndarray, sizes: np.ndarray | None = None):
+        """Checks that this store has triples for all multiplication gates [wire_ids]; the offline phase already
+        happened when the file was written (the inner-product triples as well, so [sizes] is not needed)."""
+
+        self.rows(wire_ids)
+
+    def rows(self, wire_ids: np.ndarray) -> np.ndarray:
+        """Returns the rows of [triples] that belong to the multiplication gates [wire_ids]."""
+
+        wire_ids = np.asarray(wire_ids, dtype=np.int64)
+        rows = np.minimum(np.searchsorted(self.wire_ids, wire_ids), max(len(self.wire_ids) - 1, 0))
+
+        if len(wire_ids) and (len(self.wire_ids) == 0 or (self.wire_ids[rows] != wire_ids).any()):
+            raise ValueError("The triple file does not contain triples for all requested multiplication gates.")
+
+        return rows
+
+    def get_beaver_triples(self, wire_ids: np.ndarray, client_id: int) -> np.ndarray:
+        """Returns shares of the Beaver triples for the multiplication gates [wire_ids] for [client_id], with one row
+        `[X, Y, Z]` per gate, in the order of [wire_ids], which need not be sorted. If the gates are stored next to each
+        other in that order and the shares are not Python ints, the result is a view of the file."""
+
+        if client_id != self.client_id:
+            raise ValueError(f"This triple file belongs to client {self.client_id}, not to client {client_id}.")
+
         global COUNT_TTP_get_beaver_triple
-        COUNT_TTP_get_beaver_triple += 1
+        COUNT_TTP_get_beaver_triple += len(wire_ids)
+
+        rows = self.rows(wire_ids)
 
-        if wire_id not in self.beaver_triples:
-            X = self.rng.randint(1, 10)
-            Y = self.rng.randint(1, 10)
-            Z = (X * Y) % self.mod # not sure about the mod
+        # the keys of a layer are not always increasing (those of inner products come after all wire IDs), so a slice
+        # is only taken if the rows really are consecutive and in the requested order
+        if len(rows) and (np.diff(rows) == 1).all():
+            triples = self.triples[rows[0]:rows[-1] + 1]
+        else:
+            triples = self.triples[rows]
 
-            self.beaver_triples[wire_id] = [[] for _ in range(self.client_count)]
+        if self.dtype == object:
+            # shares stored as uint64 become Python ints again
+            return triples.astype(object)
 
-            X_shares = BGW.create_shares(self.rng, X, self.client_count, self.mod)
-            Y_shares = BGW.create_shares(self.rng, Y, self.client_count, self.mod)
-            Z_shares = BGW.create_shares(self.rng, Z, self.client_count, self.mod)
+        return triples
 
-            for client in range(self.client_count):
-                
-                self.beaver_triples[wire_id][client].append(X_shares[client])
-                self.beaver_triples[wire_id][client].append(Y_shares[client])
-                self.beaver_triples[wire_id][client].append(Z_shares[client])
-
-            # # array of lists: [client_index][x,y,z]
-            # shares = [[] for _ in range(self.client_count)]
-
-            # # compute shares
-            # for i in range(self.client_count - 1):
-            #     x, y, z = self.rng.randint(1, 10), self.rng.randint(1, 10), self.rng.randint(1, 10)
-            #     X = (X - x) % self.mod
-            #     Y = (Y - y) % self.mod
-            #     Z = (Z - z) % self.mod
-            #     shares[i].append(x)
-            #     shares[i].append(y)
-            #     shares[i].append(z)
-
-            # shares[self.client_count - 1].append(X)
-            # shares[self.client_count - 1].append(Y)
-            # shares[self.client_count - 1].append(Z)
-
-            # # save shares in map
-            # self.beaver_triples[wire_id] = shares
+    def get_beaver_triple(self, wire_id: int, client_id: int) -> List[int]:
+        """Returns shares of the Beaver triple for multiplication gate [wire_id] for [client_id]."""
 
-        # hypotize that client_ids are in order (ie alice = 0, bob = 1)
-        return self.beaver_triples[wire_id][client_id]
-        
+        return self.get_beaver_triples([wire_id], client_id)[0].tolist()
+
+    def preprocess_matrices(self, products: np.ndarray, shapes: List[Tuple[int, int, int]]):
+        """Triple files only hold Beaver triples, so this fails for any matrix [products]."""
+
+        if len(products):
+            raise ValueError("Triple files do not hold matrix triples, use a TTP for circuits with MatMultWires.")
+
+    def get_matrix_triples(self, products: np.ndarray, shapes: List[Tuple[int, int, int]], client_id: int) \
+            -> List[Tuple[np.ndarray, np.ndarray, np.ndarray]]:
+        """Triple files only hold Beaver triples, so this fails for any matrix [products]."""
+
+        self.preprocess_matrices(products, shapes)
+        return []
+
+
+class TripleProducer:
+    """Generates the triples of a [TTP] on a background thread while the clients compute, instead of all of them in the
+    offline phase. [preprocess] only queues the triples; the thread generates them in chunks, in the order they were
+    queued, and puts every chunk in a bounded queue, so it never runs more than [depth] chunks ahead of the clients. A
+    [TripleProducer] can be given to a [Client] in place of the [TTP].
+
+    Clients only wait if they ask for triples that are not generated yet. They benefit most when they take their triples
+    layer by layer (i.e. with `free_shares`): the triples of later layers are then generated during earlier rounds. Only
+    the NumPy part of the generation runs in parallel with the clients, so moduli whose shares do not fit in 64 bits
+    (which are generated in pure Python) gain little."""
+
+    def __init__(self, ttp: TTP, depth: int = 4, chunk_size: int = 4096):
+        """Initializes a producer that generates triples with [ttp], in chunks of about [chunk_size] triples, at most
+        [depth] chunks ahead of the clients."""
+
+        self.ttp = ttp
+        self.client_count = ttp.client_count
+        self.mod = ttp.mod
+        self.batch_size = ttp.batch_size
+        self.depth = depth
+        self.chunk_size = chunk_size
+
+        self.queue = queue.Queue(maxsize=depth)
+        """The chunks that were generated but not taken by a client yet, as `(chunk_index, shares)`"""
+
+        self.chunks = {}
+        """chunk_index -> the shares of that chunk, `(client_count, rows, 3) + batch_shape`, as long as some client still
+        needs them"""
+
+        self.remaining = {}
+        """chunk_index -> the number of rows of that chunk that clients have yet to take, over all clients"""
+
+        self.keys = np.zeros(0, dtype=np.int64)
+        self.key_chunks = np.zeros(0, dtype=np.intp)
+        self.key_rows = np.zeros(0, dtype=np.intp)
+        """The queued keys in increasing order, and the chunk and row within the chunk of each of them"""
+
+        self.lock = threading.Lock()
+        self.thread = None
+
+        self.metrics = None
+        """The [RunMetrics] to record how long clients wait for triples and how full the queue is in, set by
+        [BGW.run_circuit]"""
+
+        self.stall_seconds = 0.0
+        """The total time that clients waited for triples that were not generated yet"""
+
+        self.queue_depths = []
+        """The number of generated chunks that were waiting in the queue whenever a client asked for triples"""
+
+    def preprocess(self, wire_ids: np.ndarray, sizes: np.ndarray | None = None):
+        """Queues the triples for the multiplication gates [wire_ids] (the keys of [BGW.mult_pairs], with [sizes] as in
+        [TTP.preprocess]) and starts generating them in the background. Can only be called once."""
+
+        if self.thread is not None:
+            raise ValueError("The triples of this producer have already been queued.")
+
+        wire_ids = np.asarray(wire_ids, dtype=np.int64)
+        if sizes is None:
+            sizes = np.ones(len(wire_ids), dtype=np.int64)
+
+        # chunks end with the inner product in which every [chunk_size]-th triple falls, so no inner product is split
+        ends = np.cumsum(sizes, dtype=np.int64)
+        targets = np.arange(self.chunk_size, ends[-1] if len(ends) else 0, self.chunk_size)
+        chunk_ends = np.unique(np.append(ends[np.searchsorted(ends, targets)], ends[-1:]))
+        chunk_starts = np.concatenate([[0], chunk_ends[:-1]]).astype(np.int64)
+
+        chunk_of = np.repeat(np.arange(len(chunk_ends)), chunk_ends - chunk_starts)
+        order = np.argsort(wire_ids, kind="stable")
+        self.keys = wire_ids[order]
+        self.key_chunks = chunk_of[order]
+        self.key_rows = (np.arange(len(wire_ids)) - chunk_starts[chunk_of])[order]
+        self.remaining = {chunk_index: int(end - start) * self.client_count
+                          for chunk_index, (start, end) in enumerate(zip(chunk_starts, chunk_ends))}
+
+        group_ends = np.searchsorted(ends, chunk_ends, side="right")
+        group_starts = np.concatenate([[0], group_ends[:-1]]).astype(np.int64)
+        chunk_sizes = [np.asarray(sizes)[start:end] for start, end in zip(group_starts, group_ends)]
+
+        self.thread = threading.Thread(target=self.produce, args=(chunk_sizes,), daemon=True)
+        self.thread.start()
+
+    def produce(self, chunk_sizes: List[np.ndarray]):
+        """The body of the background thread: generates the chunks of triples with the given group sizes in order, and
+        blocks whenever the queue is full."""
+
+        try:
+            for chunk_index, sizes in enumerate(chunk_sizes):
+                self.queue.put((chunk_index, self.ttp.generate_triples(sizes)))
+        except BaseException as error:
+            self.queue.put((None, error))
+
+    def get_beaver_triples(self, wire_ids: np.ndarray, client_id: int) -> np.ndarray:
+        """Returns shares of the Beaver triples for the multiplication gates [wire_ids] for [client_id], like
+        [TTP.get_beaver_triples], waiting for them to be generated if necessary. Every client may take every triple
+        only once, after which the producer forgets it."""
+
+        global COUNT_TTP_get_beaver_triple
+        COUNT_TTP_get_beaver_triple += len(wire_ids)
+
+        wire_ids = np.asarray(wire_ids, dtype=np.int64)
+        positions = np.minimum(np.searchsorted(self.keys, wire_ids), max(len(self.keys) - 1, 0))
+        if len(wire_ids) and (len(self.keys) == 0 or (self.keys[positions] != wire_ids).any()):
+            raise ValueError("The producer has not queued triples for all requested multiplication gates.")
+
+        chunk_ids = self.key_chunks[positions]
+        rows = self.key_rows[positions]
+        needed = np.unique(chunk_ids).tolist()
+
+        with self.lock:
+            if any(self.remaining[chunk_index] <= 0 for chunk_index in needed):
+                raise ValueError(f"Client {client_id} asked for triples that every client has already taken.")
+
+            self.queue_depths.append(self.queue.qsize())
+            if self.metrics is not None:
+                self.metrics.record_queue_depth(self.queue.qsize())
+
+            # the chunks arrive in order, so waiting for the last one that is needed gets all others as well
+            start = time.perf_counter()
+            while needed and needed[-1] not in self.chunks:
+                chunk_index, shares = self.queue.get()
+                if chunk_index is None:
+                    raise RuntimeError("The triple producer failed.") from shares
+                self.chunks[chunk_index] = shares
+
+            stall = time.perf_counter() - start
+            self.stall_seconds += stall
+            if self.metrics is not None:
+                self.metrics.record_stall("triples", stall)
+
+            triples = np.empty((len(wire_ids), 3) + self.ttp.batch_shape, dtype=BGW.dtype(self.mod))
+            for chunk_index in needed:
+                in_chunk = chunk_ids == chunk_index
+                triples[in_chunk] = self.chunks[chunk_index][client_id, rows[in_chunk]]
+
+                # once every client took its rows, the chunk is dropped
+                self.remaining[chunk_index] -= int(in_chunk.sum())
+                if self.remaining[chunk_index] <= 0:
+                    del self.chunks[chunk_index]
+
+        return triples
+
+    def get_beaver_triple(self, wire_id: int, client_id: int) -> List[int]:
+        """Returns shares of the Beaver triple for multiplication gate [wire_id] for [client_id]."""
+
+        return self.get_beaver_triples([wire_id], client_id)[0].tolist()
+
+    def preprocess_matrices(self, products: np.ndarray, shapes: List[Tuple[int, int, int]]):
+        """Generates the matrix triples of the matrix [products] with the [TTP] right away, see
+        [TTP.preprocess_matrices]; only the Beaver triples are generated in the background."""
+
+        with self.lock:
+            self.ttp.preprocess_matrices(products, shapes)
+
+    def get_matrix_triples(self, products: np.ndarray, shapes: List[Tuple[int, int, int]], client_id: int) \
+            -> List[Tuple[np.ndarray, np.ndarray, np.ndarray]]:
+        """Returns the shares of the matrix triples of the matrix [products] for [client_id], see
+        [TTP.get_matrix_triples]."""
+
+        with self.lock:
+            return self.ttp.get_matrix_triples(products, shapes, client_id)
+
+
+class BroadcastBoard:
+    """A broadcast channel for the rounds of the BGW protocol. In every round, each client publishes its message once,
+    and every client then reads the messages of all clients from here, instead of asking each other client for it
+    separately."""
+
+    def __init__(self, client_count: int):
+        """Initializes an empty board for [client_count] clients."""
+
+        self.client_count = client_count
+
+        self.messages = {}
+        """round_id -> the message that each client published in that round, `None` if it did not publish yet"""
+
+        self.reads = {}
+        """round_id -> the number of clients that read that round, so that it can be dropped once all of them did"""
+
+    def publish(self, round_id: int, client_id: int, message):
+        """Publishes the [message] of client [client_id] for round [round_id], which sends it to all other clients."""
+
+        if round_id not in self.messages:
+            self.messages[round_id] = [None] * self.client_count
+            self.reads[round_id] = 0
+
+        self.messages[round_id][client_id] = message
+
+        global MESSAGES_SENT_BGW
+        MESSAGES_SENT_BGW += self.client_count - 1
+
+    def read(self, round_id: int) -> List:
+        """Returns the messages of all clients for round [round_id], ordered by client ID. Every client should read each
+        round exactly once, after all clients have published."""
+
+        messages = self.messages[round_id]
+
+        if any(message is None for message in messages):
+            raise ValueError(f"Not all clients have published their message for round {round_id} yet.")
+
+        self.reads[round_id] += 1
+        if self.reads[round_id] == self.client_count:
+            del self.messages[round_id]
+            del self.reads[round_id]
+
+        return messages
+
+    def open(self, round_id: int, mod: int) -> np.ndarray:
+        """Returns the values that the messages of round [round_id] open to, i.e. the sum of the shares of all clients
+        under modulo [mod]. Every client reconstructs them itself from the messages it [read]s."""
+
+        return BGW.recover_secret_batch(np.stack(self.read(round_id)), mod)
+
+
+class KingBoard(BroadcastBoard):
+    """A [BroadcastBoard] on which the messages of a round are opened by a single king party instead of by every
+    client: each client sends its message only to the king, which reconstructs the opened values and sends them to all
+    other clients. That is `2 * (client_count - 1)` messages per round instead of `client_count * (client_count - 1)`,
+    for one extra hop. The king of round `r` is client `r % client_count`, so the work rotates between the clients."""
+
+    def __init__(self, client_count: int):
+        """Initializes an empty board for [client_count] clients."""
+
+        super().__init__(client_count)
+
+        self.opened = {}
+        """round_id -> the values that the king opened for that round, until every client has read them"""
+
+    def king_id(self, round_id: int) -> int:
+        """Returns the ID of the client that opens round [round_id]."""
+
+        return round_id % self.client_count
+
+    def publish(self, round_id: int, client_id: int, message):
+        """Publishes the [message] of client [client_id] for round [round_id], which sends it to the king of that round
+        only."""
+
+        if round_id not in self.messages:
+            self.messages[round_id] = [None] * self.client_count
+            self.reads[round_id] = 0
+
+        self.messages[round_id][client_id] = message
+
+        global MESSAGES_SENT_BGW
+        MESSAGES_SENT_BGW += client_id != self.king_id(round_id)
+
+    def open(self, round_id: int, mod: int) -> np.ndarray:
+        """Returns the values that the messages of round [round_id] open to under modulo [mod]. The first client to ask
+        stands in for the king: the king sums the messages of all clients and sends the result to the others."""
+
+        if round_id not in self.opened:
+            messages = self.messages[round_id]
+            if any(message is None for message in messages):
+                raise ValueError(f"Not all clients have published their message for round {round_id} yet.")
+
+            del self.messages[round_id]
+
+            self.opened[round_id] = BGW.recover_secret_batch(np.stack(messages), mod)
+
+            global MESSAGES_SENT_BGW
+            MESSAGES_SENT_BGW += self.client_count - 1
+
+        self.reads[round_id] += 1
+        opened = self.opened[round_id]
+        if self.reads[round_id] == self.client_count:
+            del self.opened[round_id]
+            del self.reads[round_id]
+
+        return opened
 
 
 class Client:
@@ -268,13 +2025,36 @@ class Client:
     # Client(0, ttp, circuit, {0: 9}, mod, rng),
     # Client(1, ttp, circuit, {1: 5}, mod, rng),
     # Client(2, ttp, circuit, {2: 3}, mod, rng)
-    def __init__(self, client_id: int, ttp: TTP, circuit: List[Wire], inputs: Dict[int, int], mod: int,
-                 rng: SystemRandom):
+    def __init__(self, client_id: int, ttp: TTP, circuit: List[Wire] | CompiledCircuit,
+                 inputs: Dict[int, int] | Dict[int, List[int]], mod: int, rng: SystemRandom,
+                 batch_size: int | None = None, seeded_inputs: bool = False, free_shares: bool = False,
+                 king_party: bool = False):
         """Constructs a new [Client], but does not do any significant computation yet. Here, [client_id] uniquely
         identifies this client, [ttp] is the TTP that will provide the client with shares of Beaver triples, [circuit]
-        is the circuit that will be executed, [inputs] is a mapping from wire indices to this client's private input
-        values, [mod] is the modulo under which the circuit is computed, and [rng] is the source of randomness used
-        whenever possible."""
+        is the circuit that will be executed (either as a list of wires or already compiled, e.g. mapped from a file by
+        [BGW.load_circuit]), [inputs] is a mapping
+        from wire indices to this client's private input values, [mod] is the modulo under which the circuit is
+        computed, and [rng] is the source of randomness used whenever possible.
+
+        If [batch_size] is given, the circuit is evaluated on [batch_size] records at once: every input value is a list
+        with one value per record, every wire holds a vector of shares, and every output is a list as well. All records
+        share the same rounds, so a batch costs as many rounds as a single evaluation. The [ttp] must have been created
+        with the same [batch_size].
+
+        If [seeded_inputs] is `True`, inputs are shared pseudo-randomly: this client gives every other client a seed
+        once, and that client expands its shares of all of this client's inputs from the seed, while this client keeps
+        the correction shares. This costs one message per pair of clients instead of one per input and share. All
+        clients must use the same setting.
+
+        If [free_shares] is `True`, the storage of a wire's share is reused as soon as no later layer needs it (see
+        [BGW.allocate_slots]), and triples and masked shares are only kept for the layer being computed, so memory
+        follows the width of the circuit instead of its size. Only the layer-by-layer evaluation of [BGW.run_circuit]
+        supports this, not [run_circuit_until_mult].
+
+        If [king_party] is `True`, masked shares are opened by a king party (see [KingBoard]) instead of by every client:
+        in every round, each client sends its masked shares to the king of that round only, and the king sends the
+        opened values back, which takes `O(client_count)` messages per round instead of `O(client_count^2)`. The
+        outputs are opened the same way by client 0. All clients must use the same setting."""
         
 
         self.client_id = client_id
@@ -283,16 +2063,34 @@ class Client:
         self.inputs = inputs
         self.mod = mod
         self.rng = rng
+        self.batch_size = batch_size
+        self.batch_shape = () if batch_size is None else (batch_size,)
+        """The shape of the value of a single wire: `()` normally, `(batch_size,)` in batch mode"""
+        self.seeded_inputs = seeded_inputs
+        self.free_shares = free_shares
+        self.king_party = king_party
+
+        self.metrics = RunMetrics()
+        """Where this client records the messages it receives and the operations it performs; [BGW.run_circuit] gives
+        all clients the [RunMetrics] of the run"""
 
         # self.clients_shares = {} # maps clients' (usually Bob's) id(s) -> my share for his(their) value(s) (eg, I'm Alice: Bob -> [B]_A)
         # self.beaver_triple = {} # maps wire_id -> my share for X, Y, Z
 
-    def set_clients(self, clients: List[Client]):
-        """Gives this client knowledge of the [Client]s that participate in the protocol."""
+    def set_clients(self, clients: List[Client], board: BroadcastBoard | None = None):
+        """Gives this client knowledge of the [Client]s that participate in the protocol, and of the [board] on which
+        they broadcast their masked shares. If no [board] is given, all [clients] share the board of the first one."""
         
 
         self.clients = clients
 
+        if board is None:
+            board = getattr(clients[0], "board", None) or \
+                    (KingBoard(len(clients)) if self.king_party else BroadcastBoard(len(clients)))
+            clients[0].board = board
+
+        self.board = board
+
     def get_input_share(self, wire_id: int, requester_id: int) -> int:
         """Returns the share of this client's input at wire [wire_id] that they created for client [requester_id]. This
         client should validate that this request is sensible, but may assume that the requester is
@@ -302,15 +2100,19 @@ class Client:
         return self.my_input_shares[wire_id][requester_id]
         # return self.shares[wire_id][requester_id]
 
+    def get_input_seed(self, requester_id: int) -> int:
+        """Returns the seed from which client [requester_id] expands its shares of all of this client's inputs, in
+        increasing order of wire ID, with [BGW.expand_seed]. Only available with `seeded_inputs`."""
+
+        return self.input_seeds[requester_id]
+
     # def get_masked_shares(self, wire_id: int) -> [int, int]:
     def get_masked_shares(self, wire_id: int) -> List[int]:
         """Returns the masked shares `A - X` and `B - Y` that this client created for the multiplication at wire
         [wire_id]."""
 
-        wire = self.circuit[wire_id]
-
-        A = self.shares[wire.wire_a_id]
-        B = self.shares[wire.wire_b_id]
+        A = self.shares[self.compiled.a_ids[wire_id]]
+        B = self.shares[self.compiled.b_ids[wire_id]]
         X = self.triple[wire_id][0]
         Y = self.triple[wire_id][1]
 
@@ -318,9 +2120,9 @@ class Client:
         # self.masked_shares = []
         # self.masked_shares.append(A - X)
         # masked_shares.append(A - X)
-        masked_shares.append((A - X) % self.mod)
+        masked_shares.append(BGW.sub_batch(A, X, self.mod))
         # masked_shares.append(B - Y)
-        masked_shares.append((B - Y) % self.mod)
+        masked_shares.append(BGW.sub_batch(B, Y, self.mod))
         # self.masked_shares.append(B - Y)
 
         return masked_shares
@@ -332,29 +2134,99 @@ class Client:
         honest-but-curious."""
         
 
-        wire = self.circuit[wire_id]
-
-        if type(wire) == AddWire:
-            return BGW.add(self.shares[wire.wire_a_id], self.shares[wire.wire_b_id], self.mod)
-        elif type(wire) == ConstMultWire:
-            return BGW.const_mult(wire.c, self.shares[wire.wire_a_id], self.mod)
-        elif type(wire) == MultWire:
-            return BGW.mult(self.client_id == 0, self.triple[wire_id][0], self.triple[wire_id][1], self.triple[wire_id][2], self.a_b_prime[wire_id][0], self.a_b_prime[wire_id][1], self.mod)
-        elif type(wire) == InputWire:
+        circuit = self.compiled
+        op = circuit.ops[wire_id]
+
+        # the batch operations work for a single share as well as for a vector of shares in batch mode
+        if op != OP_INPUT:
+            self.metrics.count({OP_ADD: "add", OP_CONST_MULT: "const_mult", OP_MULT: "mult"}[op],
+                               np.size(self.shares[wire_id]))
+
+        if op == OP_ADD:
+            return BGW.add_batch(self.shares[circuit.a_ids[wire_id]], self.shares[circuit.b_ids[wire_id]], self.mod)
+        elif op == OP_CONST_MULT:
+            return BGW.const_mult_batch(self.consts[circuit.b_ids[wire_id]], self.shares[circuit.a_ids[wire_id]], self.mod)
+        elif op == OP_MULT:
+            return BGW.mult_batch(self.client_id == 0, self.triple[wire_id][0], self.triple[wire_id][1], self.triple[wire_id][2], self.a_b_prime[wire_id][0], self.a_b_prime[wire_id][1], self.mod)
+        elif op == OP_INPUT:
             return self.shares[wire_id]
 
 
 
     def local_setup(self):
         """Performs the local part of the setup, which consists of creating shares for this client's inputs."""
+
+        if type(self.circuit) == CompiledCircuit:
+            self.compiled = self.circuit
+        else:
+            self.compiled = BGW.compile_circuit(self.circuit)
+        """The circuit as flat arrays, which is what all evaluation below runs off"""
+
+        self.ops = np.frombuffer(self.compiled.ops, dtype=np.uint8)
+        self.a_ids = np.frombuffer(self.compiled.a_ids, dtype=np.int64)
+        self.b_ids = np.frombuffer(self.compiled.b_ids, dtype=np.int64)
+        self.consts = BGW.to_array(self.compiled.consts, self.mod)
+        """NumPy views of the compiled circuit, used to evaluate whole waves of wires at once"""
         
         self.my_input_shares = {}
         """Share my input to [len(clients)] clients: wire_id: int -> shares: List[int]"""
 
-        for wire_index, input in self.inputs.items():
-            self.my_input_shares[wire_index] = BGW.create_shares(self.rng, input, len(self.clients), self.mod)
-            # global COUNT_BGW_create_shares
-            # COUNT_BGW_create_shares += 1
+        # all inputs are shared in one batch, column `j` holds the shares of the `j`-th input
+        input_ids = list(self.inputs)
+
+        if self.seeded_inputs:
+            # the other clients expand their shares in the order of the wires, so it must match exactly
+            input_ids = np.flatnonzero((self.ops == OP_INPUT) & (self.a_ids == self.client_id)).tolist()
+            if sorted(self.inputs) != input_ids:
+                raise ValueError(f"Client {self.client_id} must provide exactly the inputs of wires {input_ids}.")
+
+        input_values = np.array([self.inputs[wire_index] for wire_index in input_ids], dtype=object)
+
+        if not input_ids:
+            # a client without inputs still shares a batch of them, just an empty one
+            input_values = np.empty((0,) + self.batch_shape, dtype=object)
+
+        if input_values.shape != (len(input_ids),) + self.batch_shape:
+            raise ValueError(f"Client {self.client_id} expects inputs of shape {self.batch_shape}.")
+
+        if self.seeded_inputs:
+            self.input_seeds = {client.client_id: self.rng.getrandbits(128) for client in self.clients
+                                if client.client_id != self.client_id}
+            """client_id -> the seed that client expands its shares of my inputs from"""
+
+            input_shares = BGW.create_seeded_shares_batch([self.input_seeds.get(client_id)
+                                                           for client_id in range(len(self.clients))],
+                                                          input_values, self.mod)
+        else:
+            input_shares = BGW.create_shares_batch(self.rng, input_values, len(self.clients), self.mod)
+
+        self.metrics.count("create_shares", input_values.size)
+
+        for j, wire_index in enumerate(input_ids):
+            self.my_input_shares[wire_index] = input_shares[:, j]
+
+        self.layers = BGW.schedule(self.compiled)
+        """The multiplicative-depth layers of the circuit, see [BGW.schedule]"""
+
+        if self.free_shares:
+            self.slots, self.slot_count = BGW.allocate_slots(self.compiled, self.layers)
+        else:
+            self.slots, self.slot_count = np.arange(len(self.compiled)), len(self.compiled)
+        """wire_id -> the row of [shares] that holds my share of that wire"""
+
+        self.layer_pairs = [BGW.mult_pairs(self.compiled, layer.mult_ids) for layer in self.layers]
+        """The keys, `A` wires, `B` wires and sizes of the products of every layer, see [BGW.mult_pairs]"""
+
+        self.layer_matrices = [[BGW.matrix_product(self.compiled, product) for product in layer.matrix_ids.tolist()]
+                               for layer in self.layers]
+        """The dimensions and wires of the matrix products of every layer, see [BGW.matrix_product]"""
+
+        is_binary = (self.ops == OP_ADD) | (self.ops == OP_MULT)
+        has_a = (self.ops == OP_ADD) | (self.ops == OP_CONST_MULT) | (self.ops == OP_MULT)
+        self.a_slots = self.slots[np.where(has_a, self.a_ids, 0)]
+        self.b_slots = np.where(is_binary, self.slots[np.where(is_binary, self.b_ids, 0)], self.b_ids)
+        """The slots of the operands of every wire, like [a_ids] and [b_ids] (so [b_slots] holds the index of the
+        constant for a [ConstMultWire])"""
             
 
     def interactive_setup(self):
@@ -362,32 +2234,124 @@ class Client:
         TTP and fetching the shares that other clients have created of their inputs for this client."""
         
 
-        self.shares = {}
-        """Contain all my shares for each wire"""
+        # with free_shares, the per-wire triples and masked shares are replaced by the ones of the current layer
+        key_count = 0 if self.free_shares else len(self.compiled) + len(self.compiled.inner_a_ids)
+        dtype = BGW.dtype(self.mod)
+        batch_shape = self.batch_shape
+
+        self.shares = np.zeros((self.slot_count,) + batch_shape, dtype=dtype)
+        """Contain all my shares for each wire, in the rows given by [slots]"""
+
+        self.layer_triples = {}
+        self.layer_masked_shares = {}
+        """layer_id -> the triples and masked shares of the multiplications in that layer, with free_shares"""
 
-        self.triple = {}
-        """Contain all the Beaver stiple shares for each MultWire"""
+        self.matrix_triples = {}
+        """matrix product -> my shares of its matrix triple `X`, `Y` and `Z` (with free_shares, only while its layer is
+        computed)"""
 
-        self.masked_shares = {} # not used in this function
+        self.matrix_masked_shares = {}
+        """layer_id -> the masked shares of the matrix products of that layer, without free_shares"""
+
+        self.triple = np.zeros((key_count, 3) + batch_shape, dtype=dtype)
+        """Contain all the Beaver stiple shares for each MultWire (and each pair of an InnerProductWire, by the keys of
+        [BGW.mult_pairs])"""
+
+        self.masked_shares = np.zeros((key_count, 2) + batch_shape, dtype=dtype) # not used in this function
         """Contain all the masked shares [(A-X), (B-Y)] for each MultWire"""
 
-        self.a_b_prime = {} # not used in this function
+        self.a_b_prime = np.zeros((key_count, 2) + batch_shape, dtype=dtype) # not used in this function
         """Contain a_prime and b_prime for each MultWire"""
+
+        self.stopped_at = None
+        """The MultWire at which [run_circuit_until_mult] is waiting for the masked shares of the other clients"""
         
 
-        for wire_index, wire in enumerate(self.circuit):
-            if type(wire) ==  InputWire:
-                if wire.owner_id != self.client_id:
-                    global MESSAGES_SENT_BGW
+        a_ids = self.compiled.a_ids
+        global MESSAGES_SENT_BGW
+        # the size of a message that holds one share of one wire
+        share_size = BGW.share_width(self.mod) * int(np.prod(batch_shape))
+
+        if self.seeded_inputs:
+            # one seed per other client that owns inputs, from which all shares of its inputs are expanded
+            input_ids = np.flatnonzero(self.ops == OP_INPUT)
+            owner_ids = self.a_ids[input_ids]
+
+            for owner_id in np.unique(owner_ids).tolist():
+                owned_ids = input_ids[owner_ids == owner_id]
+
+                if owner_id == self.client_id:
+                    for wire_index in owned_ids.tolist():
+                        self.shares[self.slots[wire_index]] = self.my_input_shares[wire_index][self.client_id]
+                else:
                     MESSAGES_SENT_BGW += 1
+                    self.metrics.record_message(owner_id, 16)
+
+                    seed = self.clients[owner_id].get_input_seed(self.client_id)
+                    self.shares[self.slots[owned_ids]] = BGW.expand_seed(seed, (len(owned_ids),) + batch_shape,
+                                                                         self.mod)
+        else:
+            for wire_index in np.flatnonzero(self.ops == OP_INPUT).tolist():
+                owner_id = a_ids[wire_index]
+                if owner_id != self.client_id:
+                    MESSAGES_SENT_BGW += 1
+                    self.metrics.record_message(owner_id, share_size)
+
+                self.shares[self.slots[wire_index]] = self.clients[owner_id].get_input_share(wire_index,
+                                                                                              self.client_id)
 
-                self.shares[wire_index] = self.clients[wire.owner_id].get_input_share(wire_index, self.client_id)
-            elif type(wire) ==  MultWire:
-                # global MESSAGES_SENT_BGW
-                MESSAGES_SENT_BGW += 1
+        # the triples of all MultWires and InnerProductWires are taken from the TTP's pool in a single message
+        keys = np.concatenate([np.zeros(0, dtype=np.int64)] + [pairs[0] for pairs in self.layer_pairs])
+        if len(keys) and not self.free_shares:
+            self.triple[keys] = self.fetch_triples(keys)
 
-                # self.shares_braver_triple[wire_index] = self.ttp.get_beaver_triple(wire_index, self.client_id)
-                self.triple[wire_index] = self.ttp.get_beaver_triple(wire_index, self.client_id)
+        # and so are the matrix triples of all matrix products
+        products = np.concatenate([np.zeros(0, dtype=np.intp)] + [layer.matrix_ids for layer in self.layers])
+        if len(products) and not self.free_shares:
+            self.fetch_matrix_triples(products)
+
+    def fetch_triples(self, mult_ids: np.ndarray) -> np.ndarray:
+        """Takes this client's shares of the Beaver triples of the multiplications [mult_ids] from the TTP, in a single
+        message."""
+
+        global MESSAGES_SENT_BGW
+        MESSAGES_SENT_BGW += 1
+
+        triples = self.ttp.get_beaver_triples(mult_ids, self.client_id)
+
+        # every record needs its own triple, reusing one for the whole batch would leak the differences
+        if triples.shape != (len(mult_ids), 3) + self.batch_shape:
+            raise ValueError(f"Client {self.client_id} got triples of shape {triples.shape[1:]} instead of "
+                             f"{(3,) + self.batch_shape}, the TTP must use the same batch size.")
+
+        records = int(np.prod(self.batch_shape))
+        self.metrics.record_message("ttp", 3 * len(mult_ids) * records * BGW.share_width(self.mod))
+        self.metrics.count("triples", len(mult_ids) * records)
+
+        return triples
+
+    def fetch_matrix_triples(self, products: np.ndarray):
+        """Takes this client's shares of the matrix triples of the matrix [products] from the TTP, in a single message,
+        and keeps them in [matrix_triples]."""
+
+        global MESSAGES_SENT_BGW
+        MESSAGES_SENT_BGW += 1
+
+        shapes = BGW.matrix_shapes(self.compiled, products)
+        triples = self.ttp.get_matrix_triples(products, shapes, self.client_id)
+
+        for product, (n, k, m), triple in zip(products.tolist(), shapes, triples):
+            if [matrix.shape for matrix in triple] != [(n, k) + self.batch_shape, (k, m) + self.batch_shape,
+                                                       (n, m) + self.batch_shape]:
+                raise ValueError(f"Client {self.client_id} got a matrix triple of the wrong shape for matrix product "
+                                 f"{product}, the TTP must use the same batch size.")
+
+            self.matrix_triples[product] = triple
+
+        records = int(np.prod(self.batch_shape))
+        size = sum(n * k + k * m + n * m for n, k, m in shapes) * records
+        self.metrics.record_message("ttp", size * BGW.share_width(self.mod))
+        self.metrics.count("matrix_triples", len(products) * records)
         
 
 
@@ -400,16 +2364,25 @@ class Client:
         continues to run the circuit until it encounters another multiplication gate. If this client is done with the
         circuit, this function returns `None`."""
 
+        if self.free_shares:
+            raise ValueError("run_circuit_until_mult needs the shares of all wires, it cannot be used with free_shares.")
+
         # Dict[wire_id: int, all_output_shares: List[int]] -> needed to use get_output()
         # self.output_shares = {}
 
-        for wire_index in range(start_at_wire_id, len(self.circuit)):
+        ops = self.compiled.ops
+
+        for wire_index in range(start_at_wire_id, len(ops)):
+
+            if ops[wire_index] == OP_INNER_PRODUCT or ops[wire_index] == OP_MATRIX_MULT:
+                raise ValueError("run_circuit_until_mult does not support InnerProductWires and MatMultWires, use "
+                                 "BGW.run_circuit.")
 
             # we don't want InputWire
-            if type(self.circuit[wire_index]) != InputWire:
+            if ops[wire_index] != OP_INPUT:
 
                 # if doesn't require interaction (AddWire, ConstMultWire)
-                if type(self.circuit[wire_index]) != MultWire:
+                if ops[wire_index] != OP_MULT:
                     # wire = self.circuit[wire_index]
 
                     # save the "output share" in my shares
@@ -418,11 +2391,13 @@ class Client:
                 # GateWire moment
                 else:
                     # first time encoutering MultWire -> setup
-                    if wire_index not in self.masked_shares:
+                    if wire_index != self.stopped_at:
                         # some local computation
 
                         # self.triple = self.ttp.get_beaver_triple(wire_index, self.client_id)
                         self.masked_shares[wire_index] = self.get_masked_shares(wire_index)
+                        self.stopped_at = wire_index
+                        self.publish_masked(wire_index, self.masked_shares[wire_index])
 
                         # still need to exchange the masked shares
 
@@ -431,17 +2406,10 @@ class Client:
 
                     # second time encountering MultWire -> execute
                     else:                        
-                        # share the masked shares with other clients (receive other clients' masked shares)
-                        masked_a = []
-                        masked_b = []
-                        for client_ in self.clients:
-                            masked_a.append(client_.get_masked_shares(wire_index)[0])
-                            masked_b.append(client_.get_masked_shares(wire_index)[1])
-
+                        # share the masked shares with other clients (receive other clients' masked shares) and
                         # recover A' and B'
-                        self.a_b_prime[wire_index] = []
-                        self.a_b_prime[wire_index].append(BGW.recover_secret(masked_a, self.mod))
-                        self.a_b_prime[wire_index].append(BGW.recover_secret(masked_b, self.mod))
+                        self.a_b_prime[wire_index] = self.open_masked(wire_index)
+                        self.stopped_at = None
 
                         # get share of the output of the GateWire
                         self.shares[wire_index] = self.get_output_share(wire_index)
@@ -527,35 +2495,234 @@ class Client:
 
 
 
-    def get_outputs(self) -> Dict[int, int]:
-        """Returns a dictionary from wire IDs to the reconstructed outputs at those wires, corresponding to all outputs
-        of the circuit."""
-        outputs = {}
+    def run_layer_until_mult(self, layer_id: int):
+        """Computes the linear wires of layer [layer_id] and the masked shares of all of its [MultWire]s. After every
+        client has done this, the layer can be finished with [open_layer]."""
 
-        for wire_index, wire in enumerate(self.circuit):
-            # output_shares = []
-            # output_shares.append(self.get_output_share(wire_index))
+        self.run_waves(self.layers[layer_id].linear_waves)
+        self.mask_layer(layer_id)
 
-            # for client in self.clients:
-            #     output_shares.append(client.get_output_share(wire_index))
+    def run_waves(self, waves: List[np.ndarray]):
+        """Computes the linear wires in [waves], one vectorized wave at a time. The inputs of every wave must already
+        have been computed."""
 
-            # if type(wire) != InputWire:
-            if wire.is_output:
+        shares = self.shares
 
-                # D = [D]_A + [D]_B + [D]_C
-                output_shares = []
+        for wave in waves:
+            is_add = self.ops[wave] == OP_ADD
+            slots = self.slots[wave]
+            a_slots = self.a_slots[wave]
+            b_slots = self.b_slots[wave]
 
-                for client in self.clients:
-                    # output_shares.append(client.get_output_share(wire_index))
-                    output_shares.append(client.shares[wire_index])
-                    
-                    if client != self:
-                        global MESSAGES_SENT_BGW
+            if is_add.all():
+                shares[slots] = BGW.add_batch(shares[a_slots], shares[b_slots], self.mod)
+                self.metrics.count("add", shares[slots].size)
+            else:
+                is_const_mult = ~is_add
+                # in batch mode, every constant is applied to all records of its wire
+                consts = self.consts[b_slots[is_const_mult]].reshape((-1,) + (1,) * len(self.batch_shape))
+
+                shares[slots[is_add]] = BGW.add_batch(shares[a_slots[is_add]], shares[b_slots[is_add]], self.mod)
+                shares[slots[is_const_mult]] = BGW.const_mult_batch(consts, shares[a_slots[is_const_mult]], self.mod)
+                self.metrics.count("add", shares[slots[is_add]].size)
+                self.metrics.count("const_mult", shares[slots[is_const_mult]].size)
+
+    def mask_layer(self, layer_id: int):
+        """Computes the masked shares of all [MultWire]s (and matrix products) in layer [layer_id] and publishes them on
+        the board. The inputs of these multiplications must already have been computed."""
+
+        shares = self.shares
+        keys, a_wires, b_wires, _ = self.layer_pairs[layer_id]
+
+        if not self.layers[layer_id].interactive:
+            return
+
+        masked_shares = np.zeros((0, 2) + self.batch_shape, dtype=shares.dtype)
+        if len(keys):
+            triple = self.get_layer_triples(layer_id)
+            masked_shares = np.stack([BGW.sub_batch(shares[self.slots[a_wires]], triple[:, 0], self.mod),
+                                      BGW.sub_batch(shares[self.slots[b_wires]], triple[:, 1], self.mod)], axis=1)
+
+        matrix_masked_shares = self.mask_matrices(layer_id)
+
+        if self.free_shares:
+            self.layer_masked_shares[layer_id] = np.concatenate([masked_shares, matrix_masked_shares])
+        else:
+            self.masked_shares[keys] = masked_shares
+            if len(matrix_masked_shares):
+                self.matrix_masked_shares[layer_id] = matrix_masked_shares
+
+        self.publish_masked(layer_id, self.get_masked_layer(layer_id))
+
+    def king_id(self, round_id: int) -> int | None:
+        """Returns the ID of the client that opens the masked shares of round [round_id] with king_party, or `None` if
+        every client opens them itself."""
+
+        return round_id % len(self.clients) if self.king_party else None
+
+    def publish_masked(self, round_id: int, message: np.ndarray):
+        """Publishes this client's masked shares [message] for round [round_id] on the board, which sends them to every
+        other client, or only to the king of the round with king_party."""
+
+        self.board.publish(round_id, self.client_id, message)
+
+        king_id = self.king_id(round_id)
+        if king_id is None:
+            self.metrics.record_message(self.client_id, message.size * BGW.share_width(self.mod), len(self.clients) - 1)
+        elif king_id != self.client_id:
+            self.metrics.record_message(self.client_id, message.size * BGW.share_width(self.mod))
+
+    def open_masked(self, round_id: int) -> np.ndarray:
+        """Returns the values that the masked shares of all clients for round [round_id] open to. With king_party, only
+        the king of the round reconstructs them, and sends them to every other client."""
+
+        opened = self.board.open(round_id, self.mod)
+
+        king_id = self.king_id(round_id)
+        if king_id is None or king_id == self.client_id:
+            self.metrics.count("recover_secret", opened.size)
+        if king_id == self.client_id:
+            self.metrics.record_message(self.client_id, opened.size * BGW.share_width(self.mod), len(self.clients) - 1)
+
+        return opened
+
+    def get_layer_triples(self, layer_id: int) -> np.ndarray:
+        """Returns this client's shares of the Beaver triples of all multiplications in layer [layer_id], with one row
+        per multiplication (and per pair of an inner product). With free_shares, they are only taken from the TTP when
+        the layer is computed."""
+
+        if not self.free_shares:
+            return self.triple[self.layer_pairs[layer_id][0]]
+
+        if layer_id not in self.layer_triples:
+            self.layer_triples[layer_id] = self.fetch_triples(self.layer_pairs[layer_id][0])
+
+        return self.layer_triples[layer_id]
+
+    def mask_matrices(self, layer_id: int) -> np.ndarray:
+        """Computes the masked shares `A - X` and `B - Y` of the matrix products in layer [layer_id]. A product of an
+        `n x k` and a `k x m` matrix takes `max(n * k, k * m)` rows, with the entries of `A - X` in the first column and
+        those of `B - Y` in the second, row by row (and zeros after the last entry)."""
+
+        matrices = self.layer_matrices[layer_id]
+        if matrices and self.layers[layer_id].matrix_ids[0] not in self.matrix_triples:
+            self.fetch_matrix_triples(self.layers[layer_id].matrix_ids)
+
+        rows = [np.zeros((0, 2) + self.batch_shape, dtype=self.shares.dtype)]
+
+        for product, (n, k, m, a_wires, b_wires, _) in zip(self.layers[layer_id].matrix_ids.tolist(), matrices):
+            X, Y, _ = self.matrix_triples[product]
+            masked = np.zeros((max(n * k, k * m), 2) + self.batch_shape, dtype=self.shares.dtype)
+            masked[:n * k, 0] = BGW.sub_batch(self.shares[self.slots[a_wires]], X.reshape((n * k,) + self.batch_shape),
+                                              self.mod)
+            masked[:k * m, 1] = BGW.sub_batch(self.shares[self.slots[b_wires]], Y.reshape((k * m,) + self.batch_shape),
+                                              self.mod)
+            rows.append(masked)
+
+        return np.concatenate(rows)
+
+    def get_masked_layer(self, layer_id: int) -> np.ndarray:
+        """Returns the masked shares `A - X` and `B - Y` that this client created for all multiplications in layer
+        [layer_id], as a single message with one row per multiplication (and per pair of an inner product), followed by
+        the rows of the matrix products (see [mask_matrices])."""
+
+        if self.free_shares:
+            return self.layer_masked_shares[layer_id]
+
+        masked_shares = self.masked_shares[self.layer_pairs[layer_id][0]]
+        if layer_id in self.matrix_masked_shares:
+            masked_shares = np.concatenate([masked_shares, self.matrix_masked_shares[layer_id]])
+
+        return masked_shares
+
+    def open_layer(self, layer_id: int):
+        """Performs the interactive part of all multiplications in layer [layer_id] in one round: reads the masked
+        shares that every client published for the whole layer from the board, recovers `A'` and `B'` and computes this
+        client's share of every product. The products of an inner product are added up locally, which is what its
+        triple is made for."""
+
+        mult_ids = self.layers[layer_id].mult_ids
+        keys, _, _, sizes = self.layer_pairs[layer_id]
+
+        a_b_prime = self.open_masked(layer_id)
+
+        if len(keys):
+            triple = self.get_layer_triples(layer_id)
+            pair_primes = a_b_prime[:len(keys)]
+
+            if not self.free_shares:
+                self.a_b_prime[keys] = pair_primes
+
+            products = BGW.mult_batch(self.client_id == 0, triple[:, 0], triple[:, 1], triple[:, 2],
+                                      pair_primes[:, 0], pair_primes[:, 1], self.mod)
+            self.shares[self.slots[mult_ids]] = BGW.sum_groups_batch(products, sizes, self.mod)
+
+            self.metrics.count("mult", products.size)
+            if len(keys) != len(mult_ids):
+                self.metrics.count("add", products.size - self.shares[self.slots[mult_ids]].size)
+
+        if self.free_shares:
+            self.layer_triples.pop(layer_id, None)
+            del self.layer_masked_shares[layer_id]
+
+        # the rows of the matrix products follow those of the multiplications, in the order of [mask_matrices]
+        row = len(keys)
+        for product, (n, k, m, _, _, entries) in zip(self.layers[layer_id].matrix_ids.tolist(),
+                                                     self.layer_matrices[layer_id]):
+            primes = a_b_prime[row:row + max(n * k, k * m)]
+            row += len(primes)
+
+            X, Y, Z = self.matrix_triples[product]
+            result = BGW.matrix_mult_batch(self.client_id == 0, X, Y, Z,
+                                           primes[:n * k, 0].reshape((n, k) + self.batch_shape),
+                                           primes[:k * m, 1].reshape((k, m) + self.batch_shape), self.mod)
+
+            has_wire = entries >= 0
+            self.shares[self.slots[entries[has_wire]]] = result.reshape((n * m,) + self.batch_shape)[has_wire]
+            self.metrics.count("matrix_mult", n * k * m * int(np.prod(self.batch_shape)))
+
+            if self.free_shares:
+                del self.matrix_triples[product]
+
+    def get_share(self, wire_id):
+        """Returns this client's share of wire [wire_id] (or the shares of a list of wires), which must still be
+        stored, like the shares of the output wires at the end of the circuit."""
+
+        return self.shares[self.slots[wire_id]]
+
+    def get_outputs(self) -> Dict[int, int] | Dict[int, List[int]]:
+        """Returns a dictionary from wire IDs to the reconstructed outputs at those wires, corresponding to all outputs
+        of the circuit. In batch mode, every output is a list with one value per record."""
+        outputs = {}
+
+        for wire_index in self.compiled.output_ids():
+            # D = [D]_A + [D]_B + [D]_C
+            output_shares = []
+
+            for client in self.clients:
+                # output_shares.append(client.get_output_share(wire_index))
+                output_shares.append(client.get_share(wire_index))
+                
+                if client != self:
+                    global MESSAGES_SENT_BGW
+                    if self.king_party:
+                        # only this client gets the share, it sends the opened output to everyone below
+                        MESSAGES_SENT_BGW += 1
+                    else:
                         MESSAGES_SENT_BGW += 1 * len(self.clients) # this is because I just let one user know the final result
                                                                # instead of letting all three know (so * "3" to let all 3 know)
+                    self.metrics.record_message(client.client_id, np.size(output_shares[-1]) * BGW.share_width(self.mod))
 
-                # basically just add the shares
-                outputs[wire_index] = BGW.recover_secret(output_shares, self.mod) 
+            # basically just add the shares
+            self.metrics.count("recover_secret", np.size(output_shares[0]))
+            if self.king_party:
+                MESSAGES_SENT_BGW += len(self.clients) - 1
+                self.metrics.record_message(self.client_id, np.size(output_shares[0]) * BGW.share_width(self.mod),
+                                            len(self.clients) - 1)
+            if self.batch_size is None:
+                outputs[wire_index] = BGW.recover_secret(output_shares, self.mod)
+            else:
+                outputs[wire_index] = BGW.recover_secret_batch(np.stack(output_shares), self.mod).tolist()
 
 
         # return self.outputs
@@ -564,157 +2731,20 @@ class Client:
 
 
 def main():
-    circuits = {
-        # basic
-        # 0 - |
-        #     + -> |
-        # 1 - |    |
-        #          |
-        #          * -> output
-        #          |
-        # 2 - |    |
-        #    6* -> |  
-
-
-        # inputs: {0: 9}, {1: 5}, {2: 3}
-        "basic": [
-            InputWire(is_output=False, owner_id=0),  # 0
-            InputWire(is_output=False, owner_id=1),  # 1
-            InputWire(is_output=False, owner_id=2),  # 2
-            AddWire(is_output=False, wire_a_id=0, wire_b_id=1),  # 3
-            # AddWire(is_output=True, wire_a_id=0, wire_b_id=1),  # test
-            ConstMultWire(is_output=False, c=6, wire_a_id=2),  # 4
-            # AddWire(is_output=True, wire_a_id=3, wire_b_id=4),  # test
-            # ConstMultWire(is_output=True, c=5, wire_a_id=4),  # test
-            MultWire(is_output=True, wire_a_id=3, wire_b_id=4),  # 5
-            # MultWire(is_output=True, wire_a_id=0, wire_b_id=1),  # test
-        ],
-        "deep": [
-            InputWire(is_output=False, owner_id=0),  # 0
-            InputWire(is_output=False, owner_id=1),  # 1
-            InputWire(is_output=False, owner_id=2),  # 2
-            InputWire(is_output=False, owner_id=2),  # 3
-            AddWire(is_output=False, wire_a_id=0, wire_b_id=1),  # 4
-            MultWire(is_output=False, wire_a_id=4, wire_b_id=2),  # 5
-            AddWire(is_output=False, wire_a_id=1, wire_b_id=5),  # 6
-            ConstMultWire(is_output=False, c=4, wire_a_id=6),  # 7
-            AddWire(is_output=False, wire_a_id=2, wire_b_id=7),  # 8
-            AddWire(is_output=False, wire_a_id=7, wire_b_id=8),  # 9
-            MultWire(is_output=False, wire_a_id=4, wire_b_id=9),  # 10
-            MultWire(is_output=True, wire_a_id=3, wire_b_id=10),  # 11
-        ],
-        "wide": [
-            InputWire(is_output=False, owner_id=0),  # 0
-            InputWire(is_output=False, owner_id=0),  # 1
-            InputWire(is_output=False, owner_id=0),  # 2
-            InputWire(is_output=False, owner_id=0),  # 3
-            InputWire(is_output=False, owner_id=1),  # 4
-            InputWire(is_output=False, owner_id=1),  # 5
-            InputWire(is_output=False, owner_id=1),  # 6
-            InputWire(is_output=False, owner_id=1),  # 7
-            InputWire(is_output=False, owner_id=2),  # 8
-            InputWire(is_output=False, owner_id=2),  # 9
-            InputWire(is_output=False, owner_id=2),  # 10
-            InputWire(is_output=False, owner_id=2),  # 11
-            AddWire(is_output=False, wire_a_id=0, wire_b_id=6),  # 12
-            AddWire(is_output=False, wire_a_id=1, wire_b_id=7),  # 13
-            AddWire(is_output=False, wire_a_id=2, wire_b_id=8),  # 14
-            AddWire(is_output=False, wire_a_id=3, wire_b_id=9),  # 15
-            AddWire(is_output=False, wire_a_id=4, wire_b_id=10),  # 16
-            AddWire(is_output=False, wire_a_id=5, wire_b_id=11),  # 17
-            MultWire(is_output=True, wire_a_id=12, wire_b_id=15),  # 18
-            MultWire(is_output=True, wire_a_id=13, wire_b_id=16),  # 19
-            MultWire(is_output=True, wire_a_id=14, wire_b_id=17),  # 20
-        ],
-        "adder": [
-            InputWire(is_output=False, owner_id=0),  # 0
-            InputWire(is_output=False, owner_id=1),  # 1
-            InputWire(is_output=False, owner_id=2),  # 2
-            AddWire(is_output=False, wire_a_id=0, wire_b_id=1),  # 3
-            AddWire(is_output=True, wire_a_id=3, wire_b_id=2),  # 4
-        ],
-        "xors": [
-            InputWire(is_output=False, owner_id=0),  # 0
-            InputWire(is_output=False, owner_id=0),  # 1
-            InputWire(is_output=False, owner_id=1),  # 2
-            InputWire(is_output=False, owner_id=1),  # 3
-            InputWire(is_output=False, owner_id=2),  # 4
-            InputWire(is_output=False, owner_id=2),  # 5
-            # "Gate 6"
-            AddWire(is_output=False, wire_a_id=0, wire_b_id=3),  # 6
-            MultWire(is_output=False, wire_a_id=0, wire_b_id=3),  # 7
-            ConstMultWire(is_output=False, c=-2, wire_a_id=7),  # 8
-            AddWire(is_output=True, wire_a_id=6, wire_b_id=8),  # 9
-            # "Gate 7"
-            AddWire(is_output=False, wire_a_id=1, wire_b_id=4),  # 10
-            MultWire(is_output=False, wire_a_id=1, wire_b_id=4),  # 11
-            ConstMultWire(is_output=False, c=-2, wire_a_id=11),  # 12
-            AddWire(is_output=True, wire_a_id=10, wire_b_id=12),  # 13
-            # "Gate 8"
-            AddWire(is_output=False, wire_a_id=2, wire_b_id=5),  # 14
-            MultWire(is_output=False, wire_a_id=2, wire_b_id=5),  # 15
-            ConstMultWire(is_output=False, c=-2, wire_a_id=15),  # 16
-            AddWire(is_output=True, wire_a_id=14, wire_b_id=16),  # 17
-            # "Gate 9"
-            AddWire(is_output=False, wire_a_id=3, wire_b_id=9),  # 18
-            MultWire(is_output=False, wire_a_id=3, wire_b_id=9),  # 19
-            ConstMultWire(is_output=False, c=-2, wire_a_id=19),  # 20
-            AddWire(is_output=True, wire_a_id=18, wire_b_id=20),  # 21
-            # "Gate 10"
-            AddWire(is_output=False, wire_a_id=4, wire_b_id=13),  # 22
-            MultWire(is_output=False, wire_a_id=4, wire_b_id=13),  # 23
-            ConstMultWire(is_output=False, c=-2, wire_a_id=23),  # 24
-            AddWire(is_output=True, wire_a_id=22, wire_b_id=24),  # 25
-            # "Gate 11"
-            AddWire(is_output=False, wire_a_id=5, wire_b_id=17),  # 26
-            MultWire(is_output=False, wire_a_id=5, wire_b_id=17),  # 27
-            ConstMultWire(is_output=False, c=-2, wire_a_id=27),  # 28
-            AddWire(is_output=True, wire_a_id=26, wire_b_id=28),  # 29
-            # "Gate 12"
-            AddWire(is_output=False, wire_a_id=9, wire_b_id=21),  # 30
-            MultWire(is_output=False, wire_a_id=9, wire_b_id=21),  # 31
-            ConstMultWire(is_output=False, c=-2, wire_a_id=31),  # 32
-            AddWire(is_output=True, wire_a_id=30, wire_b_id=32),  # 33
-            # "Gate 13"
-            AddWire(is_output=False, wire_a_id=13, wire_b_id=25),  # 34
-            MultWire(is_output=False, wire_a_id=13, wire_b_id=25),  # 35
-            ConstMultWire(is_output=False, c=-2, wire_a_id=35),  # 36
-            AddWire(is_output=True, wire_a_id=34, wire_b_id=36),  # 37
-            # "Gate 14"
-            AddWire(is_output=False, wire_a_id=29, wire_b_id=33),  # 38
-            MultWire(is_output=False, wire_a_id=29, wire_b_id=33),  # 39
-            ConstMultWire(is_output=False, c=-2, wire_a_id=39),  # 40
-            AddWire(is_output=True, wire_a_id=38, wire_b_id=40),  # 41
-            # "Gate 15"
-            AddWire(is_output=False, wire_a_id=41, wire_b_id=37),  # 42
-            MultWire(is_output=False, wire_a_id=41, wire_b_id=37),  # 43
-            ConstMultWire(is_output=False, c=-2, wire_a_id=43),  # 44
-            AddWire(is_output=True, wire_a_id=42, wire_b_id=44),  # 45
-        ]
-    }
+    from circuits import get_circuit
+
+    # the example circuits are registered in circuits.py: "basic", "deep", "wide", "adder" and "xors"
+    registered = get_circuit("bgw", "wide")
+    circuit = registered.build(sys.modules[__name__])
 
-    # circuit = circuits["deep"] 
-    circuit = circuits["wide"] 
-    # circuit = circuits["adder"] 
-    # circuit = circuits["xors"] 
     mod = 1024
     rng = SystemRandom(0)
 
     ttp = TTP(3, mod, rng)
-    clients = [
-        # Client(0, ttp, circuit, {0: 9}, mod, rng), # basic, deep, adder
-        # Client(1, ttp, circuit, {1: 5}, mod, rng), # basic, deep, adder
-        # Client(2, ttp, circuit, {2: 3}, mod, rng) # basic, adder
-        # Client(2, ttp, circuit, {2: 3, 3: 4}, mod, rng) # deep
-        Client(0, ttp, circuit, {0: 3, 1: 2, 2: 1, 3: 7}, mod, rng), # wide
-        Client(1, ttp, circuit, {4: 3, 5: 4, 6: 4, 7: 9}, mod, rng), # wide
-        Client(2, ttp, circuit, {8: 9, 9: 2, 10: 10, 11: 7}, mod, rng) # wide
-        # Client(0, ttp, circuit, {0: 1, 1: 1}, mod, rng), # xors
-        # Client(1, ttp, circuit, {2: 1, 3: 0}, mod, rng), # xors
-        # Client(2, ttp, circuit, {4: 1, 5: 1}, mod, rng) # xors
-    ]
-
-    print(BGW.run_circuit(clients))
+    clients = [Client(client_id, ttp, circuit, inputs, mod, rng) for client_id, inputs in enumerate(registered.inputs)]
+
+    outputs, metrics = BGW.run_circuit(clients, return_metrics=True)
+    print(outputs)
 
 
     print("COUNT_TTP_get_beaver_triple:", COUNT_TTP_get_beaver_triple)
@@ -723,7 +2753,12 @@ def main():
     print("COUNT_BGW_add:", COUNT_BGW_add)
     print("COUNT_BGW_const_mult:", COUNT_BGW_const_mult)
     print("COUNT_BGW_mult:", COUNT_BGW_mult)
+    print("COUNT_BGW_rounds:", COUNT_BGW_rounds)
     print("MESSAGES_SENT_BGW:", MESSAGES_SENT_BGW)
+    print("metrics:", metrics.as_dict())
+
+    # what the optimizer would save on this circuit
+    print(BGW.optimize_circuit(circuit).report())
 
 
     # ######################## TESTING ########################
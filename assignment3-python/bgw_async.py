@@ -0,0 +1,495 @@
+from __future__ import annotations
+
+import asyncio
+import os
+import struct
+import tempfile
+import time
+from random import SystemRandom
+from typing import Dict, List, Tuple
+
+import numpy as np
+
+import bgw
+from bgw import BGW, OP_ADD, OP_INNER_PRODUCT, OP_MULT, Client, CompiledCircuit
+from bgw_mp import RemoteClient
+
+# frame kinds of the wire protocol between parties
+FRAME_HELLO = 0
+FRAME_INPUT_SHARES = 1
+FRAME_MASKED_SHARES = 2
+FRAME_OUTPUT_SHARES = 3
+FRAME_INPUT_SEED = 4
+FRAME_OPENED_VALUES = 5
+
+# every frame starts with: kind, sender ID, round ID, payload length
+FRAME_HEADER = struct.Struct("<BxxxIIQ")
+
+# assignments values, summed over all parties
+MESSAGES_SENT_ASYNC = 0
+BYTES_SENT_ASYNC = 0
+COUNT_ASYNC_rounds = 0
+SECONDS_ASYNC_online = 0.0
+
+
+def encode_shares(shares: np.ndarray, mod: int) -> bytes:
+    """Encodes the [shares] under modulo [mod] as little-endian integers of [BGW.share_width] bytes each."""
+
+    dtype = BGW.dtype(mod)
+
+    if dtype != object:
+        return np.ascontiguousarray(shares, dtype=dtype.newbyteorder("<")).tobytes()
+
+    width = BGW.share_width(mod)
+    return b"".join(int(share).to_bytes(width, "little") for share in shares.ravel())
+
+
+def decode_shares(data: bytes, mod: int) -> np.ndarray:
+    """Decodes a flat array of shares under modulo [mod] that was encoded by [encode_shares]."""
+
+    dtype = BGW.dtype(mod)
+
+    if dtype != object:
+        return np.frombuffer(data, dtype=dtype.newbyteorder("<")).astype(dtype)
+
+    width = BGW.share_width(mod)
+    return np.array([int.from_bytes(data[i:i + width], "little") for i in range(0, len(data), width)], dtype=object)
+
+
+def split_layer(client: Client, layer_id: int) -> Tuple[List[np.ndarray], List[np.ndarray]]:
+    """Splits the linear waves of layer [layer_id] of the [client] into the waves that the [MultWire]s,
+    [InnerProductWire]s and [MatMultWire]s of that layer depend on, and the remaining waves, which can be computed while
+    the masked shares are in flight."""
+
+    layer = client.layers[layer_id]
+    _, a_wires, b_wires, _ = client.layer_pairs[layer_id]
+    needed = np.zeros(len(client.ops), dtype=bool)
+    needed[a_wires] = True
+    needed[b_wires] = True
+    for _, _, _, matrix_a, matrix_b, _ in client.layer_matrices[layer_id]:
+        needed[matrix_a] = True
+        needed[matrix_b] = True
+
+    for wave in reversed(layer.linear_waves):
+        wave_needed = wave[needed[wave]]
+        needed[client.a_ids[wave_needed]] = True
+        needed[client.b_ids[wave_needed[client.ops[wave_needed] == OP_ADD]]] = True
+
+    return ([wave[needed[wave]] for wave in layer.linear_waves],
+            [wave[~needed[wave]] for wave in layer.linear_waves])
+
+
+class Party:
+    """One client of the BGW protocol as a network party. It talks to the other parties over stream sockets using
+    binary frames. Incoming frames are dispatched to the [on_input_shares], [on_input_seed], [on_masked_shares],
+    [on_opened_values] and [on_output_shares] handlers by a reader task per connection, so receiving overlaps with local computation."""
+
+    def __init__(self, client: Client, client_count: int):
+        """Initializes the party that runs [client] in a protocol with [client_count] parties."""
+
+        self.client = client
+        self.client_count = client_count
+        self.client_id = client.client_id
+
+        self.writers = {}
+        """peer_id -> the stream used to send frames to that peer"""
+
+        self.inbox = {}
+        """(kind, round_id, sender_id) -> a future that is resolved with the payload of that frame"""
+
+        self.closed = {}
+        """peer_id -> the error that ended the connection to that peer, with which every frame that is still awaited
+        from that peer fails"""
+
+        self.readers = []
+        self.server = None
+
+        self.messages_sent = 0
+        self.bytes_sent = 0
+
+    def future(self, key) -> asyncio.Future:
+        """Returns the future in [inbox] for [key], creating it if needed."""
+
+        if key not in self.inbox:
+            self.inbox[key] = asyncio.get_running_loop().create_future()
+
+            # nothing more arrives from a peer whose connection ended
+            if key[2] in self.closed:
+                self.inbox[key].set_exception(self.closed[key[2]])
+
+        return self.inbox[key]
+
+    def fail(self, peer_ids, error: Exception):
+        """Fails every frame that is awaited from [peer_ids] now or later with [error]."""
+
+        for peer_id in peer_ids:
+            self.closed.setdefault(peer_id, error)
+
+        for (_, _, sender_id), future in self.inbox.items():
+            if sender_id in peer_ids and not future.done():
+                future.set_exception(self.closed[sender_id])
+
+    def send(self, peer_id: int, kind: int, round_id: int, payload: bytes):
+        """Queues a frame for [peer_id]. This does not wait for the frame to be sent; see [flush]."""
+
+        self.writers[peer_id].write(FRAME_HEADER.pack(kind, self.client_id, round_id, len(payload)) + payload)
+
+        self.messages_sent += 1
+        self.bytes_sent += FRAME_HEADER.size + len(payload)
+
+    async def flush(self):
+        """Waits until all queued frames have been handed to the operating system."""
+
+        await asyncio.gather(*(writer.drain() for writer in self.writers.values()))
+
+    async def receive(self, kind: int, round_id: int, sender_id: int):
+        """Waits for the frame of type [kind] for round [round_id] from [sender_id] and returns its decoded payload."""
+
+        key = (kind, round_id, sender_id)
+
+        try:
+            return await self.future(key)
+        finally:
+            del self.inbox[key]
+
+    def on_input_shares(self, sender_id: int, payload: bytes):
+        """Handles the input shares that [sender_id] created for this party: wire IDs followed by the shares."""
+
+        batch_shape = self.client.batch_shape
+        count = len(payload) // (8 + BGW.share_width(self.client.mod) * int(np.prod(batch_shape)))
+        wire_ids = np.frombuffer(payload[:8 * count], dtype="<i8").tolist()
+        shares = decode_shares(payload[8 * count:], self.client.mod).reshape((count,) + batch_shape)
+
+        self.future((FRAME_INPUT_SHARES, 0, sender_id)).set_result(dict(zip(wire_ids, shares)))
+
+    def on_input_seed(self, sender_id: int, payload: bytes):
+        """Handles the seed from which this party expands its shares of the inputs of [sender_id]."""
+
+        self.future((FRAME_INPUT_SEED, 0, sender_id)).set_result(int.from_bytes(payload, "little"))
+
+    def on_masked_shares(self, sender_id: int, round_id: int, payload: bytes):
+        """Handles the masked shares that [sender_id] published for layer [round_id]."""
+
+        masked = decode_shares(payload, self.client.mod).reshape((-1, 2) + self.client.batch_shape)
+        self.future((FRAME_MASKED_SHARES, round_id, sender_id)).set_result(masked)
+
+    def on_opened_values(self, sender_id: int, round_id: int, payload: bytes):
+        """Handles the values that [sender_id] opened as the king of layer [round_id]."""
+
+        opened = decode_shares(payload, self.client.mod).reshape((-1, 2) + self.client.batch_shape)
+        self.future((FRAME_OPENED_VALUES, round_id, sender_id)).set_result(opened)
+
+    def on_output_shares(self, sender_id: int, payload: bytes):
+        """Handles the shares of the output wires that [sender_id] sent to this party."""
+
+        shares = decode_shares(payload, self.client.mod).reshape((-1,) + self.client.batch_shape)
+        self.future((FRAME_OUTPUT_SHARES, 0, sender_id)).set_result(shares)
+
+    async def read_frames(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter, peer_id: int | None = None):
+        """Reads frames from the connection to [peer_id] (which is learnt from its hello frame if it opened the
+        connection) until it is closed, and dispatches them to the handlers. However the connection ends, the frames
+        that are still awaited from the peer fail (those from all peers if it never said hello), so that [run] raises
+        instead of waiting forever."""
+
+        try:
+            while True:
+                try:
+                    header = await reader.readexactly(FRAME_HEADER.size)
+                except asyncio.IncompleteReadError as error:
+                    if error.partial:
+                        raise
+                    raise ConnectionError(f"Party {self.client_id} lost the connection to party {peer_id}.")
+
+                kind, sender_id, round_id, length = FRAME_HEADER.unpack(header)
+                payload = await reader.readexactly(length)
+
+                if kind == FRAME_HELLO:
+                    peer_id = sender_id
+                    self.writers[sender_id] = writer
+                    self.future(("connected", 0, sender_id)).set_result(True)
+                elif kind == FRAME_INPUT_SHARES:
+                    self.on_input_shares(sender_id, payload)
+                elif kind == FRAME_INPUT_SEED:
+                    self.on_input_seed(sender_id, payload)
+                elif kind == FRAME_MASKED_SHARES:
+                    self.on_masked_shares(sender_id, round_id, payload)
+                elif kind == FRAME_OPENED_VALUES:
+                    self.on_opened_values(sender_id, round_id, payload)
+                elif kind == FRAME_OUTPUT_SHARES:
+                    self.on_output_shares(sender_id, payload)
+                else:
+                    raise ValueError(f"Party {self.client_id} received a frame of unknown kind {kind}.")
+        except Exception as error:
+            self.fail(range(self.client_count) if peer_id is None else [peer_id], error)
+
+    async def on_connection(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        """Handles a connection that was opened by a party with a lower ID."""
+
+        self.readers.append(asyncio.current_task())
+        await self.read_frames(reader, writer)
+
+    async def serve(self, address: str | Tuple[str, int]) -> str | Tuple[str, int]:
+        """Starts listening for the other parties on [address], which is either a `(host, port)` pair for TCP or the
+        path of a Unix socket. Returns the address that the other parties should connect to."""
+
+        if isinstance(address, tuple):
+            self.server = await asyncio.start_server(self.on_connection, *address)
+            return self.server.sockets[0].getsockname()[:2]
+        else:
+            self.server = await asyncio.start_unix_server(self.on_connection, address)
+            return address
+
+    async def connect(self, addresses: List[str | Tuple[str, int]]):
+        """Connects to every other party, given the [addresses] of all parties ordered by client ID. Every pair of
+        parties shares one connection, which is opened by the party with the lower ID."""
+
+        for peer_id in range(self.client_id + 1, self.client_count):
+            address = addresses[peer_id]
+
+            if isinstance(address, tuple):
+                reader, writer = await asyncio.open_connection(*address)
+            else:
+                reader, writer = await asyncio.open_unix_connection(address)
+
+            self.writers[peer_id] = writer
+            self.send(peer_id, FRAME_HELLO, 0, b"")
+            self.readers.append(asyncio.create_task(self.read_frames(reader, writer, peer_id)))
+
+        for peer_id in range(self.client_id):
+            await self.receive("connected", 0, peer_id)
+
+    async def run(self) -> Dict[int, int] | None:
+        """Runs the protocol for this party once it is connected. Returns the outputs for party 0, `None` otherwise."""
+
+        client = self.client
+        board = AsyncBoard(self)
+        peers = [client if peer_id == self.client_id else RemoteClient(peer_id) for peer_id in range(self.client_count)]
+
+        client.set_clients(peers, board)
+        client.local_setup()
+
+        # input shares: one frame per peer, holding either the shares or the seed to expand them from
+        input_ids = list(client.inputs)
+        for peer_id in self.writers:
+            if client.seeded_inputs:
+                self.send(peer_id, FRAME_INPUT_SEED, 0, client.get_input_seed(peer_id).to_bytes(16, "little"))
+                continue
+
+            shares = np.array([client.get_input_share(wire_id, peer_id) for wire_id in input_ids],
+                              dtype=BGW.dtype(client.mod))
+            self.send(peer_id, FRAME_INPUT_SHARES, 0,
+                      np.array(input_ids, dtype="<i8").tobytes() + encode_shares(shares, client.mod))
+        await self.flush()
+
+        for peer_id in self.writers:
+            if client.seeded_inputs:
+                peers[peer_id].input_seed = await self.receive(FRAME_INPUT_SEED, 0, peer_id)
+            else:
+                peers[peer_id].input_shares = await self.receive(FRAME_INPUT_SHARES, 0, peer_id)
+
+        client.interactive_setup()
+
+        start = time.perf_counter()
+        rounds = 0
+
+        for layer_id, layer in enumerate(client.layers):
+            needed, deferred = split_layer(client, layer_id)
+
+            client.run_waves(needed)
+
+            if layer.interactive:
+                client.mask_layer(layer_id)
+                flushed = asyncio.ensure_future(self.flush())
+
+                # the rest of the layer is computed while the masked shares are on their way
+                client.run_waves(deferred)
+
+                await flushed
+                await board.wait(layer_id)
+                client.open_layer(layer_id)
+                rounds += 1
+            else:
+                client.run_waves(deferred)
+
+        # only party 0 learns the outputs, like [Client.get_outputs] does
+        output_ids = client.compiled.output_ids()
+        outputs = None
+
+        if self.client_id != 0:
+            self.send(0, FRAME_OUTPUT_SHARES, 0, encode_shares(client.get_share(output_ids), client.mod))
+            await self.flush()
+        else:
+            for peer_id in self.writers:
+                peers[peer_id].shares = dict(zip(output_ids, await self.receive(FRAME_OUTPUT_SHARES, 0, peer_id)))
+
+            outputs = client.get_outputs()
+
+            global COUNT_ASYNC_rounds, SECONDS_ASYNC_online
+            COUNT_ASYNC_rounds += rounds
+            SECONDS_ASYNC_online += time.perf_counter() - start
+
+        return outputs
+
+    async def close(self):
+        """Closes all connections of this party and waits for its reader tasks to finish."""
+
+        for writer in self.writers.values():
+            writer.close()
+
+        if self.server is not None:
+            self.server.close()
+
+        await asyncio.gather(*self.readers, return_exceptions=True)
+
+
+class AsyncBoard:
+    """A [bgw.BroadcastBoard] on top of a [Party]: publishing queues a frame for every peer, and [wait] waits until the
+    frames of all peers for a round have arrived, after which [read] returns them without blocking. If the client of
+    the party uses king_party, it works like a [bgw.KingBoard] instead: frames only go to the king of the round, and
+    [wait] waits until the king has opened the round."""
+
+    def __init__(self, party: Party):
+        """Initializes the board of [party]."""
+
+        self.party = party
+        self.messages = {}
+
+        self.opened = {}
+        """round_id -> the values that the king opened for that round, with king_party"""
+
+    def king_id(self, round_id: int) -> int | None:
+        """Returns the ID of the party that opens round [round_id], or `None` if every party opens it itself."""
+
+        return round_id % self.party.client_count if self.party.client.king_party else None
+
+    def publish(self, round_id: int, client_id: int, message):
+        """Queues the [message] of this party for round [round_id] for all other parties, or for the king of the round
+        only."""
+
+        self.messages[round_id] = {client_id: message}
+        payload = encode_shares(message, self.party.client.mod)
+        king_id = self.king_id(round_id)
+
+        for peer_id in self.party.writers:
+            if king_id is None or peer_id == king_id:
+                self.party.send(peer_id, FRAME_MASKED_SHARES, round_id, payload)
+
+    async def wait(self, round_id: int):
+        """Waits until the messages of all other parties for round [round_id] have been received. With king_party, the
+        king opens them and sends the opened values to the other parties, which wait for those instead."""
+
+        king_id = self.king_id(round_id)
+
+        if king_id is not None and king_id != self.party.client_id:
+            del self.messages[round_id]
+            self.opened[round_id] = await self.party.receive(FRAME_OPENED_VALUES, round_id, king_id)
+            return
+
+        for peer_id in self.party.writers:
+            self.messages[round_id][peer_id] = await self.party.receive(FRAME_MASKED_SHARES, round_id, peer_id)
+
+        if king_id is not None:
+            mod = self.party.client.mod
+            self.opened[round_id] = BGW.recover_secret_batch(np.stack(self.read(round_id)), mod)
+            payload = encode_shares(self.opened[round_id], mod)
+
+            for peer_id in self.party.writers:
+                self.party.send(peer_id, FRAME_OPENED_VALUES, round_id, payload)
+            await self.party.flush()
+
+    def read(self, round_id: int) -> List:
+        """Returns the messages of all parties for round [round_id], ordered by client ID."""
+
+        messages = self.messages.pop(round_id)
+        return [messages[client_id] for client_id in range(self.party.client_count)]
+
+    def open(self, round_id: int, mod: int) -> np.ndarray:
+        """Returns the values that the messages of round [round_id] open to under modulo [mod], once [wait] is done."""
+
+        if round_id in self.opened:
+            return self.opened.pop(round_id)
+
+        return BGW.recover_secret_batch(np.stack(self.read(round_id)), mod)
+
+
+async def run_circuit_async(clients: List[Client], transport: str = "tcp") -> Dict[int, int]:
+    """Makes the [clients] compute their circuit as network parties in this event loop, connected over loopback TCP
+    (`"tcp"`) or Unix sockets (`"unix"`). The [bgw.TTP] of the first client performs the offline phase first."""
+
+    # offline phase
+    circuit = clients[0].circuit
+    if type(circuit) != CompiledCircuit:
+        circuit = BGW.compile_circuit(circuit)
+
+    for client in clients:
+        client.circuit = circuit
+
+    ops = np.frombuffer(circuit.ops, dtype=np.uint8)
+    keys, _, _, sizes = BGW.mult_pairs(circuit, np.flatnonzero((ops == OP_MULT) | (ops == OP_INNER_PRODUCT)))
+    clients[0].ttp.preprocess(keys, sizes)
+    if len(circuit.matrices):
+        products = np.arange(len(circuit.matrices) // 4)
+        clients[0].ttp.preprocess_matrices(products, BGW.matrix_shapes(circuit, products))
+
+    parties = [Party(client, len(clients)) for client in clients]
+
+    with tempfile.TemporaryDirectory() as directory:
+        if transport == "tcp":
+            addresses = [await party.serve(("127.0.0.1", 0)) for party in parties]
+        elif transport == "unix":
+            addresses = [await party.serve(os.path.join(directory, f"party_{party.client_id}.sock"))
+                         for party in parties]
+        else:
+            raise ValueError(f"Unknown transport {transport!r}, expected 'tcp' or 'unix'.")
+
+        try:
+            await asyncio.gather(*(party.connect(addresses) for party in parties))
+            outputs = (await asyncio.gather(*(party.run() for party in parties)))[0]
+        finally:
+            for party in parties:
+                await party.close()
+
+    global MESSAGES_SENT_ASYNC, BYTES_SENT_ASYNC
+    MESSAGES_SENT_ASYNC += sum(party.messages_sent for party in parties)
+    BYTES_SENT_ASYNC += sum(party.bytes_sent for party in parties)
+
+    return outputs
+
+
+def run_circuit(clients: List[Client], transport: str = "tcp") -> Dict[int, int]:
+    """Runs [run_circuit_async] in a new event loop."""
+
+    return asyncio.run(run_circuit_async(clients, transport))
+
+
+def main():
+    global COUNT_ASYNC_rounds, SECONDS_ASYNC_online
+
+    mod = 1024
+    rng = SystemRandom(0)
+
+    # a chain of multiplications, so that every round depends on the previous one
+    depth = 200
+    circuit = [bgw.InputWire(is_output=False, owner_id=0), bgw.InputWire(is_output=False, owner_id=1)]
+    for i in range(depth):
+        circuit.append(bgw.MultWire(is_output=i == depth - 1, wire_a_id=len(circuit) - 1, wire_b_id=1))
+
+    for transport in ["tcp", "unix"]:
+        COUNT_ASYNC_rounds, SECONDS_ASYNC_online = 0, 0.0
+
+        ttp = bgw.TTP(3, mod, rng)
+        clients = [
+            Client(0, ttp, circuit, {0: 3}, mod, rng),
+            Client(1, ttp, circuit, {1: 5}, mod, rng),
+            Client(2, ttp, circuit, {}, mod, rng),
+        ]
+
+        print(transport, run_circuit(clients, transport))
+        print("rounds per second:", COUNT_ASYNC_rounds / SECONDS_ASYNC_online)
+
+    print("MESSAGES_SENT_ASYNC:", MESSAGES_SENT_ASYNC)
+    print("BYTES_SENT_ASYNC:", BYTES_SENT_ASYNC)
+
+
+if __name__ == "__main__":
+    main()
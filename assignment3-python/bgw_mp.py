@@ -0,0 +1,358 @@
+from __future__ import annotations
+
+import multiprocessing
+import pickle
+import queue
+import traceback
+from random import SystemRandom
+from typing import Dict, List
+
+import numpy as np
+
+import bgw
+from bgw import BGW, OP_INNER_PRODUCT, OP_MULT, Client, CompiledCircuit
+
+# message kinds of the message layer between client processes
+MSG_INPUT_SHARES = "input"
+MSG_INPUT_SEED = "seed"
+MSG_MASKED_SHARES = "masked"
+MSG_OPENED_VALUES = "opened"
+MSG_OUTPUT_SHARES = "output"
+
+# how often the parent checks for client processes that died without reporting, in seconds
+RESULT_POLL_SECONDS = 0.5
+
+# assignments values, summed over all client processes
+MESSAGES_SENT_MP = 0
+BYTES_SENT_MP = 0
+
+
+class Network:
+    """The message layer of one client process. Every client process has an inbox queue, and a message is sent by
+    serializing it and putting it in the inbox of the receiver. Messages that arrive before they are needed are
+    buffered until they are received."""
+
+    def __init__(self, client_id: int, inboxes: List[multiprocessing.Queue]):
+        """Initializes the message layer of client [client_id], given the [inboxes] of all clients."""
+
+        self.client_id = client_id
+        self.inboxes = inboxes
+
+        self.buffer = {}
+        """(kind, round_id, sender_id) -> payload of a message that was received but not yet asked for"""
+
+        self.messages_sent = 0
+        self.bytes_sent = 0
+
+    def send(self, receiver_id: int, kind: str, round_id: int, payload):
+        """Sends the message [payload] of type [kind] for round [round_id] to client [receiver_id]."""
+
+        data = pickle.dumps((kind, round_id, self.client_id, payload), protocol=pickle.HIGHEST_PROTOCOL)
+        self.inboxes[receiver_id].put(data)
+
+        self.messages_sent += 1
+        self.bytes_sent += len(data)
+
+    def receive(self, kind: str, round_id: int, sender_id: int):
+        """Waits for the message of type [kind] for round [round_id] from client [sender_id] and returns its payload."""
+
+        key = (kind, round_id, sender_id)
+
+        while key not in self.buffer:
+            message_kind, message_round, message_sender, payload = pickle.loads(self.inboxes[self.client_id].get())
+            self.buffer[(message_kind, message_round, message_sender)] = payload
+
+        return self.buffer.pop(key)
+
+
+class NetworkBoard:
+    """A [bgw.BroadcastBoard] on top of a [Network]: publishing sends the message to every other client process, and
+    reading receives the messages of all of them. With [king_party], it works like a [bgw.KingBoard] instead: messages
+    are only sent to the king of the round, which opens them and sends the opened values to the other processes."""
+
+    def __init__(self, network: Network, client_count: int, king_party: bool = False):
+        """Initializes the board of the client that owns [network], for [client_count] clients."""
+
+        self.network = network
+        self.client_count = client_count
+        self.king_party = king_party
+
+        self.own_messages = {}
+        """round_id -> the message that this client published in that round"""
+
+    def publish(self, round_id: int, client_id: int, message):
+        """Sends the [message] of this client for round [round_id] to all other clients, or to the king of the round
+        only."""
+
+        self.own_messages[round_id] = message
+        receiver_ids = [round_id % self.client_count] if self.king_party else range(self.client_count)
+
+        for receiver_id in receiver_ids:
+            if receiver_id != client_id:
+                self.network.send(receiver_id, MSG_MASKED_SHARES, round_id, message)
+
+    def read(self, round_id: int) -> List:
+        """Returns the messages of all clients for round [round_id], ordered by client ID."""
+
+        return [self.own_messages.pop(round_id) if sender_id == self.network.client_id
+                else self.network.receive(MSG_MASKED_SHARES, round_id, sender_id)
+                for sender_id in range(self.client_count)]
+
+    def open(self, round_id: int, mod: int) -> np.ndarray:
+        """Returns the values that the messages of round [round_id] open to under modulo [mod]. With [king_party], the
+        king receives the messages, opens them and sends the result to all other clients, which wait for it."""
+
+        king_id = round_id % self.client_count
+
+        if self.king_party and king_id != self.network.client_id:
+            self.own_messages.pop(round_id)
+            return self.network.receive(MSG_OPENED_VALUES, round_id, king_id)
+
+        opened = BGW.recover_secret_batch(np.stack(self.read(round_id)), mod)
+
+        if self.king_party:
+            for receiver_id in range(self.client_count):
+                if receiver_id != king_id:
+                    self.network.send(receiver_id, MSG_OPENED_VALUES, round_id, opened)
+
+        return opened
+
+
+class RemoteClient:
+    """Stands in for another client inside a client process. It only holds what that client sent over the [Network],
+    so the local [Client] can read input and output shares from it as if it were the real one."""
+
+    def __init__(self, client_id: int):
+        """Initializes the stand-in for client [client_id], which has not sent anything yet."""
+
+        self.client_id = client_id
+
+        self.input_shares = {}
+        """wire_id -> the share of this client's input at that wire that it sent to us"""
+
+        self.input_seed = None
+        """The seed that this client sent us to expand our shares of its inputs from, with `seeded_inputs`"""
+
+        self.shares = {}
+        """wire_id -> the share of that output wire that this client sent to us"""
+
+    def get_input_share(self, wire_id: int, requester_id: int) -> int:
+        """Returns the share of this client's input at wire [wire_id] that it sent to us."""
+
+        return self.input_shares[wire_id]
+
+    def get_input_seed(self, requester_id: int) -> int:
+        """Returns the seed that this client sent us for its inputs."""
+
+        return self.input_seed
+
+    def get_share(self, wire_id: int) -> int:
+        """Returns the share of output wire [wire_id] that this client sent to us."""
+
+        return self.shares[wire_id]
+
+
+class ReceivedTriples:
+    """The Beaver triple shares that the parent process sent to one client process, used in place of the [bgw.TTP]."""
+
+    def __init__(self, wire_ids: np.ndarray, triples: np.ndarray, matrix_triples: List | None = None):
+        """Initializes the triples from the sorted multiplication gates [wire_ids] (the keys of [BGW.mult_pairs]) and
+        their [triples], and the [matrix_triples] of all matrix products of the circuit, in order."""
+
+        self.wire_ids = wire_ids
+        self.triples = triples
+        self.matrix_triples = matrix_triples or []
+
+    def get_beaver_triples(self, wire_ids: np.ndarray, client_id: int) -> np.ndarray:
+        """Returns this client's shares of the Beaver triples for the multiplication gates [wire_ids]."""
+
+        return self.triples[np.searchsorted(self.wire_ids, wire_ids)]
+
+    def get_matrix_triples(self, products: np.ndarray, shapes: List, client_id: int) -> List:
+        """Returns this client's shares of the matrix triples of the matrix [products]."""
+
+        return [self.matrix_triples[product] for product in np.asarray(products).tolist()]
+
+    def preprocess(self, wire_ids: np.ndarray, sizes: np.ndarray | None = None):
+        """Does nothing, the triples were generated before they were received."""
+
+    def preprocess_matrices(self, products: np.ndarray, shapes: List):
+        """Does nothing, the matrix triples were generated before they were received."""
+
+
+def deal_triples(ttp, circuit: CompiledCircuit, client_count: int) -> List[ReceivedTriples]:
+    """Performs the offline phase of the [circuit] with the [ttp] and returns the triples of each of the [client_count]
+    clients, ordered by client ID, so that they can be sent to processes that do not have the [ttp]."""
+
+    ops = np.frombuffer(circuit.ops, dtype=np.uint8)
+    keys, _, _, sizes = BGW.mult_pairs(circuit, np.flatnonzero((ops == OP_MULT) | (ops == OP_INNER_PRODUCT)))
+    ttp.preprocess(keys, sizes)
+    # [ReceivedTriples] looks the keys up by binary search
+    mult_ids = np.sort(keys)
+    products = np.arange(len(circuit.matrices) // 4)
+    shapes = BGW.matrix_shapes(circuit, products)
+    ttp.preprocess_matrices(products, shapes)
+
+    return [ReceivedTriples(mult_ids, np.asarray(ttp.get_beaver_triples(mult_ids, client_id)),
+                            ttp.get_matrix_triples(products, shapes, client_id))
+            for client_id in range(client_count)]
+
+
+def run_client(client_id: int, circuit: CompiledCircuit, inputs: Dict[int, int], mod: int, batch_size: int | None,
+               seeded_inputs: bool, free_shares: bool, king_party: bool, triples: ReceivedTriples,
+               inboxes: List[multiprocessing.Queue], results: multiprocessing.Queue):
+    """The body of the process of client [client_id]. Runs the whole protocol for that client, exchanging input shares,
+    masked shares and output shares with the other client processes, and reports the outputs (client 0 only) and the
+    message statistics of this client to [results]."""
+
+    try:
+        client_count = len(inboxes)
+        network = Network(client_id, inboxes)
+
+        client = Client(client_id, triples, circuit, inputs, mod, SystemRandom(), batch_size, seeded_inputs, free_shares,
+                        king_party)
+        clients = [client if other_id == client_id else RemoteClient(other_id) for other_id in range(client_count)]
+
+        client.set_clients(clients, NetworkBoard(network, client_count, king_party))
+        client.local_setup()
+
+        # every client sends all of its input shares for a peer in one message, or just the seed to expand them from
+        for other in clients:
+            if other is client:
+                continue
+            elif seeded_inputs:
+                network.send(other.client_id, MSG_INPUT_SEED, 0, client.get_input_seed(other.client_id))
+            else:
+                network.send(other.client_id, MSG_INPUT_SHARES, 0,
+                             {wire_id: client.get_input_share(wire_id, other.client_id) for wire_id in inputs})
+
+        for other in clients:
+            if other is client:
+                continue
+            elif seeded_inputs:
+                other.input_seed = network.receive(MSG_INPUT_SEED, 0, other.client_id)
+            else:
+                other.input_shares = network.receive(MSG_INPUT_SHARES, 0, other.client_id)
+
+        client.interactive_setup()
+
+        for layer_id, layer in enumerate(client.layers):
+            client.run_layer_until_mult(layer_id)
+
+            if layer.interactive:
+                client.open_layer(layer_id)
+
+        # only client 0 learns the outputs, like [Client.get_outputs] does
+        output_ids = circuit.output_ids()
+        outputs = None
+
+        if client_id != 0:
+            network.send(0, MSG_OUTPUT_SHARES, 0, client.get_share(output_ids))
+        else:
+            for other in clients[1:]:
+                other.shares = dict(zip(output_ids, network.receive(MSG_OUTPUT_SHARES, 0, other.client_id)))
+
+            outputs = client.get_outputs()
+
+        results.put((client_id, outputs, network.messages_sent, network.bytes_sent, None))
+    except BaseException:
+        results.put((client_id, None, 0, 0, traceback.format_exc()))
+
+
+def run_circuit(clients: List[Client]) -> Dict[int, int]:
+    """Makes the [clients] compute their circuit like [BGW.run_circuit] does, but with every client in its own OS
+    process. The clients only talk to each other through explicit messages, whose counts and sizes are added to
+    `MESSAGES_SENT_MP` and `BYTES_SENT_MP`. The [bgw.TTP] of the first client performs the offline phase in this
+    process and sends every client process its triple shares when it is started."""
+
+    circuit = clients[0].circuit
+    if type(circuit) != CompiledCircuit:
+        circuit = BGW.compile_circuit(circuit)
+
+    # offline phase
+    triples = deal_triples(clients[0].ttp, circuit, len(clients))
+
+    context = multiprocessing.get_context()
+    inboxes = [context.Queue() for _ in clients]
+    results = context.Queue()
+
+    processes = [
+        context.Process(target=run_client, args=(client.client_id, circuit, client.inputs, client.mod, client.batch_size,
+                                                  client.seeded_inputs, client.free_shares, client.king_party,
+                                                  triples[client.client_id], inboxes, results))
+        for client in clients
+    ]
+
+    for process in processes:
+        process.start()
+
+    outputs = None
+    errors = []
+    reported = set()
+
+    while len(reported) < len(clients) and not errors:
+        try:
+            client_id, client_outputs, messages_sent, bytes_sent, error = results.get(timeout=RESULT_POLL_SECONDS)
+        except queue.Empty:
+            # a process that was killed (or crashed in native code) never reports; one that exited normally has
+            # already put its result in the queue
+            errors = [f"Client {client.client_id} exited with code {process.exitcode} without reporting a result."
+                      for client, process in zip(clients, processes)
+                      if client.client_id not in reported and process.exitcode not in (None, 0)]
+            if errors:
+                for process in processes:
+                    process.terminate()
+            continue
+
+        reported.add(client_id)
+
+        if error is not None:
+            errors.append(f"Client {client_id} failed:\n{error}")
+            # the other processes may be waiting for this one forever
+            for process in processes:
+                process.terminate()
+            break
+
+        if client_id == 0:
+            outputs = client_outputs
+
+        global MESSAGES_SENT_MP, BYTES_SENT_MP
+        MESSAGES_SENT_MP += messages_sent
+        BYTES_SENT_MP += bytes_sent
+
+    for process in processes:
+        process.join()
+
+    if errors:
+        raise RuntimeError("\n".join(errors))
+
+    return outputs
+
+
+def main():
+    mod = 1024
+    rng = SystemRandom(0)
+    circuit = [
+        bgw.InputWire(is_output=False, owner_id=0),  # 0
+        bgw.InputWire(is_output=False, owner_id=1),  # 1
+        bgw.InputWire(is_output=False, owner_id=2),  # 2
+        bgw.AddWire(is_output=False, wire_a_id=0, wire_b_id=1),  # 3
+        bgw.ConstMultWire(is_output=False, c=6, wire_a_id=2),  # 4
+        bgw.MultWire(is_output=True, wire_a_id=3, wire_b_id=4),  # 5
+    ]
+
+    ttp = bgw.TTP(3, mod, rng)
+    clients = [
+        Client(0, ttp, circuit, {0: 9}, mod, rng),
+        Client(1, ttp, circuit, {1: 5}, mod, rng),
+        Client(2, ttp, circuit, {2: 3}, mod, rng),
+    ]
+
+    print(run_circuit(clients))
+
+    print("MESSAGES_SENT_MP:", MESSAGES_SENT_MP)
+    print("BYTES_SENT_MP:", BYTES_SENT_MP)
+
+
+if __name__ == "__main__":
+    main()
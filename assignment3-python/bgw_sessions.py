@@ -0,0 +1,162 @@
+from __future__ import annotations
+
+import concurrent.futures
+import os
+import threading
+import time
+from random import SystemRandom
+from typing import Dict, List, Tuple
+
+import numpy as np
+
+from bgw import BGW, TTP, Client, CompiledCircuit, Wire
+from bgw_mp import deal_triples
+from metrics import RunMetrics
+
+
+class SessionTTP(TTP):
+    """The triples of one session of a [SessionManager]. It has a pool of its own, indexed by the wire IDs of the
+    session's circuit, so sessions can use the same wire IDs without ever getting each other's triples, but every triple
+    is generated by the shared [TTP], with its randomness and settings. The pool is dropped with the session."""
+
+    def __init__(self, ttp: TTP):
+        """Initializes an empty pool that draws its triples from the shared [ttp]."""
+
+        super().__init__(ttp.client_count, ttp.mod, ttp.rng, ttp.batch_size)
+        self.ttp = ttp
+
+    def generate_triples(self, sizes: np.ndarray) -> np.ndarray:
+        """Generates the triples with the shared [TTP], see [TTP.generate_triples]."""
+
+        return self.ttp.generate_triples(sizes)
+
+
+def run_session(triples: List, circuit: CompiledCircuit, inputs: List[Dict[int, int]], mod: int,
+                batch_size: int | None, seeded_inputs: bool, free_shares: bool, king_party: bool) \
+        -> Tuple[Dict[int, int], RunMetrics]:
+    """The body of a session: makes a fresh [Client] for every client, with [triples] as its source of triples
+    (indexed by client ID) and [inputs] as its inputs, and runs the [circuit] with [BGW.run_circuit]. Returns the
+    outputs and the [RunMetrics] of the session."""
+
+    rng = SystemRandom()
+    clients = [Client(client_id, triples[client_id], circuit, inputs[client_id], mod, rng, batch_size, seeded_inputs,
+                      free_shares, king_party)
+               for client_id in range(len(inputs))]
+
+    return BGW.run_circuit(clients, return_metrics=True)
+
+
+class SessionManager:
+    """Runs many independent sessions, i.e. evaluations of a circuit by all clients, at the same time on a pool of
+    threads or processes. Each session has its own [Client]s, board and triple pool (a [SessionTTP]), so sessions never
+    share state, while all of them draw their triples from one shared [TTP], whose client count, modulo and batch size
+    they use.
+
+    Threads suit sessions whose time goes into large NumPy operations, which run without holding the GIL. Many small
+    sessions are mostly Python code, so those only run in parallel on a pool of processes; there, the shared [TTP]
+    deals the triples of each session in this process when the session is submitted, and sends them along with it."""
+
+    def __init__(self, ttp: TTP, workers: int | None = None, executor: str = "process"):
+        """Initializes a manager whose sessions share [ttp] and run on a pool of [workers] threads (`"thread"`) or
+        processes (`"process"`), as given by [executor]. By default, there is one worker per CPU."""
+
+        if executor == "thread":
+            self.pool = concurrent.futures.ThreadPoolExecutor(workers)
+        elif executor == "process":
+            self.pool = concurrent.futures.ProcessPoolExecutor(workers)
+        else:
+            raise ValueError(f"Unknown executor {executor!r}, expected 'thread' or 'process'.")
+
+        self.ttp = ttp
+        self.executor = executor
+        self.lock = threading.Lock()
+
+        self.compiled = {}
+        """id(circuit) -> the circuit and its compiled form, so that every distinct circuit is only compiled once"""
+
+    def compile(self, circuit: List[Wire] | CompiledCircuit) -> CompiledCircuit:
+        """Returns the compiled form of [circuit], compiling it if this manager did not see it before."""
+
+        if type(circuit) == CompiledCircuit:
+            return circuit
+
+        with self.lock:
+            if id(circuit) not in self.compiled:
+                self.compiled[id(circuit)] = (circuit, BGW.compile_circuit(circuit))
+
+            return self.compiled[id(circuit)][1]
+
+    def submit(self, circuit: List[Wire] | CompiledCircuit, inputs: List[Dict[int, int]], seeded_inputs: bool = False,
+               free_shares: bool = False, king_party: bool = False) -> concurrent.futures.Future:
+        """Starts a session that runs the [circuit] on the [inputs] of all clients (one mapping from wire IDs to input
+        values per client, ordered by client ID), with the given [seeded_inputs], [free_shares] and [king_party]
+        settings of the [Client]s. Returns a future of the outputs and the [RunMetrics] of the session."""
+
+        if len(inputs) != self.ttp.client_count:
+            raise ValueError(f"The TTP serves {self.ttp.client_count} clients, but {len(inputs)} sets of inputs were "
+                             f"given.")
+
+        circuit = self.compile(circuit)
+        session_ttp = SessionTTP(self.ttp)
+
+        if self.executor == "thread":
+            triples = [session_ttp] * len(inputs)
+        else:
+            triples = deal_triples(session_ttp, circuit, len(inputs))
+
+        return self.pool.submit(run_session, triples, circuit, inputs, self.ttp.mod, self.ttp.batch_size,
+                                seeded_inputs, free_shares, king_party)
+
+    def run(self, jobs: List[Tuple[List[Wire] | CompiledCircuit, List[Dict[int, int]]]], return_metrics: bool = False,
+            **settings) -> List:
+        """Runs a session for every `(circuit, inputs)` pair of [jobs], see [submit], and waits for all of them. Returns
+        the outputs of every session, in the order of [jobs], or pairs of outputs and [RunMetrics] if [return_metrics]
+        is `True`."""
+
+        futures = [self.submit(circuit, inputs, **settings) for circuit, inputs in jobs]
+        results = [future.result() for future in futures]
+
+        if return_metrics:
+            return results
+
+        return [outputs for outputs, _ in results]
+
+    def close(self):
+        """Waits for the running sessions and shuts the pool down."""
+
+        self.pool.shutdown()
+
+    def __enter__(self) -> SessionManager:
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+def main():
+    from bench import layered_circuit
+
+    # many small jobs: the same circuit on different inputs
+    mod = (1 << 61) - 1
+    session_count = 200
+    circuit, _ = layered_circuit(16, 4, 0.5, 3)
+    jobs = [(circuit, layered_circuit(16, 4, 0.5, 3, seed)[1]) for seed in range(session_count)]
+
+    ttp = TTP(3, mod, SystemRandom())
+
+    start = time.perf_counter()
+    for job_circuit, inputs in jobs:
+        run_session([SessionTTP(ttp)] * 3, BGW.compile_circuit(job_circuit), inputs, mod, None, False, False, False)
+    print(f"one after another: {session_count / (time.perf_counter() - start):.1f} sessions per second")
+
+    for executor in ["thread", "process"]:
+        with SessionManager(ttp, executor=executor) as manager:
+            start = time.perf_counter()
+            manager.run(jobs)
+            seconds = time.perf_counter() - start
+
+        print(f"{executor} pool of {os.cpu_count()}: {session_count / seconds:.1f} sessions per second")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,202 @@
+from __future__ import annotations
+
+from array import array
+from dataclasses import dataclass
+from typing import Dict, List
+
+import numpy as np
+
+# gate kinds of a [BristolCircuit]
+GATE_XOR = 0
+GATE_AND = 1
+GATE_INV = 2
+GATE_EQW = 3
+GATE_EQ = 4
+GATE_OR = 5
+
+GATE_KINDS = {"XOR": GATE_XOR, "AND": GATE_AND, "INV": GATE_INV, "NOT": GATE_INV, "EQW": GATE_EQW, "EQ": GATE_EQ,
+              "OR": GATE_OR}
+
+# turns every whitespace character of a Bristol Fashion file into a space
+WHITESPACE_TO_SPACES = bytes.maketrans(b"\t\n\v\f\r", b"     ")
+
+# stands in for the name of MAND gates while a file is parsed, MAND gates are split into GATE_AND gates
+MAND_CODE = 100
+
+
+@dataclass
+class BristolCircuit:
+    """A boolean circuit read from a Bristol Fashion file by [load_bristol], as flat arrays with one entry per gate. The
+    wires keep the numbering of the file: the input values occupy the first wires, one wire per bit, and the output
+    values the last ones. The gates are in topological order. [gc.from_bristol] and [bgw.BGW.from_bristol] turn it into
+    a circuit for either engine."""
+
+    wire_count: int
+    """The number of wires, including the input wires."""
+
+    input_sizes: List[int]
+    """The number of bits of each input value."""
+
+    output_sizes: List[int]
+    """The number of bits of each output value."""
+
+    kinds: bytearray
+    """The kind of each gate, one of the `GATE_*` constants."""
+
+    a_ids: array
+    """The first input wire of each gate, or the constant (`0` or `1`) for `GATE_EQ`."""
+
+    b_ids: array
+    """The second input wire of each gate, or its first input wire for gates with a single input."""
+
+    out_ids: array
+    """The output wire of each gate."""
+
+    def __len__(self) -> int:
+        return len(self.kinds)
+
+    @property
+    def input_count(self) -> int:
+        """The number of input wires, which are wires `0` to `input_count - 1`."""
+
+        return sum(self.input_sizes)
+
+    @property
+    def has_constants(self) -> bool:
+        """`True` if and only if the circuit contains `INV` or `EQ` gates, which need a constant `1` in arithmetic
+        circuits."""
+
+        kinds = np.frombuffer(self.kinds, dtype=np.uint8)
+        return bool(((kinds == GATE_INV) | (kinds == GATE_EQ)).any())
+
+    def input_wires(self, value_index: int) -> range:
+        """Returns the wires that hold the bits of input value [value_index], least significant bit first."""
+
+        start = sum(self.input_sizes[:value_index])
+        return range(start, start + self.input_sizes[value_index])
+
+    def output_wires(self) -> List[int]:
+        """Returns the wires that hold the bits of all output values, in order."""
+
+        return list(range(self.wire_count - sum(self.output_sizes), self.wire_count))
+
+
+def load_bristol(path: str) -> BristolCircuit:
+    """Reads the Bristol Fashion circuit file at [path]. Besides the standard `XOR`, `AND`, `INV`, `EQ`, `EQW` and `MAND`
+    gates, `OR` and `NOT` gates are accepted as well; every `MAND` gate is split into its `AND` gates."""
+
+    with open(path, "rb") as file:
+        header = [file.readline() for _ in range(3)]
+        gates = file.read()
+
+    # header: gate and wire count, then the number and sizes of the input values and of the output values
+    gate_count, wire_count = map(int, header[0].split())
+    input_counts = list(map(int, header[1].split()))
+    output_counts = list(map(int, header[2].split()))
+    input_sizes = input_counts[1:]
+    output_sizes = output_counts[1:]
+
+    if len(input_sizes) != input_counts[0] or len(output_sizes) != output_counts[0]:
+        raise ValueError(f"{path} is not a Bristol Fashion circuit: the input and output counts do not match.")
+
+    # the gate names become negative numbers, so that NumPy parses the whole file at once and the last token of every
+    # gate is the only negative one; all whitespace (the same characters that bytes.split separates tokens at) becomes
+    # spaces first, so that a name is only replaced where it is a whole token, however it is separated from the others
+    body = b" " + gates.translate(WHITESPACE_TO_SPACES) + b" "
+    for name in ["MAND", "XOR", "EQW", "AND", "EQ", "OR", "INV", "NOT"]:
+        body = body.replace(b" %s " % name.encode(), b" %d " % (-1 - GATE_KINDS.get(name, MAND_CODE)))
+
+    if body.translate(None, b"0123456789- "):
+        names = {word for word in body.split() if not word.lstrip(b"-").isdigit()}
+        raise ValueError(f"{path} has unsupported gates {', '.join(sorted(name.decode() for name in names))}.")
+
+    # (NumPy reads a string of only whitespace as a single 0)
+    tokens = np.fromstring(body, dtype=np.int64, sep=" ") if body.strip() else np.zeros(0, dtype=np.int64)
+    ends = np.flatnonzero(tokens < 0)
+    starts = np.concatenate([[0], ends + 1])[:len(ends)].astype(np.int64)
+
+    if len(ends) != gate_count:
+        raise ValueError(f"{path} declares {gate_count} gates but has {len(ends)}.")
+
+    if (ends < starts + 2).any():
+        raise ValueError(f"{path} has gates without a header.")
+
+    input_wire_counts = tokens[starts]
+    output_wire_counts = tokens[starts + 1]
+    if (ends != starts + input_wire_counts + output_wire_counts + 2).any() or \
+            (ends[-1] + 1 if len(ends) else 0) != len(tokens):
+        raise ValueError(f"{path} has gates whose number of wires does not match their header.")
+
+    # a MAND gate with `k` outputs is `k` AND gates, with inputs `starts + 2 + j` and `starts + 2 + k + j`
+    is_mand = tokens[ends] == -1 - MAND_CODE
+    and_counts = np.where(is_mand, output_wire_counts, 1)
+    gate_of = np.repeat(np.arange(len(ends)), and_counts)
+    position = np.arange(len(gate_of)) - np.repeat(np.cumsum(and_counts) - and_counts, and_counts)
+
+    kinds = np.where(is_mand, GATE_AND, -1 - tokens[ends])[gate_of]
+    a_ids = tokens[starts[gate_of] + 2 + position]
+    b_ids = np.where(is_mand[gate_of], tokens[starts[gate_of] + 2 + and_counts[gate_of] + position],
+                     tokens[starts[gate_of] + 1 + input_wire_counts[gate_of]])
+    out_ids = tokens[ends[gate_of] - and_counts[gate_of] + position]
+
+    circuit = BristolCircuit(wire_count, input_sizes, output_sizes, bytearray(kinds.astype(np.uint8).tobytes()),
+                             array("q", a_ids.tobytes()), array("q", b_ids.tobytes()), array("q", out_ids.tobytes()))
+
+    # every wire is assigned once, and only read after it is assigned
+    defined_at = np.full(wire_count, len(kinds), dtype=np.int64)
+    defined_at[:circuit.input_count] = -1
+    if (out_ids < circuit.input_count).any() or (out_ids >= wire_count).any():
+        raise ValueError(f"{path} assigns a gate output to an input wire or to a wire that does not exist.")
+    defined_at[out_ids] = np.arange(len(kinds))
+
+    # the operands of EQ gates are constants rather than wires
+    is_wire = kinds != GATE_EQ
+    gate_ids = np.flatnonzero(is_wire)
+    for operands in [a_ids[is_wire], b_ids[is_wire]]:
+        if ((operands < 0) | (operands >= wire_count)).any() or (defined_at[operands] >= gate_ids).any():
+            raise ValueError(f"{path} reads a wire before it is assigned, its gates are not in topological order.")
+
+    if np.bincount(out_ids, minlength=wire_count).max(initial=0) > 1:
+        raise ValueError(f"{path} assigns a wire more than once.")
+
+    return circuit
+
+
+def encode_inputs(circuit: BristolCircuit, values: Dict[int, int | List[int]]) -> Dict[int, int | List[int]]:
+    """Returns the input bits of the [circuit] for the input [values] (input value index -> integer), as a mapping from
+    input wire to bit, least significant bit first. Only the given input values are encoded, so each party can encode
+    its own. A value can also be a list of integers, one per record of a batch, which gives a list of bits per wire."""
+
+    bits = {}
+
+    for value_index, value in values.items():
+        for position, wire_id in enumerate(circuit.input_wires(value_index)):
+            if type(value) == list:
+                bits[wire_id] = [record >> position & 1 for record in value]
+            else:
+                bits[wire_id] = value >> position & 1
+
+    return bits
+
+
+def decode_outputs(circuit: BristolCircuit, output_ids: List[int], outputs: Dict[int, int | List[int]]) \
+        -> List[int | List[int]]:
+    """Turns the [outputs] of a run (wire -> bit) back into the integer output values of the [circuit], given the
+    [output_ids] that hold its output bits in the converted circuit, in order. If the outputs are lists of bits, one per
+    record of a batch, every output value is a list of integers as well."""
+
+    values = []
+    position = 0
+
+    for size in circuit.output_sizes:
+        bits = [outputs[wire_id] for wire_id in output_ids[position:position + size]]
+
+        if bits and type(bits[0]) == list:
+            values.append([sum(int(record_bit) << bit for bit, record_bit in enumerate(record_bits))
+                           for record_bits in zip(*bits)])
+        else:
+            values.append(sum(int(value_bit) << bit for bit, value_bit in enumerate(bits)))
+
+        position += size
+
+    return values
@@ -0,0 +1,323 @@
+from __future__ import annotations
+
+from dataclasses import dataclass
+from typing import Callable, Dict, List, Tuple
+
+# the gates of the example garbled circuits
+GATES = {
+    "and": lambda x, y: x and y,
+    "or": lambda x, y: x or y,
+    "xor": lambda x, y: x != y,
+    "if": lambda x, y: x <= y,
+    "iff": lambda x, y: x == y,
+    "not-x": lambda x, y: not x,
+    "not-y": lambda x, y: not y,
+}
+
+
+@dataclass
+class RegisteredCircuit:
+    """A named circuit of the registry, see [register]."""
+
+    engine: str
+    """The engine that runs the circuit: `"bgw"` or `"gc"`."""
+
+    name: str
+    """The name of the circuit, unique per engine."""
+
+    description: str
+    """What the circuit computes, in a few words."""
+
+    inputs: List[Dict[int, int]]
+    """Example inputs: one mapping from wire IDs to values per client for `"bgw"`, the inputs of Alice and of Bob for
+    `"gc"`."""
+
+    build: Callable
+    """Builds the list of wires of the circuit, given the module of the engine (so that the wires are instances of the
+    classes that the engine was imported with)."""
+
+
+CIRCUITS: Dict[Tuple[str, str], RegisteredCircuit] = {}
+"""(engine, name) -> the registered circuit with that name"""
+
+
+def register(engine: str, name: str, inputs: List[Dict[int, int]], description: str):
+    """Returns a decorator that adds the decorated function to [CIRCUITS] as the builder of circuit [name] of [engine],
+    with the example [inputs] and the [description]. Nothing is built or imported until the circuit is used."""
+
+    def decorator(build: Callable) -> Callable:
+        CIRCUITS[(engine, name)] = RegisteredCircuit(engine, name, description, inputs, build)
+        return build
+
+    return decorator
+
+
+def get_circuit(engine: str, name: str) -> RegisteredCircuit:
+    """Returns the registered circuit [name] of [engine]."""
+
+    if (engine, name) not in CIRCUITS:
+        names = ", ".join(sorted(known for known_engine, known in CIRCUITS if known_engine == engine))
+        raise ValueError(f"There is no {engine} circuit named {name!r}, the registered ones are: {names}.")
+
+    return CIRCUITS[(engine, name)]
+
+
+@register("bgw", "basic", [{0: 9}, {1: 5}, {2: 3}], "(x0 + x1) * 6 * x2")
+def bgw_basic(bgw) -> list:
+    # basic
+    # 0 - |
+    #     + -> |
+    # 1 - |    |
+    #          |
+    #          * -> output
+    #          |
+    # 2 - |    |
+    #    6* -> |
+    return [
+        bgw.InputWire(is_output=False, owner_id=0),  # 0
+        bgw.InputWire(is_output=False, owner_id=1),  # 1
+        bgw.InputWire(is_output=False, owner_id=2),  # 2
+        bgw.AddWire(is_output=False, wire_a_id=0, wire_b_id=1),  # 3
+        bgw.ConstMultWire(is_output=False, c=6, wire_a_id=2),  # 4
+        bgw.MultWire(is_output=True, wire_a_id=3, wire_b_id=4),  # 5
+    ]
+
+
+@register("bgw", "deep", [{0: 9}, {1: 5}, {2: 3, 3: 4}], "a chain of three multiplications on four inputs")
+def bgw_deep(bgw) -> list:
+    return [
+        bgw.InputWire(is_output=False, owner_id=0),  # 0
+        bgw.InputWire(is_output=False, owner_id=1),  # 1
+        bgw.InputWire(is_output=False, owner_id=2),  # 2
+        bgw.InputWire(is_output=False, owner_id=2),  # 3
+        bgw.AddWire(is_output=False, wire_a_id=0, wire_b_id=1),  # 4
+        bgw.MultWire(is_output=False, wire_a_id=4, wire_b_id=2),  # 5
+        bgw.AddWire(is_output=False, wire_a_id=1, wire_b_id=5),  # 6
+        bgw.ConstMultWire(is_output=False, c=4, wire_a_id=6),  # 7
+        bgw.AddWire(is_output=False, wire_a_id=2, wire_b_id=7),  # 8
+        bgw.AddWire(is_output=False, wire_a_id=7, wire_b_id=8),  # 9
+        bgw.MultWire(is_output=False, wire_a_id=4, wire_b_id=9),  # 10
+        bgw.MultWire(is_output=True, wire_a_id=3, wire_b_id=10),  # 11
+    ]
+
+
+@register("bgw", "wide", [{0: 3, 1: 2, 2: 1, 3: 7}, {4: 3, 5: 4, 6: 4, 7: 9}, {8: 9, 9: 2, 10: 10, 11: 7}],
+          "three independent products of sums, all in one round")
+def bgw_wide(bgw) -> list:
+    return [
+        bgw.InputWire(is_output=False, owner_id=0),  # 0
+        bgw.InputWire(is_output=False, owner_id=0),  # 1
+        bgw.InputWire(is_output=False, owner_id=0),  # 2
+        bgw.InputWire(is_output=False, owner_id=0),  # 3
+        bgw.InputWire(is_output=False, owner_id=1),  # 4
+        bgw.InputWire(is_output=False, owner_id=1),  # 5
+        bgw.InputWire(is_output=False, owner_id=1),  # 6
+        bgw.InputWire(is_output=False, owner_id=1),  # 7
+        bgw.InputWire(is_output=False, owner_id=2),  # 8
+        bgw.InputWire(is_output=False, owner_id=2),  # 9
+        bgw.InputWire(is_output=False, owner_id=2),  # 10
+        bgw.InputWire(is_output=False, owner_id=2),  # 11
+        bgw.AddWire(is_output=False, wire_a_id=0, wire_b_id=6),  # 12
+        bgw.AddWire(is_output=False, wire_a_id=1, wire_b_id=7),  # 13
+        bgw.AddWire(is_output=False, wire_a_id=2, wire_b_id=8),  # 14
+        bgw.AddWire(is_output=False, wire_a_id=3, wire_b_id=9),  # 15
+        bgw.AddWire(is_output=False, wire_a_id=4, wire_b_id=10),  # 16
+        bgw.AddWire(is_output=False, wire_a_id=5, wire_b_id=11),  # 17
+        bgw.MultWire(is_output=True, wire_a_id=12, wire_b_id=15),  # 18
+        bgw.MultWire(is_output=True, wire_a_id=13, wire_b_id=16),  # 19
+        bgw.MultWire(is_output=True, wire_a_id=14, wire_b_id=17),  # 20
+    ]
+
+
+@register("bgw", "adder", [{0: 9}, {1: 5}, {2: 3}], "x0 + x1 + x2, without multiplications")
+def bgw_adder(bgw) -> list:
+    return [
+        bgw.InputWire(is_output=False, owner_id=0),  # 0
+        bgw.InputWire(is_output=False, owner_id=1),  # 1
+        bgw.InputWire(is_output=False, owner_id=2),  # 2
+        bgw.AddWire(is_output=False, wire_a_id=0, wire_b_id=1),  # 3
+        bgw.AddWire(is_output=True, wire_a_id=3, wire_b_id=2),  # 4
+    ]
+
+
+@register("bgw", "xors", [{0: 1, 1: 1}, {2: 1, 3: 0}, {4: 1, 5: 1}], "a tree of XORs of bits, as A + B - 2 * A * B")
+def bgw_xors(bgw) -> list:
+    return [
+        bgw.InputWire(is_output=False, owner_id=0),  # 0
+        bgw.InputWire(is_output=False, owner_id=0),  # 1
+        bgw.InputWire(is_output=False, owner_id=1),  # 2
+        bgw.InputWire(is_output=False, owner_id=1),  # 3
+        bgw.InputWire(is_output=False, owner_id=2),  # 4
+        bgw.InputWire(is_output=False, owner_id=2),  # 5
+        # "Gate 6"
+        bgw.AddWire(is_output=False, wire_a_id=0, wire_b_id=3),  # 6
+        bgw.MultWire(is_output=False, wire_a_id=0, wire_b_id=3),  # 7
+        bgw.ConstMultWire(is_output=False, c=-2, wire_a_id=7),  # 8
+        bgw.AddWire(is_output=True, wire_a_id=6, wire_b_id=8),  # 9
+        # "Gate 7"
+        bgw.AddWire(is_output=False, wire_a_id=1, wire_b_id=4),  # 10
+        bgw.MultWire(is_output=False, wire_a_id=1, wire_b_id=4),  # 11
+        bgw.ConstMultWire(is_output=False, c=-2, wire_a_id=11),  # 12
+        bgw.AddWire(is_output=True, wire_a_id=10, wire_b_id=12),  # 13
+        # "Gate 8"
+        bgw.AddWire(is_output=False, wire_a_id=2, wire_b_id=5),  # 14
+        bgw.MultWire(is_output=False, wire_a_id=2, wire_b_id=5),  # 15
+        bgw.ConstMultWire(is_output=False, c=-2, wire_a_id=15),  # 16
+        bgw.AddWire(is_output=True, wire_a_id=14, wire_b_id=16),  # 17
+        # "Gate 9"
+        bgw.AddWire(is_output=False, wire_a_id=3, wire_b_id=9),  # 18
+        bgw.MultWire(is_output=False, wire_a_id=3, wire_b_id=9),  # 19
+        bgw.ConstMultWire(is_output=False, c=-2, wire_a_id=19),  # 20
+        bgw.AddWire(is_output=True, wire_a_id=18, wire_b_id=20),  # 21
+        # "Gate 10"
+        bgw.AddWire(is_output=False, wire_a_id=4, wire_b_id=13),  # 22
+        bgw.MultWire(is_output=False, wire_a_id=4, wire_b_id=13),  # 23
+        bgw.ConstMultWire(is_output=False, c=-2, wire_a_id=23),  # 24
+        bgw.AddWire(is_output=True, wire_a_id=22, wire_b_id=24),  # 25
+        # "Gate 11"
+        bgw.AddWire(is_output=False, wire_a_id=5, wire_b_id=17),  # 26
+        bgw.MultWire(is_output=False, wire_a_id=5, wire_b_id=17),  # 27
+        bgw.ConstMultWire(is_output=False, c=-2, wire_a_id=27),  # 28
+        bgw.AddWire(is_output=True, wire_a_id=26, wire_b_id=28),  # 29
+        # "Gate 12"
+        bgw.AddWire(is_output=False, wire_a_id=9, wire_b_id=21),  # 30
+        bgw.MultWire(is_output=False, wire_a_id=9, wire_b_id=21),  # 31
+        bgw.ConstMultWire(is_output=False, c=-2, wire_a_id=31),  # 32
+        bgw.AddWire(is_output=True, wire_a_id=30, wire_b_id=32),  # 33
+        # "Gate 13"
+        bgw.AddWire(is_output=False, wire_a_id=13, wire_b_id=25),  # 34
+        bgw.MultWire(is_output=False, wire_a_id=13, wire_b_id=25),  # 35
+        bgw.ConstMultWire(is_output=False, c=-2, wire_a_id=35),  # 36
+        bgw.AddWire(is_output=True, wire_a_id=34, wire_b_id=36),  # 37
+        # "Gate 14"
+        bgw.AddWire(is_output=False, wire_a_id=29, wire_b_id=33),  # 38
+        bgw.MultWire(is_output=False, wire_a_id=29, wire_b_id=33),  # 39
+        bgw.ConstMultWire(is_output=False, c=-2, wire_a_id=39),  # 40
+        bgw.AddWire(is_output=True, wire_a_id=38, wire_b_id=40),  # 41
+        # "Gate 15"
+        bgw.AddWire(is_output=False, wire_a_id=41, wire_b_id=37),  # 42
+        bgw.MultWire(is_output=False, wire_a_id=41, wire_b_id=37),  # 43
+        bgw.ConstMultWire(is_output=False, c=-2, wire_a_id=43),  # 44
+        bgw.AddWire(is_output=True, wire_a_id=42, wire_b_id=44),  # 45
+    ]
+
+
+@register("gc", "basic", [{0: True, 1: False}, {2: False, 3: True}], "(x0 or x1) and (x2 or x3)")
+def gc_basic(gc) -> list:
+    return [
+        gc.InputWire(is_output=False, alice_is_owner=True),  # 0
+        gc.InputWire(is_output=False, alice_is_owner=True),  # 1
+        gc.InputWire(is_output=False, alice_is_owner=False),  # 2
+        gc.InputWire(is_output=False, alice_is_owner=False),  # 3
+        gc.GateWire(is_output=False, input_x_id=0, input_y_id=1, gate=GATES["or"]),  # 4
+        gc.GateWire(is_output=False, input_x_id=2, input_y_id=3, gate=GATES["or"]),  # 5
+        gc.GateWire(is_output=True, input_x_id=4, input_y_id=5, gate=GATES["and"]),  # 6
+    ]
+
+
+@register("gc", "deep", [{0: True, 1: False}, {2: False, 3: True}], "eight gates in a chain")
+def gc_deep(gc) -> list:
+    return [
+        gc.InputWire(is_output=False, alice_is_owner=True),  # 0
+        gc.InputWire(is_output=False, alice_is_owner=True),  # 1
+        gc.InputWire(is_output=False, alice_is_owner=False),  # 2
+        gc.InputWire(is_output=False, alice_is_owner=False),  # 3
+        gc.GateWire(is_output=False, input_x_id=0, input_y_id=1, gate=GATES["or"]),  # 4
+        gc.GateWire(is_output=False, input_x_id=4, input_y_id=2, gate=GATES["and"]),  # 5
+        gc.GateWire(is_output=False, input_x_id=1, input_y_id=5, gate=GATES["xor"]),  # 6
+        gc.GateWire(is_output=False, input_x_id=6, input_y_id=0, gate=GATES["not-x"]),  # 7
+        gc.GateWire(is_output=False, input_x_id=2, input_y_id=7, gate=GATES["or"]),  # 8
+        gc.GateWire(is_output=False, input_x_id=7, input_y_id=8, gate=GATES["if"]),  # 9
+        gc.GateWire(is_output=False, input_x_id=4, input_y_id=9, gate=GATES["and"]),  # 10
+        gc.GateWire(is_output=True, input_x_id=3, input_y_id=10, gate=GATES["iff"]),  # 11
+    ]
+
+
+@register("gc", "wide", [{0: True, 1: False, 2: True, 3: False, 4: False, 5: False},
+                        {6: False, 7: True, 8: False, 9: False, 10: True, 11: False}],
+          "three independent ANDs of ORs")
+def gc_wide(gc) -> list:
+    return [
+        gc.InputWire(is_output=False, alice_is_owner=True),  # 0
+        gc.InputWire(is_output=False, alice_is_owner=True),  # 1
+        gc.InputWire(is_output=False, alice_is_owner=True),  # 2
+        gc.InputWire(is_output=False, alice_is_owner=True),  # 3
+        gc.InputWire(is_output=False, alice_is_owner=True),  # 4
+        gc.InputWire(is_output=False, alice_is_owner=True),  # 5
+        gc.InputWire(is_output=False, alice_is_owner=False),  # 6
+        gc.InputWire(is_output=False, alice_is_owner=False),  # 7
+        gc.InputWire(is_output=False, alice_is_owner=False),  # 8
+        gc.InputWire(is_output=False, alice_is_owner=False),  # 9
+        gc.InputWire(is_output=False, alice_is_owner=False),  # 10
+        gc.InputWire(is_output=False, alice_is_owner=False),  # 11
+        gc.GateWire(is_output=False, input_x_id=0, input_y_id=6, gate=GATES["or"]),  # 12
+        gc.GateWire(is_output=False, input_x_id=1, input_y_id=7, gate=GATES["or"]),  # 13
+        gc.GateWire(is_output=False, input_x_id=2, input_y_id=8, gate=GATES["or"]),  # 14
+        gc.GateWire(is_output=False, input_x_id=3, input_y_id=9, gate=GATES["or"]),  # 15
+        gc.GateWire(is_output=False, input_x_id=4, input_y_id=10, gate=GATES["or"]),  # 16
+        gc.GateWire(is_output=False, input_x_id=5, input_y_id=11, gate=GATES["or"]),  # 17
+        gc.GateWire(is_output=True, input_x_id=12, input_y_id=15, gate=GATES["and"]),  # 18
+        gc.GateWire(is_output=True, input_x_id=13, input_y_id=16, gate=GATES["and"]),  # 19
+        gc.GateWire(is_output=True, input_x_id=14, input_y_id=17, gate=GATES["and"]),  # 20
+    ]
+
+
+@register("gc", "adder", [{0: True, 1: False, 2: True, 3: False}, {4: False, 5: True, 6: False, 7: False}],
+          "a 4-bit ripple-carry adder, least significant bit first")
+def gc_adder(gc) -> list:
+    return [
+        # Alice's input
+        gc.InputWire(is_output=False, alice_is_owner=True),  # 0
+        gc.InputWire(is_output=False, alice_is_owner=True),  # 1
+        gc.InputWire(is_output=False, alice_is_owner=True),  # 2
+        gc.InputWire(is_output=False, alice_is_owner=True),  # 3
+        # Bob's input
+        gc.InputWire(is_output=False, alice_is_owner=False),  # 4
+        gc.InputWire(is_output=False, alice_is_owner=False),  # 5
+        gc.InputWire(is_output=False, alice_is_owner=False),  # 6
+        gc.InputWire(is_output=False, alice_is_owner=False),  # 7
+        # Half adder 1
+        gc.GateWire(is_output=True, input_x_id=0, input_y_id=4, gate=GATES["xor"]),  # 8
+        gc.GateWire(is_output=False, input_x_id=0, input_y_id=4, gate=GATES["and"]),  # 9
+        # Full adder 2
+        gc.GateWire(is_output=False, input_x_id=1, input_y_id=5, gate=GATES["xor"]),  # 10
+        gc.GateWire(is_output=True, input_x_id=10, input_y_id=9, gate=GATES["xor"]),  # 11
+        gc.GateWire(is_output=False, input_x_id=1, input_y_id=5, gate=GATES["and"]),  # 12
+        gc.GateWire(is_output=False, input_x_id=9, input_y_id=10, gate=GATES["and"]),  # 13
+        gc.GateWire(is_output=False, input_x_id=12, input_y_id=13, gate=GATES["or"]),  # 14
+        # Full adder 3
+        gc.GateWire(is_output=False, input_x_id=2, input_y_id=6, gate=GATES["xor"]),  # 15
+        gc.GateWire(is_output=True, input_x_id=15, input_y_id=14, gate=GATES["xor"]),  # 16
+        gc.GateWire(is_output=False, input_x_id=2, input_y_id=6, gate=GATES["and"]),  # 17
+        gc.GateWire(is_output=False, input_x_id=14, input_y_id=15, gate=GATES["and"]),  # 18
+        gc.GateWire(is_output=False, input_x_id=17, input_y_id=18, gate=GATES["or"]),  # 19
+        # Full adder 4
+        gc.GateWire(is_output=False, input_x_id=3, input_y_id=7, gate=GATES["xor"]),  # 20
+        gc.GateWire(is_output=True, input_x_id=20, input_y_id=19, gate=GATES["xor"]),  # 21
+        gc.GateWire(is_output=False, input_x_id=3, input_y_id=7, gate=GATES["and"]),  # 22
+        gc.GateWire(is_output=False, input_x_id=19, input_y_id=20, gate=GATES["and"]),  # 23
+        gc.GateWire(is_output=True, input_x_id=22, input_y_id=23, gate=GATES["or"]),  # 24
+    ]
+
+
+@register("gc", "xors", [{0: True, 1: False, 2: True}, {3: False, 4: True, 5: False}],
+          "a tree of XORs")
+def gc_xors(gc) -> list:
+    return [
+        gc.InputWire(is_output=False, alice_is_owner=True),  # 0
+        gc.InputWire(is_output=False, alice_is_owner=True),  # 1
+        gc.InputWire(is_output=False, alice_is_owner=True),  # 2
+        gc.InputWire(is_output=False, alice_is_owner=False),  # 3
+        gc.InputWire(is_output=False, alice_is_owner=False),  # 4
+        gc.InputWire(is_output=False, alice_is_owner=False),  # 5
+        gc.GateWire(is_output=False, input_x_id=0, input_y_id=3, gate=GATES["xor"]),  # 6
+        gc.GateWire(is_output=False, input_x_id=1, input_y_id=4, gate=GATES["xor"]),  # 7
+        gc.GateWire(is_output=False, input_x_id=2, input_y_id=5, gate=GATES["xor"]),  # 8
+        gc.GateWire(is_output=False, input_x_id=3, input_y_id=6, gate=GATES["xor"]),  # 9
+        gc.GateWire(is_output=False, input_x_id=4, input_y_id=7, gate=GATES["xor"]),  # 10
+        gc.GateWire(is_output=False, input_x_id=5, input_y_id=8, gate=GATES["xor"]),  # 11
+        gc.GateWire(is_output=False, input_x_id=6, input_y_id=9, gate=GATES["xor"]),  # 12
+        gc.GateWire(is_output=False, input_x_id=7, input_y_id=10, gate=GATES["xor"]),  # 13
+        gc.GateWire(is_output=False, input_x_id=11, input_y_id=12, gate=GATES["xor"]),  # 14
+        gc.GateWire(is_output=True, input_x_id=14, input_y_id=13, gate=GATES["xor"]),  # 15
+    ]
@@ -0,0 +1,244 @@
+from __future__ import annotations
+
+import argparse
+import importlib.util
+import json
+import os
+import sys
+import time
+from random import SystemRandom
+from typing import Dict, List
+
+from circuits import CIRCUITS, get_circuit
+
+# Nothing in this module imports an engine at the top: a BGW job only imports bgw.py (and NumPy), and only a GC job
+# pays for importing cryptography.
+
+# the first bytes of a circuit file written by bgw.BGW.save_circuit, see bgw.CIRCUIT_FILE_MAGIC
+CIRCUIT_FILE_MAGIC = b"BGWC"
+
+
+def load_gc():
+    """Imports gc.py, which cannot be imported by name because the standard library module `gc` is always found
+    first."""
+
+    spec = importlib.util.spec_from_file_location("gc_engine", os.path.join(os.path.dirname(__file__), "gc.py"))
+    module = importlib.util.module_from_spec(spec)
+    sys.modules[spec.name] = module
+    spec.loader.exec_module(module)
+
+    return module
+
+
+def read_inputs(path: str | None):
+    """Reads the JSON inputs at [path] (standard input for `-`). Returns `None` if there is no [path]."""
+
+    if path is None:
+        return None
+
+    if path == "-":
+        return json.load(sys.stdin)
+
+    with open(path) as file:
+        return json.load(file)
+
+
+def parse_inputs(inputs: List[Dict[str, int]]) -> List[Dict[int, int]]:
+    """Turns JSON inputs, one object from wire IDs to values per party, into mappings with integer wire IDs."""
+
+    if type(inputs) != list or any(type(party_inputs) != dict for party_inputs in inputs):
+        raise ValueError("The inputs must be a list with one object from wire IDs to values per party.")
+
+    return [{int(wire_id): value for wire_id, value in party_inputs.items()} for party_inputs in inputs]
+
+
+def batch_value(value, batch_size: int | None):
+    """Returns the input [value] in the form that the clients expect: an integer, or in batch mode (if [batch_size] is
+    given) a list of [batch_size] integers, one per record. A single integer is used for every record of a batch."""
+
+    if type(value) == list:
+        if batch_size is None or len(value) != batch_size or any(type(record) != int for record in value):
+            raise ValueError(f"An input value that is a list needs --batch-size and exactly that many integers, not "
+                             f"{value}.")
+        return value
+
+    if type(value) != int:
+        raise ValueError(f"Input values must be integers or lists of integers, not {value!r}.")
+
+    return value if batch_size is None else [value] * batch_size
+
+
+def parse_mod(text: str) -> int:
+    """Parses a modulo given as an integer or as `2^k`, `2^k-c` or `2^k+c`."""
+
+    text = text.replace(" ", "")
+    if not text.startswith("2^"):
+        return int(text)
+
+    for sign in "-+":
+        if sign in text:
+            power, offset = text[2:].split(sign)
+            return (1 << int(power)) + int(sign + offset)
+
+    return 1 << int(text[2:])
+
+
+def is_circuit_file(path: str) -> bool:
+    """Returns whether [path] is a circuit file written by bgw.BGW.save_circuit, rather than a Bristol Fashion file."""
+
+    with open(path, "rb") as file:
+        return file.read(len(CIRCUIT_FILE_MAGIC)) == CIRCUIT_FILE_MAGIC
+
+
+def run_bgw(args) -> dict:
+    """Runs the `bgw` command and returns its results."""
+
+    import bgw
+    from bristol import decode_outputs, load_bristol
+
+    mod = parse_mod(args.mod)
+    inputs = read_inputs(args.inputs)
+    output_ids = None
+
+    if ("bgw", args.circuit) in CIRCUITS:
+        registered = get_circuit("bgw", args.circuit)
+        circuit = bgw.BGW.compile_circuit(registered.build(bgw))
+        inputs = parse_inputs(registered.inputs if inputs is None else inputs)
+        inputs = [{wire_id: batch_value(value, args.batch_size) for wire_id, value in client_inputs.items()}
+                  for client_inputs in inputs]
+    elif not os.path.exists(args.circuit):
+        get_circuit("bgw", args.circuit)  # raises, listing the registered circuits
+    elif is_circuit_file(args.circuit):
+        if inputs is None:
+            raise ValueError("A circuit file needs --inputs.")
+        circuit = bgw.BGW.load_circuit(args.circuit)
+        inputs = [{wire_id: batch_value(value, args.batch_size) for wire_id, value in client_inputs.items()}
+                  for client_inputs in parse_inputs(inputs)]
+    else:
+        # a Bristol Fashion circuit, whose inputs are its integer input values, owned by the clients in turn
+        bristol_circuit = load_bristol(args.circuit)
+        values = inputs if inputs is not None else [0] * len(bristol_circuit.input_sizes)
+        if type(values) != list or len(values) != len(bristol_circuit.input_sizes):
+            raise ValueError(f"The circuit needs a list of {len(bristol_circuit.input_sizes)} input values.")
+
+        values = [batch_value(value, args.batch_size) for value in values]
+        owners = [value_index % args.clients for value_index in range(len(values))]
+        circuit, output_ids = bgw.BGW.from_bristol(bristol_circuit, mod, owners)
+        inputs = bgw.BGW.bristol_inputs(bristol_circuit, values, args.clients, owners, args.batch_size)
+
+    rng = SystemRandom()
+    ttp = bgw.TTP(len(inputs), mod, rng, args.batch_size)
+    clients = [bgw.Client(client_id, ttp, circuit, inputs[client_id], mod, rng, args.batch_size, args.seeded_inputs,
+                          args.free_shares, args.king_party)
+               for client_id in range(len(inputs))]
+
+    start = time.perf_counter()
+    outputs, metrics = bgw.BGW.run_circuit(clients, return_metrics=True)
+    seconds = time.perf_counter() - start
+
+    if output_ids is not None:
+        outputs = decode_outputs(bristol_circuit, output_ids, outputs)
+
+    return {"outputs": outputs, "seconds": seconds, "metrics": metrics}
+
+
+def run_gc(args) -> dict:
+    """Runs the `gc` command and returns its results."""
+
+    gc = load_gc()
+    from bristol import decode_outputs, encode_inputs, load_bristol
+
+    inputs = read_inputs(args.inputs)
+    output_ids = None
+
+    if ("gc", args.circuit) in CIRCUITS:
+        registered = get_circuit("gc", args.circuit)
+        circuit = registered.build(gc)
+        alice_inputs, bob_inputs = parse_inputs(registered.inputs if inputs is None else inputs)
+    elif not os.path.exists(args.circuit):
+        get_circuit("gc", args.circuit)  # raises, listing the registered circuits
+    else:
+        bristol_circuit = load_bristol(args.circuit)
+        values = inputs if inputs is not None else [0] * len(bristol_circuit.input_sizes)
+        if type(values) != list or len(values) != len(bristol_circuit.input_sizes):
+            raise ValueError(f"The circuit needs a list of {len(bristol_circuit.input_sizes)} input values.")
+
+        if any(type(value) != int for value in values):
+            raise ValueError("The input values of a garbled circuit must be integers.")
+
+        circuit, output_ids = gc.from_bristol(bristol_circuit, tuple(args.alice_values))
+        alice_inputs = encode_inputs(bristol_circuit, {value_index: value for value_index, value in enumerate(values)
+                                                       if value_index in args.alice_values})
+        bob_inputs = encode_inputs(bristol_circuit, {value_index: value for value_index, value in enumerate(values)
+                                                     if value_index not in args.alice_values})
+
+    alice = gc.Alice(circuit, alice_inputs)
+    bob = gc.Bob(alice, bob_inputs)
+
+    start = time.perf_counter()
+    outputs, metrics = gc.run_garbled_circuit(alice, bob, return_metrics=True)
+    seconds = time.perf_counter() - start
+
+    if output_ids is not None:
+        outputs = decode_outputs(bristol_circuit, output_ids, outputs)
+
+    return {"outputs": outputs, "seconds": seconds, "metrics": metrics}
+
+
+def main(argv: List[str] | None = None):
+    parser = argparse.ArgumentParser(description="Runs a circuit with BGW or with a garbled circuit. A circuit is the "
+                                                 "name of a registered circuit (see `list`) or a file: a Bristol "
+                                                 "Fashion circuit, or for BGW also a circuit file saved with "
+                                                 "BGW.save_circuit.")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    commands.add_parser("list", help="list the registered circuits")
+
+    bgw_parser = commands.add_parser("bgw", help="run a circuit with BGW")
+    bgw_parser.add_argument("circuit", help="registered circuit name or circuit file")
+    bgw_parser.add_argument("--inputs", help="JSON file (or - for standard input) with one object from wire IDs to "
+                                             "values per client, or the list of input values of a Bristol circuit; "
+                                             "registered circuits default to their example inputs")
+    bgw_parser.add_argument("--clients", type=int, default=3, help="number of clients of a Bristol circuit")
+    bgw_parser.add_argument("--mod", default="2^61-1", help="modulo, as an integer or as 2^k, 2^k-c or 2^k+c")
+    bgw_parser.add_argument("--batch-size", type=int, help="number of input records to evaluate at once; an input "
+                                                             "value is then a list with one integer per record, or a "
+                                                             "single integer for all records")
+    bgw_parser.add_argument("--seeded-inputs", action="store_true", help="send the shares of inputs as seeds")
+    bgw_parser.add_argument("--free-shares", action="store_true", help="reuse the storage of shares that are no "
+                                                                         "longer needed")
+    bgw_parser.add_argument("--king-party", action="store_true", help="open masked shares through a rotating king "
+                                                                        "party")
+
+    gc_parser = commands.add_parser("gc", help="run a circuit as a garbled circuit")
+    gc_parser.add_argument("circuit", help="registered circuit name or Bristol Fashion file")
+    gc_parser.add_argument("--inputs", help="JSON file (or - for standard input) with the inputs of Alice and of Bob, "
+                                            "or the list of input values of a Bristol circuit; registered circuits "
+                                            "default to their example inputs")
+    gc_parser.add_argument("--alice-values", type=int, nargs="+", default=[0],
+                           help="input values of a Bristol circuit that Alice owns, Bob owns the others")
+
+    for command_parser in [bgw_parser, gc_parser]:
+        command_parser.add_argument("--metrics", action="store_true", help="print the metrics of the run as well")
+
+    args = parser.parse_args(argv)
+
+    if args.command == "list":
+        for registered in CIRCUITS.values():
+            print(f"{registered.engine} {registered.name}: {registered.description}")
+        return
+
+    try:
+        result = run_bgw(args) if args.command == "bgw" else run_gc(args)
+    except (ValueError, OSError) as error:
+        sys.exit(f"error: {error}")
+
+    report = {"outputs": result["outputs"], "seconds": result["seconds"]}
+    if args.metrics:
+        report["metrics"] = result["metrics"].as_dict()
+
+    print(json.dumps(report, default=int))
+
+
+if __name__ == "__main__":
+    main()
@@ -1,22 +1,56 @@
 from __future__ import annotations
 
+import os
+import sys
+import time
 from abc import ABC
+from array import array
 from dataclasses import dataclass
-from typing import Callable, Dict, List
+from typing import Callable, Dict, List, Tuple
 
-from cryptography.fernet import Fernet, InvalidToken
+import numpy as np
+from cryptography.hazmat.primitives.ciphers import Cipher, algorithms, modes
 
-# key = Fernet.generate_key()
-# f = Fernet(key)
-# token = f.encrypt(b"my deep dark secret") # type(token) = bytes
-# print(token) # b'...'
-# print(f.decrypt(token)) # b'my deep dark secret'
+from bristol import GATE_AND, GATE_EQ, GATE_EQW, GATE_INV, GATE_OR, GATE_XOR, BristolCircuit
+from metrics import RunMetrics
 
 COUNT_AES_Encrypt = 0
 COUNT_AES_Decrypt = 0
 COUNT_OT = 0
 MESSAGES_SENT_GC = 0
 
+# The garbling scheme hashes the two input labels of a row and the gate's wire ID into a single block with a fixed-key
+# AES permutation `P`: `H(A, B, g) = P(K) xor K` for `K = 2A xor 4B xor g`, where doubling is in GF(2^128). The key is
+# public, so its key schedule is computed once per party, and every row costs one AES call instead of two Fernet
+# encryptions (AES-CBC, HMAC-SHA256 and base64 each). Labels are 16 raw bytes; the lowest bit of a label is its select
+# bit, which points Bob at the one row of a table that he can decrypt (point-and-permute).
+FIXED_KEY = bytes(range(16))
+FIXED_KEY_CIPHER = Cipher(algorithms.AES(FIXED_KEY), modes.ECB())
+LABEL_SIZE = 16
+MASK_128 = (1 << 128) - 1
+
+# opcodes of a [CompiledCircuit]
+OP_ALICE_INPUT = 0
+OP_BOB_INPUT = 1
+OP_GATE = 2
+
+
+def double_labels(labels: np.ndarray) -> np.ndarray:
+    """Doubles the 16-byte [labels], given as pairs of little-endian 64-bit halves along the last axis, in GF(2^128),
+    like [double_label]."""
+
+    low, high = labels[..., 0], labels[..., 1]
+    return np.stack([low << np.uint64(1) ^ (high >> np.uint64(63)) * np.uint64(0x87),
+                     high << np.uint64(1) | low >> np.uint64(63)], axis=-1)
+
+
+def double_label(label: int) -> int:
+    """Doubles the 16-byte [label], read as a little-endian integer, in GF(2^128), i.e. modulo
+    `x^128 + x^7 + x^2 + x + 1`."""
+
+    return (label << 1 & MASK_128) ^ (0x87 if label >> 127 else 0)
+
+
 @dataclass
 class Wire(ABC):
     """Any kind of wire in the circuit."""
@@ -50,107 +84,223 @@ class GateWire(Wire):
 
 
 @dataclass
-class GarbledGateWire(Wire):
-    """The garbled output wire of a gate that operates on inputs `X` and `Y` and outputs a value as encoded by the
-    garbled [keys]."""
+class CompiledCircuit:
+    """A boolean circuit compiled into flat arrays, with one entry per wire, so that it can be garbled and evaluated
+    without dispatching on the types of [Wire] objects or calling the gate functions."""
 
-    input_x_id: int
-    """The wire corresponding to input `X`, as identified by that wire's index in the list of wires (i.e. circuit) that 
-    this wire is part of."""
+    ops: array
+    """The opcode of each wire."""
 
-    input_y_id: int
-    """The wire corresponding to input `Y`, as identified by that wire's index in the list of wires (i.e. circuit) that 
-    this wire is part of."""
+    x_ids: array
+    """The ID of input `X` of each gate, `0` for input wires."""
+
+    y_ids: array
+    """The ID of input `Y` of each gate, `0` for input wires."""
+
+    tables: bytearray
+    """The truth table of each gate, where bit `2 * x + y` holds the output for inputs `x` and `y`."""
+
+    outputs: bytearray
+    """A bitmap that has bit `i` set if and only if wire `i` is an output wire."""
+
+    def __len__(self) -> int:
+        return len(self.ops)
+
+    def is_output(self, wire_id: int) -> bool:
+        """Returns `True` if and only if the value of wire [wire_id] should be made public."""
+
+        return bool(self.outputs[wire_id >> 3] >> (wire_id & 7) & 1)
+
+    def output_ids(self) -> List[int]:
+        """Returns the IDs of all output wires, in increasing order."""
+
+        return [wire_id for wire_id in range(len(self.ops)) if self.outputs[wire_id >> 3] >> (wire_id & 7) & 1]
+
+
+def compile_circuit(circuit: List[Wire]) -> CompiledCircuit:
+    """Compiles the list of [Wire]s [circuit] into a [CompiledCircuit]. This is the only place where the types of the
+    wires are inspected and where the gate functions are called."""
+
+    ops = array("B")
+    x_ids = array("q")
+    y_ids = array("q")
+    tables = bytearray(len(circuit))
+    outputs = bytearray((len(circuit) + 7) // 8)
+
+    for wire_index, wire in enumerate(circuit):
+        if type(wire) == InputWire:
+            ops.append(OP_ALICE_INPUT if wire.alice_is_owner else OP_BOB_INPUT)
+            x_ids.append(0)
+            y_ids.append(0)
+        elif type(wire) == GateWire:
+            ops.append(OP_GATE)
+            x_ids.append(wire.input_x_id)
+            y_ids.append(wire.input_y_id)
+
+            for x in range(2):
+                for y in range(2):
+                    if wire.gate(x, y):
+                        tables[wire_index] |= 1 << (2 * x + y)
+        else:
+            raise ValueError(f"Wire {wire_index} has unsupported type {type(wire).__name__}.")
+
+        if wire.is_output:
+            outputs[wire_index >> 3] |= 1 << (wire_index & 7)
+
+    return CompiledCircuit(ops, x_ids, y_ids, tables, outputs)
+
+
+def from_bristol(circuit: BristolCircuit, alice_values: Tuple[int, ...] = (0,)) -> Tuple[CompiledCircuit, List[int]]:
+    """Converts the [BristolCircuit] [circuit] (see [bristol.load_bristol]) into a [CompiledCircuit], where Alice owns
+    the input values [alice_values] and Bob owns all others. Every gate becomes one [GateWire] with the gate's truth
+    table; gates with a single input use it as both `X` and `Y`, and `EQ` gates read input wire 0. The input wires keep
+    their IDs, so [bristol.encode_inputs] gives the inputs of Alice and Bob. Returns the circuit and the IDs of the
+    wires that hold the output bits, in order, for [bristol.decode_outputs]."""
+
+    input_count = circuit.input_count
+    gate_count = len(circuit)
+    kinds = np.frombuffer(circuit.kinds, dtype=np.uint8)
+    a_ids = np.frombuffer(circuit.a_ids, dtype=np.int64)
+    b_ids = np.frombuffer(circuit.b_ids, dtype=np.int64)
+
+    # wire of the file -> wire of the compiled circuit, in which gate `g` is wire `input_count + g`
+    wire_map = np.zeros(circuit.wire_count, dtype=np.int64)
+    wire_map[:input_count] = np.arange(input_count)
+    wire_map[np.frombuffer(circuit.out_ids, dtype=np.int64)] = input_count + np.arange(gate_count)
+
+    is_eq = kinds == GATE_EQ
+    if is_eq.any() and input_count == 0:
+        raise ValueError("EQ gates need an input wire to read.")
+
+    ops = np.full(input_count + gate_count, OP_GATE, dtype=np.uint8)
+    for value_index in range(len(circuit.input_sizes)):
+        wires = circuit.input_wires(value_index)
+        ops[wires.start:wires.stop] = OP_ALICE_INPUT if value_index in alice_values else OP_BOB_INPUT
+
+    x_ids = np.zeros(input_count + gate_count, dtype=np.int64)
+    y_ids = np.zeros(input_count + gate_count, dtype=np.int64)
+    x_ids[input_count:] = np.where(is_eq, 0, wire_map[np.where(is_eq, 0, a_ids)])
+    y_ids[input_count:] = np.where(is_eq, 0, wire_map[np.where(is_eq, 0, b_ids)])
 
-    keys: List[bytes]
-    """The list of keys for the outputs of this wire."""
+    # truth tables, where bit `2 * x + y` holds the output for inputs `x` and `y`
+    gate_tables = np.where(is_eq & (a_ids == 1), 0b1111, 0).astype(np.uint8)
+    for kind, table in {GATE_XOR: 0b0110, GATE_AND: 0b1000, GATE_INV: 0b0011, GATE_EQW: 0b1100, GATE_OR: 0b1110}.items():
+        gate_tables[kinds == kind] = table
+    tables = np.concatenate([np.zeros(input_count, dtype=np.uint8), gate_tables])
+
+    output_ids = wire_map[circuit.output_wires()]
+    outputs = np.zeros(input_count + gate_count, dtype=np.uint8)
+    outputs[output_ids] = 1
+
+    compiled = CompiledCircuit(array("B", ops.tobytes()), array("q", x_ids.tobytes()), array("q", y_ids.tobytes()),
+                               bytearray(tables.tobytes()), bytearray(np.packbits(outputs, bitorder="little").tobytes()))
+
+    return compiled, output_ids.tolist()
 
 
 class Alice:
     """Alice, the client who garbles the circuit."""
 
-    def __init__(self, circuit: List[Wire], inputs: Dict[int, bool]):
-        """Initializes Alice with knowledge of the [circuit] and her own private [inputs]."""
+    def __init__(self, circuit: List[Wire] | CompiledCircuit, inputs: Dict[int, bool]):
+        """Initializes Alice with knowledge of the [circuit] (either as a list of wires or already compiled) and her own
+        private [inputs]."""
         
 
         self.circuit = circuit
         self.inputs = inputs
 
+        if type(circuit) == CompiledCircuit:
+            self.compiled = circuit
+        else:
+            self.compiled = compile_circuit(circuit)
+
+        self.metrics = RunMetrics()
+        """Where Alice records her messages and encryptions; [run_garbled_circuit] gives Alice and Bob the
+        [RunMetrics] of the run"""
+
     def generate_wire_keys(self):
         """Generates a pair of keys for each wire in the circuit, one representing `True` and the other representing
-        `False`."""
+        `False`. The keys are random 16-byte labels whose select bits (their lowest bits) differ."""
         
 
-        self.keys = {}
+        wire_count = len(self.compiled)
+        labels = np.frombuffer(os.urandom(2 * LABEL_SIZE * wire_count), dtype=np.uint8)
+        labels = labels.reshape(wire_count, 2, LABEL_SIZE).copy()
+        labels[:, 1, 0] = labels[:, 1, 0] & 0xFE | ~labels[:, 0, 0] & 1
 
-        for wire_index in range(len(self.circuit)):
-            key_0 = Fernet.generate_key()
-            key_1 = Fernet.generate_key()
+        self.labels = labels
+        """The keys of all wires as one array, indexed by wire ID and bit, for garbling all gates at once"""
 
-            self.keys[wire_index] = [key_0, key_1]
+        data = labels.tobytes()
+        self.keys = {}
+
+        for wire_index in range(wire_count):
+            offset = 2 * LABEL_SIZE * wire_index
+            self.keys[wire_index] = [data[offset:offset + LABEL_SIZE],
+                                     data[offset + LABEL_SIZE:offset + 2 * LABEL_SIZE]]
 
 
 
     def generate_garbled_circuit(self):
         """Generates the garbled circuit. In a garbled circuit, the [InputWire]s are the same, but each [GateWire] is
-        replaced by a [GarbledGateWire]."""
+        replaced by its garbled table, which is stored in [garbled_table] rather than in the circuit itself. Row
+        `2 * s_x + s_y` of a table encrypts the output key under the input keys with select bits `s_x` and `s_y`. All
+        rows of all gates are hashed with a single call to the fixed-key AES permutation."""
         
 
-        # enc_output = 0
-
-        # for wire in self.circuit:
-        #     if wire == GateWire:
-        #         enc_output = self.keys[wire][0].encrypt()
-        #         enc_output.
-
         # wire_index -> garbled table (list of encrypted Zs)
         self.garbled_table = {}
 
-        for wire_index, wire in enumerate(self.circuit):
-            if type(wire) == GateWire:
-                # GateWire(is_output=False, input_x_id=0, input_y_id=1, gate=gates["or"]),  # 4
-
-                self.garbled_table[wire_index] = []
-
-                # take the input keys
-                input_keys_x = []
-                input_keys_y = []
-                # input_keys_x.append(Fernet(self.keys[wire_x][0]))
-                # input_keys_x.append(Fernet(self.keys[wire_x][1]))
-                # input_keys_y.append(Fernet(self.keys[wire_y][0]))
-                # input_keys_y.append(Fernet(self.keys[wire_y][1]))
-                input_keys_x.append(self.keys[wire.input_x_id][0])
-                input_keys_x.append(self.keys[wire.input_x_id][1])
-                input_keys_y.append(self.keys[wire.input_y_id][0])
-                input_keys_y.append(self.keys[wire.input_y_id][1])
-
-                # for i in range(2):
-                for i in range(1, -1, -1):
-                    # for j in range(2):
-                    for j in range(1, -1, -1):
-                        # garbled_table.append(input_keys_x[i].encrypt(input_keys_y[j].encrypt(wire.gate(i, j).to_bytes(1, 'big'))))
-                        # wire_output_bytes = wire.gate(i, j).to_bytes(1, 'big')
-                        output_key = self.keys[wire_index][wire.gate(i, j)] 
-                        # self.garbled_table[wire_index] = Fernet(input_keys_x[i]).encrypt(Fernet(input_keys_y[j]).encrypt(wire_output_bytes))
-                        self.garbled_table[wire_index].append(Fernet(input_keys_x[i]).encrypt(Fernet(input_keys_y[j]).encrypt(output_key)))
-                        global COUNT_AES_Encrypt
-                        COUNT_AES_Encrypt += 2
-
-                self.circuit[wire_index] = GarbledGateWire(wire.is_output, wire.input_x_id, wire.input_y_id, self.garbled_table[wire_index])
+        gate_ids = np.flatnonzero(np.frombuffer(self.compiled.ops, dtype=np.uint8) == OP_GATE)
+        x_ids = np.frombuffer(self.compiled.x_ids, dtype=np.int64)[gate_ids]
+        y_ids = np.frombuffer(self.compiled.y_ids, dtype=np.int64)[gate_ids]
+        tables = np.frombuffer(self.compiled.tables, dtype=np.uint8)[gate_ids]
+        gate_count = len(gate_ids)
+
+        labels = self.labels.view("<u8")
+        select = self.labels[:, :, 0] & 1
+        tweaks = np.zeros((gate_count, 2), dtype="<u8")
+        tweaks[:, 0] = gate_ids
+
+        # the hash input K of every row, for the inputs (x, y) = (0, 0), (0, 1), (1, 0) and (1, 1)
+        hash_inputs = np.stack([double_labels(labels[x_ids, x]) ^ double_labels(double_labels(labels[y_ids, y]))
+                                ^ tweaks for x in range(2) for y in range(2)])
+        permuted = np.frombuffer(FIXED_KEY_CIPHER.encryptor().update(hash_inputs.tobytes()), dtype="<u8")
+        permuted = permuted.reshape(hash_inputs.shape)
+
+        rows = np.empty((gate_count, 4, 2), dtype="<u8")
+        gates = np.arange(gate_count)
+
+        for x in range(2):
+            for y in range(2):
+                output_keys = labels[gate_ids, tables >> (2 * x + y) & 1]
+                rows[gates, 2 * select[x_ids, x] + select[y_ids, y]] = \
+                    permuted[2 * x + y] ^ hash_inputs[2 * x + y] ^ output_keys
+
+        data = rows.tobytes()
+        for gate_index, wire_index in enumerate(gate_ids.tolist()):
+            offset = 4 * LABEL_SIZE * gate_index
+            self.garbled_table[wire_index] = [data[offset + row * LABEL_SIZE:offset + (row + 1) * LABEL_SIZE]
+                                              for row in range(4)]
+
+        global COUNT_AES_Encrypt
+        COUNT_AES_Encrypt += 4 * gate_count
+        self.metrics.count("aes_encrypt", 4 * gate_count)
 
 
     def get_garbled_circuit(self, wire_id: int) -> List[bytes]:
         """Return the garbled table for the [wire_id]"""
         global MESSAGES_SENT_GC 
         MESSAGES_SENT_GC += 1
+        self.metrics.record_message("alice", sum(len(row) for row in self.garbled_table[wire_id]))
 
-        # return self.garbled_table[wire_id] 
-        return self.circuit[wire_id]
+        return self.garbled_table[wire_id]
 
     def get_alice_input_key(self, wire_id: int) -> bytes:
         """Returns the key corresponding to Alice's input at wire [wire_id]."""
         global MESSAGES_SENT_GC 
         MESSAGES_SENT_GC += 1
+        self.metrics.record_message("alice", len(self.keys[wire_id][0]))
 
         if self.inputs[wire_id] == True:
             return self.keys[wire_id][1] 
@@ -167,6 +317,8 @@ class Alice:
         COUNT_OT += 1
         global MESSAGES_SENT_GC 
         MESSAGES_SENT_GC += 1
+        self.metrics.count("ot")
+        self.metrics.record_message("alice", len(self.keys[wire_id][0]))
 
         # not sure
         return self.keys[wire_id][bobs_private_value]
@@ -179,6 +331,7 @@ class Alice:
          validate that this request is sensible, but may assume that Bob is honest-but-curious."""
         global MESSAGES_SENT_GC
         MESSAGES_SENT_GC += 1
+        self.metrics.record_message("bob", len(key))
 
         if self.keys[wire_id][0] == key:
             return False
@@ -198,6 +351,9 @@ class Bob:
         self.alice = alice
         self.inputs = inputs
 
+        self.metrics = alice.metrics
+        """Where Bob records his decryptions, shared with Alice"""
+
     def get_setup_info(self):
         """Retrieves the following information from Alice: the garbled circuit, Alice's input keys, and Bob's input
         keys."""
@@ -218,13 +374,18 @@ class Bob:
         self.input_keys = {}
 
         # for each wire (not sure)
-        for wire_index, wire in enumerate(self.alice.circuit):
-            if type(wire) == GarbledGateWire:
+        self.circuit = self.alice.compiled
+        ops = self.circuit.ops
+
+        for wire_index in range(len(ops)):
+            op = ops[wire_index]
+
+            if op == OP_GATE:
                 self.garbled_circuit[wire_index] = self.alice.get_garbled_circuit(wire_index)
 
             # if InputWire -> take the keys
-            if type(wire) == InputWire:
-                if wire.alice_is_owner:
+            if op != OP_GATE:
+                if op == OP_ALICE_INPUT:
                     # self.alice_keys[wire_index] = self.alice.inputs[wire_index]
                     # self.alice_keys[wire_index] = self.alice.get_alice_input_key(wire_index)
                     self.input_keys[wire_index] = self.alice.get_alice_input_key(wire_index)
@@ -234,27 +395,6 @@ class Bob:
                     # self.bob_keys[wire_index] = self.alice.keys[wire_index][self.inputs[wire_index]]
                     # self.bob_keys[wire_index] = self.alice.get_bob_input_key(wire_index, self.inputs[wire_index])
                     self.input_keys[wire_index] = self.alice.get_bob_input_key(wire_index, self.inputs[wire_index])
-                
-
-                
-
-                
-
-            # if GateWire -> take the garbled circuits
-            # elif type(self.alice.circuit[wire_index]) == GarbledGateWire:
-            #     self.alice.circuit[wire_index] = self.alice.get_garbled_circuit(wire_index)
-
-
-        # self.alice_keys = self.alice.keys
-
-        # self.keys = {}
-
-        # for wire_index in range(len(self.garbled_circuit)):
-        #     key_false = Fernet.generate_key()
-        #     key_true = Fernet.generate_key()
-
-        #     # notice -> index: Wire (not int)
-        #     self.keys[wire_index] = [key_false, key_true]
 
     def evaluate(self):
         """Evaluates the garbled circuit retrieved from Alice. At the end of this method, Bob knows exactly which output
@@ -264,44 +404,26 @@ class Bob:
         self.output_keys = {}
 
         # for wire_index, wire in enumerate(self.garbled_circuit):
-        for wire_index, wire in self.garbled_circuit.items():
+        x_ids, y_ids = self.circuit.x_ids, self.circuit.y_ids
+        aes = FIXED_KEY_CIPHER.encryptor()
 
-            # if type(self.garbled_circuit[wire_index]) == InputWire:
-            #     if self.garbled_circuit[wire_index].alice_is_owner == True:
-            #         self.alice_keys[wire_index] = self.alice.get_alice_input_key(wire_index)
-            #     else:
-            #         self.bob_keys[wire_index] = self.alice.get_bob_input_key(wire_index, self.inputs[wire_index])
+        for wire_index, table in self.garbled_circuit.items():
+            key_x = self.input_keys[x_ids[wire_index]]
+            key_y = self.input_keys[y_ids[wire_index]]
 
-            if type(wire) == GarbledGateWire:
+            # the select bits of the input keys point at the only row that Bob can decrypt
+            z_key = table[2 * (key_x[0] & 1) + (key_y[0] & 1)]
 
-                # self.output_keys[wire_index] = []
+            hash_input = double_label(int.from_bytes(key_x, "little")) ^ \
+                double_label(double_label(int.from_bytes(key_y, "little"))) ^ wire_index
+            output_key = int.from_bytes(aes.update(hash_input.to_bytes(LABEL_SIZE, "little")), "little") ^ \
+                hash_input ^ int.from_bytes(z_key, "little")
 
-                # for each key -> decrypt
-                # for index, key in enumerate(wire.keys):
-                for z_key in wire.keys:
-                    # print(type(key))
+            self.output_keys[wire_index] = self.input_keys[wire_index] = output_key.to_bytes(LABEL_SIZE, "little")
 
-                    # 1st attempt
-                    # self.output_keys[wire_index].append(Fernet(self.alice_keys[wire_index]).decrypt(Fernet(self.bob_keys[wire_index]).decrypt(z_key)))
-                    
-                    # 2nd attempt
-                    # decr_y = Fernet(self.bob_keys[wire.input_y_id]).decrypt(z_key)
-                    # decr_x = Fernet(self.alice_keys[wire.input_x_id]).decrypt(decr_y)
-                    # self.output_keys[wire_index].append(decr_x)
-                    
-                    global COUNT_AES_Decrypt
-                    COUNT_AES_Decrypt += 2
-
-                    # 3rd attempt
-                    try:
-                        decr_x = Fernet(self.input_keys[wire.input_x_id]).decrypt(z_key)
-                        decr_y = Fernet(self.input_keys[wire.input_y_id]).decrypt(decr_x)
-                        self.output_keys[wire_index] = decr_y 
-                        # print("Found the Z!", decr_y)
-                        self.input_keys[wire_index] = decr_y
-                        break
-                    except (InvalidToken, ValueError):
-                        pass
+        global COUNT_AES_Decrypt
+        COUNT_AES_Decrypt += len(self.garbled_circuit)
+        self.metrics.count("aes_decrypt", len(self.garbled_circuit))
 
 
     def retrieve_outputs(self) -> Dict[int, bool]:
@@ -311,33 +433,43 @@ class Bob:
         self.final_outputs = {}
 
         # for wire_index, wire in enumerate(self.garbled_circuit):
-        for wire_index, wire in self.garbled_circuit.items():
+        for wire_index in self.circuit.output_ids():
             # if type(self.garbled_circuit[wire_index]) != InputWire:
-            if wire.is_output:
+            if wire_index in self.garbled_circuit:
                 self.final_outputs[wire_index] = self.alice.get_output(wire_index, self.output_keys[wire_index])
 
         return self.final_outputs
 
 
-def run_garbled_circuit(alice: Alice, bob: Bob) -> Dict[int, bool]:
-    """Evaluates the garbled circuit through Alice and Bob and returns the outputs."""
+def run_garbled_circuit(alice: Alice, bob: Bob, return_metrics: bool = False) \
+        -> Dict[int, bool] | Tuple[Dict[int, bool], RunMetrics]:
+    """Evaluates the garbled circuit through Alice and Bob and returns the outputs. If [return_metrics] is `True`, the
+    [RunMetrics] of this run are returned along with the outputs; garbling is its preprocessing phase, and fetching the
+    setup info and the outputs are its two rounds."""
     
 
+    metrics = RunMetrics()
+    alice.metrics = bob.metrics = metrics
+
     # outputs = {}
 
     # print("Started, that's cool")
 
-    # print("Alice starts generating keys...")
-    alice.generate_wire_keys()
-    # print("Keys generated!")
-    # print(alice.keys)
+    with metrics.phase("preprocessing"):
+        # print("Alice starts generating keys...")
+        alice.generate_wire_keys()
+        # print("Keys generated!")
+        # print(alice.keys)
 
-    # print("Alice starts generating the garbled circuits...")
-    alice.generate_garbled_circuit()
-    # print("Garbled circuits generated!")
+        # print("Alice starts generating the garbled circuits...")
+        alice.generate_garbled_circuit()
+        # print("Garbled circuits generated!")
 
     # print("Bob retrieving the garbled circuits, Alice's input keys and Bob's input keys...")
-    bob.get_setup_info()
+    start = time.perf_counter()
+    with metrics.phase("setup"):
+        bob.get_setup_info()
+    metrics.record_round(time.perf_counter() - start)
     # print("He got them!")
     # print("Garbled circuit:", bob.garbled_circuit)
     # print("Alice keys:", bob.alice_keys)
@@ -348,7 +480,8 @@ def run_garbled_circuit(alice: Alice, bob: Bob) -> Dict[int, bool]:
     #         bob.alice.get_alice_input_key(wire_index)
     
     # print("Bob is evaluating...")
-    bob.evaluate()
+    with metrics.phase("online"):
+        bob.evaluate()
     # print("Bob has learnt the output keys! He still doesn't know which output they represent tho..")
     # print(bob.output_keys)
 
@@ -357,143 +490,37 @@ def run_garbled_circuit(alice: Alice, bob: Bob) -> Dict[int, bool]:
     # outputs = bob.retrieve_outputs()
 
     # print("Bob got the outputs!")
-    return bob.retrieve_outputs()
+    start = time.perf_counter()
+    with metrics.phase("output"):
+        outputs = bob.retrieve_outputs()
+    metrics.record_round(time.perf_counter() - start)
+
+    if return_metrics:
+        return outputs, metrics
+
+    return outputs
 
 
 
 def main():
-    gates = {
-        "and": lambda x, y: x and y,
-        "or": lambda x, y: x or y,
-        "xor": lambda x, y: x != y,
-        "if": lambda x, y: x <= y,
-        "iff": lambda x, y: x == y,
-        "not-x": lambda x, y: not x,
-        "not-y": lambda x, y: not y,
-    }
-
-    circuits = {
-        "basic": [
-            InputWire(is_output=False, alice_is_owner=True),  # 0
-            InputWire(is_output=False, alice_is_owner=True),  # 1
-            InputWire(is_output=False, alice_is_owner=False),  # 2
-            InputWire(is_output=False, alice_is_owner=False),  # 3
-            GateWire(is_output=False, input_x_id=0, input_y_id=1, gate=gates["or"]),  # 4
-            GateWire(is_output=False, input_x_id=2, input_y_id=3, gate=gates["or"]),  # 5
-            GateWire(is_output=True, input_x_id=4, input_y_id=5, gate=gates["and"]),  # 6
-        ],
-        "deep": [
-            InputWire(is_output=False, alice_is_owner=True),  # 0
-            InputWire(is_output=False, alice_is_owner=True),  # 1
-            InputWire(is_output=False, alice_is_owner=False),  # 2
-            InputWire(is_output=False, alice_is_owner=False),  # 3
-            GateWire(is_output=False, input_x_id=0, input_y_id=1, gate=gates["or"]),  # 4
-            GateWire(is_output=False, input_x_id=4, input_y_id=2, gate=gates["and"]),  # 5
-            GateWire(is_output=False, input_x_id=1, input_y_id=5, gate=gates["xor"]),  # 6
-            GateWire(is_output=False, input_x_id=6, input_y_id=0, gate=gates["not-x"]),  # 7
-            GateWire(is_output=False, input_x_id=2, input_y_id=7, gate=gates["or"]),  # 8
-            GateWire(is_output=False, input_x_id=7, input_y_id=8, gate=gates["if"]),  # 9
-            GateWire(is_output=False, input_x_id=4, input_y_id=9, gate=gates["and"]),  # 10
-            GateWire(is_output=True, input_x_id=3, input_y_id=10, gate=gates["iff"]),  # 11
-        ],
-        "wide": [
-            InputWire(is_output=False, alice_is_owner=True),  # 0
-            InputWire(is_output=False, alice_is_owner=True),  # 1
-            InputWire(is_output=False, alice_is_owner=True),  # 2
-            InputWire(is_output=False, alice_is_owner=True),  # 3
-            InputWire(is_output=False, alice_is_owner=True),  # 4
-            InputWire(is_output=False, alice_is_owner=True),  # 5
-            InputWire(is_output=False, alice_is_owner=False),  # 6
-            InputWire(is_output=False, alice_is_owner=False),  # 7
-            InputWire(is_output=False, alice_is_owner=False),  # 8
-            InputWire(is_output=False, alice_is_owner=False),  # 9
-            InputWire(is_output=False, alice_is_owner=False),  # 10
-            InputWire(is_output=False, alice_is_owner=False),  # 11
-            GateWire(is_output=False, input_x_id=0, input_y_id=6, gate=gates["or"]),  # 12
-            GateWire(is_output=False, input_x_id=1, input_y_id=7, gate=gates["or"]),  # 13
-            GateWire(is_output=False, input_x_id=2, input_y_id=8, gate=gates["or"]),  # 14
-            GateWire(is_output=False, input_x_id=3, input_y_id=9, gate=gates["or"]),  # 15
-            GateWire(is_output=False, input_x_id=4, input_y_id=10, gate=gates["or"]),  # 16
-            GateWire(is_output=False, input_x_id=5, input_y_id=11, gate=gates["or"]),  # 17
-            GateWire(is_output=True, input_x_id=12, input_y_id=15, gate=gates["and"]),  # 18
-            GateWire(is_output=True, input_x_id=13, input_y_id=16, gate=gates["and"]),  # 19
-            GateWire(is_output=True, input_x_id=14, input_y_id=17, gate=gates["and"]),  # 20
-        ],
-        "adder": [
-            # Alice's input
-            InputWire(is_output=False, alice_is_owner=True),  # 0
-            InputWire(is_output=False, alice_is_owner=True),  # 1
-            InputWire(is_output=False, alice_is_owner=True),  # 2
-            InputWire(is_output=False, alice_is_owner=True),  # 3
-            # Bob's input
-            InputWire(is_output=False, alice_is_owner=False),  # 4
-            InputWire(is_output=False, alice_is_owner=False),  # 5
-            InputWire(is_output=False, alice_is_owner=False),  # 6
-            InputWire(is_output=False, alice_is_owner=False),  # 7
-            # Half adder 1
-            GateWire(is_output=True, input_x_id=0, input_y_id=4, gate=gates["xor"]),  # 8
-            GateWire(is_output=False, input_x_id=0, input_y_id=4, gate=gates["and"]),  # 9
-            # Full adder 2
-            GateWire(is_output=False, input_x_id=1, input_y_id=5, gate=gates["xor"]),  # 10
-            GateWire(is_output=True, input_x_id=10, input_y_id=9, gate=gates["xor"]),  # 11
-            GateWire(is_output=False, input_x_id=1, input_y_id=5, gate=gates["and"]),  # 12
-            GateWire(is_output=False, input_x_id=9, input_y_id=10, gate=gates["and"]),  # 13
-            GateWire(is_output=False, input_x_id=12, input_y_id=13, gate=gates["or"]),  # 14
-            # Full adder 3
-            GateWire(is_output=False, input_x_id=2, input_y_id=6, gate=gates["xor"]),  # 15
-            GateWire(is_output=True, input_x_id=15, input_y_id=14, gate=gates["xor"]),  # 16
-            GateWire(is_output=False, input_x_id=2, input_y_id=6, gate=gates["and"]),  # 17
-            GateWire(is_output=False, input_x_id=14, input_y_id=15, gate=gates["and"]),  # 18
-            GateWire(is_output=False, input_x_id=17, input_y_id=18, gate=gates["or"]),  # 19
-            # Full adder 4
-            GateWire(is_output=False, input_x_id=3, input_y_id=7, gate=gates["xor"]),  # 20
-            GateWire(is_output=True, input_x_id=20, input_y_id=19, gate=gates["xor"]),  # 21
-            GateWire(is_output=False, input_x_id=3, input_y_id=7, gate=gates["and"]),  # 22
-            GateWire(is_output=False, input_x_id=19, input_y_id=20, gate=gates["and"]),  # 23
-            GateWire(is_output=True, input_x_id=22, input_y_id=23, gate=gates["or"]),  # 24
-        ],
-        "xors": [
-            InputWire(is_output=False, alice_is_owner=True),  # 0
-            InputWire(is_output=False, alice_is_owner=True),  # 1
-            InputWire(is_output=False, alice_is_owner=True),  # 2
-            InputWire(is_output=False, alice_is_owner=False),  # 3
-            InputWire(is_output=False, alice_is_owner=False),  # 4
-            InputWire(is_output=False, alice_is_owner=False),  # 5
-            GateWire(is_output=False, input_x_id=0, input_y_id=3, gate=gates["xor"]),  # 6
-            GateWire(is_output=False, input_x_id=1, input_y_id=4, gate=gates["xor"]),  # 7
-            GateWire(is_output=False, input_x_id=2, input_y_id=5, gate=gates["xor"]),  # 8
-            GateWire(is_output=False, input_x_id=3, input_y_id=6, gate=gates["xor"]),  # 9
-            GateWire(is_output=False, input_x_id=4, input_y_id=7, gate=gates["xor"]),  # 10
-            GateWire(is_output=False, input_x_id=5, input_y_id=8, gate=gates["xor"]),  # 11
-            GateWire(is_output=False, input_x_id=6, input_y_id=9, gate=gates["xor"]),  # 12
-            GateWire(is_output=False, input_x_id=7, input_y_id=10, gate=gates["xor"]),  # 13
-            GateWire(is_output=False, input_x_id=11, input_y_id=12, gate=gates["xor"]),  # 14
-            GateWire(is_output=True, input_x_id=14, input_y_id=13, gate=gates["xor"]),  # 15
-        ]
-    }
-
-    # ########################### testing testing ###########################
-    # circuit = circuits["basic"]
-    # wire4 = circuit[4]
-    # print(wire4.gate(1, 1)) # lambda function lol
-    # ########################### testing testing ###########################
-
-    # alice = Alice(circuits["deep"], {0: True, 1: False}) # basic, deep
-    # alice = Alice(circuits["wide"], {0: True, 1: False, 2: True, 3: False, 4: False, 5: False}) # wide
-    # alice = Alice(circuits["adder"], {0: True, 1: False, 2: True, 3: False}) # adder
-    alice = Alice(circuits["xors"], {0: True, 1: False, 2: True}) # xors
-    # bob = Bob(alice, {2: False, 3: True}) # basic, deep 
-    # bob = Bob(alice, {6: False, 7: True, 8: False, 9: False, 10: True, 11: False}) # wide
-    # bob = Bob(alice, {4: False, 5: True, 6: False, 7: False}) # adder
-    bob = Bob(alice, {3: False, 4: True, 5: False}) # xors
-
-
-    print(run_garbled_circuit(alice, bob))
+    from circuits import get_circuit
+
+    # the example circuits are registered in circuits.py: "basic", "deep", "wide", "adder" and "xors"
+    registered = get_circuit("gc", "xors")
+    alice_inputs, bob_inputs = registered.inputs
+
+    alice = Alice(registered.build(sys.modules[__name__]), alice_inputs)
+    bob = Bob(alice, bob_inputs)
+
+
+    outputs, metrics = run_garbled_circuit(alice, bob, return_metrics=True)
+    print(outputs)
 
     print("COUNT_AES_Encrypt:", COUNT_AES_Encrypt)
     print("COUNT_AES_Decrypt:", COUNT_AES_Decrypt)
     print("COUNT_OT:", COUNT_OT)
     print("MESSAGES_SENT_GC:", MESSAGES_SENT_GC)
+    print("metrics:", metrics.as_dict())
 
 
 if __name__ == "__main__":
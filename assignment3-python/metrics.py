@@ -0,0 +1,100 @@
+from __future__ import annotations
+
+import time
+from contextlib import contextmanager
+from dataclasses import dataclass, field
+from typing import Dict, List
+
+
+@dataclass
+class RunMetrics:
+    """Measurements of a single run of a protocol, as returned by [bgw.BGW.run_circuit] and [gc.run_garbled_circuit]
+    with `return_metrics=True`. Unlike the module-level counters, these belong to one run only, so runs can happen at
+    the same time. Recording is a few dictionary updates per message, phase or batch of operations, so it is always
+    on."""
+
+    phases: Dict[str, float] = field(default_factory=dict)
+    """phase -> wall-clock seconds spent in that phase (`"preprocessing"`, `"setup"`, `"online"` and `"output"`)"""
+
+    round_latencies: List[float] = field(default_factory=list)
+    """The wall-clock seconds that each round of interaction took, in order"""
+
+    messages_sent: Dict[int | str, int] = field(default_factory=dict)
+    """party -> the number of messages that party sent"""
+
+    bytes_sent: Dict[int | str, int] = field(default_factory=dict)
+    """party -> the number of payload bytes that party sent"""
+
+    operations: Dict[str, int] = field(default_factory=dict)
+    """operation -> how often it was performed, summed over all parties"""
+
+    stalls: Dict[str, float] = field(default_factory=dict)
+    """resource -> wall-clock seconds that parties spent waiting for it, e.g. `"triples"` for the triples of a
+    [bgw.TripleProducer] that were not generated yet"""
+
+    queue_depths: List[int] = field(default_factory=list)
+    """The number of batches of triples that were ready in the queue of a [bgw.TripleProducer] whenever a party asked
+    for triples, in order"""
+
+    @contextmanager
+    def phase(self, name: str):
+        """Adds the wall-clock time spent in the `with` block to phase [name]."""
+
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.phases[name] = self.phases.get(name, 0.0) + time.perf_counter() - start
+
+    def record_round(self, seconds: float):
+        """Records that a round of interaction took [seconds]."""
+
+        self.round_latencies.append(seconds)
+
+    def record_message(self, sender, size: int, count: int = 1):
+        """Records that party [sender] sent [count] messages of [size] bytes each."""
+
+        self.messages_sent[sender] = self.messages_sent.get(sender, 0) + count
+        self.bytes_sent[sender] = self.bytes_sent.get(sender, 0) + size * count
+
+    def record_stall(self, resource: str, seconds: float):
+        """Records that a party waited [seconds] for [resource]."""
+
+        self.stalls[resource] = self.stalls.get(resource, 0.0) + seconds
+
+    def record_queue_depth(self, depth: int):
+        """Records that [depth] batches of triples were ready when a party asked for triples."""
+
+        self.queue_depths.append(depth)
+
+    def count(self, operation: str, amount: int = 1):
+        """Records that [operation] was performed [amount] times."""
+
+        self.operations[operation] = self.operations.get(operation, 0) + amount
+
+    @property
+    def total_messages(self) -> int:
+        """The number of messages sent by all parties."""
+
+        return sum(self.messages_sent.values())
+
+    @property
+    def total_bytes(self) -> int:
+        """The number of payload bytes sent by all parties."""
+
+        return sum(self.bytes_sent.values())
+
+    def as_dict(self) -> dict:
+        """Returns these metrics as plain dictionaries and lists, e.g. to be written as JSON. Party IDs become
+        strings."""
+
+        return {
+            "phases": dict(self.phases),
+            "rounds": len(self.round_latencies),
+            "round_latencies": list(self.round_latencies),
+            "messages_sent": {str(party): count for party, count in self.messages_sent.items()},
+            "bytes_sent": {str(party): size for party, size in self.bytes_sent.items()},
+            "operations": dict(self.operations),
+            "stalls": dict(self.stalls),
+            "queue_depths": list(self.queue_depths),
+        }
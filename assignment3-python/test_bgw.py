@@ -0,0 +1,86 @@
+from __future__ import annotations
+
+from random import SystemRandom
+from typing import Dict, List
+
+import numpy as np
+import pytest
+
+from bench import evaluate_plain, layered_circuit
+from bgw import BGW, OP_INNER_PRODUCT, OP_MULT, TTP, Client, InnerProductWire, InputWire, MultWire, TripleStore, Wire
+
+# one modulo per dtype that shares are kept in: uint64, int64 and Python ints
+MODS = [1 << 64, 1009, (1 << 61) - 1]
+
+
+def run_with_triple_files(circuit: List[Wire], inputs: List[Dict[int, int]], mod: int, directory) \
+        -> Dict[int, int]:
+    """Runs the offline phase of the [circuit] with a [TTP], saves the triples to [directory], and runs the online phase
+    with a [TripleStore] per client. Returns the outputs as Python ints."""
+
+    compiled = BGW.compile_circuit(circuit)
+    ops = np.frombuffer(compiled.ops, dtype=np.uint8)
+    keys, _, _, sizes = BGW.mult_pairs(compiled, np.flatnonzero((ops == OP_MULT) | (ops == OP_INNER_PRODUCT)))
+
+    ttp = TTP(len(inputs), mod, SystemRandom())
+    ttp.preprocess(keys, sizes)
+    stores = [TripleStore(path) for path in ttp.save_triples(str(directory))]
+
+    clients = [Client(client_id, stores[client_id], compiled, inputs[client_id], mod, SystemRandom())
+               for client_id in range(len(inputs))]
+
+    return {wire_id: int(value) for wire_id, value in BGW.run_circuit(clients).items()}
+
+
+@pytest.mark.parametrize("mod", MODS)
+def test_triple_files_roundtrip(mod, tmp_path):
+    circuit, inputs = layered_circuit(16, 4, 0.5, 3)
+
+    assert run_with_triple_files(circuit, inputs, mod, tmp_path) == evaluate_plain(circuit, inputs, mod)
+
+
+@pytest.mark.parametrize("mod", MODS)
+def test_triple_files_with_mixed_layers(mod, tmp_path):
+    # the keys of inner products come after all wire IDs, so the triples of this layer are not stored in its order
+    circuit = [InputWire(False, 0), InputWire(False, 1), MultWire(False, 0, 1), InnerProductWire(True, [0, 1], [1, 0]),
+               MultWire(True, 0, 0), InnerProductWire(False, [0], [0])]
+
+    assert run_with_triple_files(circuit, [{0: 3}, {1: 5}, {}], mod, tmp_path) == {3: 30, 4: 9}
+
+
+@pytest.mark.parametrize("mod", MODS)
+def test_triple_files_with_mixed_random_layers(mod, tmp_path):
+    circuit, inputs = layered_circuit(16, 2, 0.5, 3)
+    previous = list(range(len(circuit) - 16, len(circuit)))
+
+    # a layer of multiplications and inner products of three pairs each, interleaved
+    for position in range(16):
+        if position % 3 == 0:
+            circuit.append(MultWire(True, previous[position], previous[-position - 1]))
+        else:
+            circuit.append(InnerProductWire(True, [previous[(position + k) % 16] for k in range(3)],
+                                            [previous[(5 * position + k) % 16] for k in range(3)]))
+
+    assert run_with_triple_files(circuit, inputs, mod, tmp_path) == evaluate_plain(circuit, inputs, mod)
+
+
+@pytest.mark.parametrize("mod", MODS)
+@pytest.mark.parametrize("king_party", [False, True])
+def test_batch_with_a_client_without_inputs(mod, king_party):
+    circuit = [InputWire(False, 0), InputWire(False, 1), MultWire(True, 0, 1)]
+    inputs = [{0: [3, 4]}, {1: [5, 6]}, {}]
+    ttp = TTP(3, mod, SystemRandom(), 2)
+    clients = [Client(client_id, ttp, circuit, inputs[client_id], mod, SystemRandom(), 2, king_party=king_party)
+               for client_id in range(3)]
+
+    outputs = BGW.run_circuit(clients)
+
+    assert {wire_id: [int(value) for value in values] for wire_id, values in outputs.items()} == {2: [15, 24]}
+
+
+def test_triple_files_refuse_moduli_above_64_bits(tmp_path):
+    ttp = TTP(3, (1 << 64) + 13, SystemRandom())
+    ttp.preprocess(np.array([3]))
+
+    with pytest.raises(ValueError):
+        ttp.save_triples(str(tmp_path))
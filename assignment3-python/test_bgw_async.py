@@ -0,0 +1,66 @@
+from __future__ import annotations
+
+import asyncio
+from random import SystemRandom
+
+import pytest
+
+import bgw_async
+from bench import evaluate_plain, layered_circuit
+from bgw import TTP, Client
+from bgw_async import Party
+
+
+def make_clients(mod: int = 1009):
+    circuit, inputs = layered_circuit(16, 3, 0.5, 3)
+    ttp = TTP(3, mod, SystemRandom())
+
+    return circuit, inputs, [Client(client_id, ttp, circuit, inputs[client_id], mod, SystemRandom())
+                             for client_id in range(3)]
+
+
+def run(clients, transport: str = "tcp"):
+    """Runs the [clients], failing the test instead of hanging if the parties wait forever."""
+
+    return asyncio.run(asyncio.wait_for(bgw_async.run_circuit_async(clients, transport), 30))
+
+
+@pytest.mark.parametrize("transport", ["tcp", "unix"])
+def test_run_circuit(transport):
+    circuit, inputs, clients = make_clients()
+
+    outputs = run(clients, transport)
+
+    assert {wire_id: int(value) for wire_id, value in outputs.items()} == evaluate_plain(circuit, inputs, 1009)
+
+
+def test_run_circuit_fails_on_a_bad_frame(monkeypatch):
+    on_input_shares = Party.on_input_shares
+
+    def reject(self, sender_id, payload):
+        if self.client_id == 0:
+            raise ValueError("bad frame")
+        on_input_shares(self, sender_id, payload)
+
+    monkeypatch.setattr(Party, "on_input_shares", reject)
+    _, _, clients = make_clients()
+
+    with pytest.raises(ValueError, match="bad frame"):
+        run(clients)
+
+
+def test_run_circuit_fails_if_a_peer_disconnects(monkeypatch):
+    party_run = Party.run
+
+    async def leave(self):
+        if self.client_id == 2:
+            for writer in self.writers.values():
+                writer.close()
+            return None
+        return await party_run(self)
+
+    monkeypatch.setattr(Party, "run", leave)
+    _, _, clients = make_clients()
+
+    with pytest.raises(ConnectionError):
+        run(clients)
@@ -0,0 +1,43 @@
+from __future__ import annotations
+
+import multiprocessing
+import os
+from random import SystemRandom
+
+import pytest
+
+import bgw_mp
+from bench import evaluate_plain, layered_circuit
+from bgw import TTP, Client
+
+
+def make_clients(mod: int = 1009):
+    circuit, inputs = layered_circuit(16, 3, 0.5, 3)
+    ttp = TTP(3, mod, SystemRandom())
+
+    return circuit, inputs, [Client(client_id, ttp, circuit, inputs[client_id], mod, SystemRandom())
+                             for client_id in range(3)]
+
+
+def test_run_circuit():
+    circuit, inputs, clients = make_clients()
+
+    outputs = bgw_mp.run_circuit(clients)
+
+    assert {wire_id: int(value) for wire_id, value in outputs.items()} == evaluate_plain(circuit, inputs, 1009)
+
+
+@pytest.mark.skipif(multiprocessing.get_start_method() != "fork", reason="the child must inherit the patched client")
+def test_run_circuit_fails_if_a_process_dies(monkeypatch):
+    interactive_setup = Client.interactive_setup
+
+    def die(self):
+        if self.client_id == 1:
+            os._exit(3)
+        return interactive_setup(self)
+
+    monkeypatch.setattr(Client, "interactive_setup", die)
+    _, _, clients = make_clients()
+
+    with pytest.raises(RuntimeError, match="Client 1 exited with code 3"):
+        bgw_mp.run_circuit(clients)
@@ -0,0 +1,36 @@
+from __future__ import annotations
+
+from random import SystemRandom
+
+import pytest
+
+from bench import evaluate_plain, layered_circuit
+from bgw import TTP
+from bgw_sessions import SessionManager
+
+
+@pytest.mark.parametrize("executor", ["thread", "process"])
+def test_sessions_match_plaintext(executor):
+    mod = (1 << 61) - 1
+    circuit, _ = layered_circuit(16, 4, 0.5, 3)
+    jobs = [(circuit, layered_circuit(16, 4, 0.5, 3, seed)[1]) for seed in range(8)]
+
+    with SessionManager(TTP(3, mod, SystemRandom()), 2, executor) as manager:
+        outputs = manager.run(jobs)
+
+    assert outputs == [evaluate_plain(job_circuit, inputs, mod) for job_circuit, inputs in jobs]
+
+
+def test_sessions_with_different_circuits_share_wire_ids():
+    mod = 1009
+    jobs = [layered_circuit(16, depth, 0.5, 3, depth) for depth in range(1, 5)]
+
+    with SessionManager(TTP(3, mod, SystemRandom()), 4, "thread") as manager:
+        outputs = manager.run(jobs, king_party=True)
+
+    assert outputs == [evaluate_plain(circuit, inputs, mod) for circuit, inputs in jobs]
+
+
+def test_unknown_executor():
+    with pytest.raises(ValueError):
+        SessionManager(TTP(3, 1009, SystemRandom()), executor="fiber")
@@ -0,0 +1,59 @@
+from __future__ import annotations
+
+from random import SystemRandom
+
+import pytest
+
+from bgw import BGW, TTP, Client
+from bristol import GATE_AND, GATE_INV, GATE_OR, GATE_XOR, decode_outputs, load_bristol
+
+# x xor y, x and y, x or y and not x, for one-bit values x and y
+GATES = [["2", "1", "0", "1", "2", "XOR"], ["2", "1", "0", "1", "3", "AND"], ["2", "1", "0", "1", "4", "OR"],
+         ["1", "1", "0", "5", "INV"]]
+
+
+def write_circuit(path, separator: str, newline: str = "\n") -> str:
+    lines = ["4 6", "2 1 1", "4 1 1 1 1", ""] + [separator.join(gate) for gate in GATES]
+    path.write_bytes(newline.join(lines).encode() + newline.encode())
+
+    return str(path)
+
+
+@pytest.mark.parametrize("separator, newline", [(" ", "\n"), ("\t", "\n"), ("  \t ", "\r\n")])
+def test_load_bristol_with_any_whitespace(separator, newline, tmp_path):
+    circuit = load_bristol(write_circuit(tmp_path / "gates.txt", separator, newline))
+
+    assert list(circuit.kinds) == [GATE_XOR, GATE_AND, GATE_OR, GATE_INV]
+    assert list(circuit.a_ids) == [0, 0, 0, 0]
+    assert list(circuit.b_ids) == [1, 1, 1, 0]
+    assert list(circuit.out_ids) == [2, 3, 4, 5]
+
+
+@pytest.mark.parametrize("x, y", [(0, 0), (0, 1), (1, 0), (1, 1)])
+def test_run_tab_separated_circuit(x, y, tmp_path):
+    circuit = load_bristol(write_circuit(tmp_path / "gates.txt", "\t"))
+    owners = [0, 1]
+    compiled, output_ids = BGW.from_bristol(circuit, 2, owners)
+    inputs = BGW.bristol_inputs(circuit, [x, y], 3, owners)
+    ttp = TTP(3, 2, SystemRandom())
+    clients = [Client(client_id, ttp, compiled, inputs[client_id], 2, SystemRandom()) for client_id in range(3)]
+
+    outputs = decode_outputs(circuit, output_ids, BGW.run_circuit(clients))
+
+    assert outputs == [x ^ y, x & y, x | y, 1 - x]
+
+
+def test_load_bristol_rejects_unsupported_gates(tmp_path):
+    path = tmp_path / "gates.txt"
+    path.write_text("1 3\n2 1 1\n1 1\n\n2\t1\t0\t1\t2\tNAND\n")
+
+    with pytest.raises(ValueError, match="unsupported gates NAND"):
+        load_bristol(str(path))
+
+
+def test_load_bristol_does_not_replace_parts_of_names(tmp_path):
+    path = tmp_path / "gates.txt"
+    path.write_text("1 3\n2 1 1\n1 1\n\n2 1 0 1 2 XORX\n")
+
+    with pytest.raises(ValueError, match="unsupported gates XORX"):
+        load_bristol(str(path))
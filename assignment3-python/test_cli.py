@@ -0,0 +1,19 @@
+from __future__ import annotations
+
+import json
+
+import pytest
+
+import cli
+
+
+@pytest.mark.parametrize("text, mod", [("1009", 1009), ("2^64", 1 << 64), ("2^61-1", (1 << 61) - 1),
+                                       ("2 ^ 64 + 13", (1 << 64) + 13)])
+def test_parse_mod(text, mod):
+    assert cli.parse_mod(text) == mod
+
+
+def test_bgw_with_mod(capsys):
+    cli.main(["bgw", "basic", "--mod", "2^61-1"])
+
+    assert json.loads(capsys.readouterr().out)["outputs"] == {"5": 252}